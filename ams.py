@@ -1,24 +1,117 @@
 """
 執行命令 `uv run ams.py --help`
+
+httpx、asyncio、rich 與連線相關的模組在第一次使用時才載入 (lazy_import),
+`--help` 與參數錯誤不必等待它們匯入; 各命令的啟動時間以 bench_startup.py 量測。
 """
 
+from __future__ import annotations
+
+import contextlib
 import csv
-from dataclasses import dataclass
+import importlib.util
+import json
+import random
+import re
+import sys
+import time
 from collections import Counter
-import httpx
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable
+
 import typer
-import hashlib
-import hmac
-from rich import print as rprint
+
+from ams_defaults import (
+    BACKUP_SUFFIX,
+    BULK_BATCH,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_EXPORT_FIELDS,
+    DEFAULT_SLACK,
+    DEFAULT_TTL,
+    EXPORT_FIELDS,
+    EXPORT_FORMATS,
+    MASTER_CSV,
+    PAGE_SIZE,
+    PROBE_TIMEOUT,
+    PROBE_TTL,
+    REGISTRY_DB,
+    RTSP_PORT,
+    STATS_DB,
+    STATS_INTERVAL,
+)
+from ams_ops import (
+    TYPE_ALIASES,
+    BulkOp,
+    BulkResult,
+    Profile,
+    Selector,
+    async_client,
+    delete_op,
+    execute_ops,
+    fetch_streams,
+    iter_list,
+    iter_streams,
+    lazy_import,
+    request_metrics,
+    run_op,
+    start_op,
+    stop_op,
+)
+from ams_place import (
+    PLACEMENT_GROUPS,
+    MasterSection,
+    Placement,
+    ServerLoad,
+    place,
+    read_assignment,
+    read_master,
+    server_load,
+    write_assignment,
+)
+
+
+asyncio = lazy_import("asyncio")
+httpx = lazy_import("httpx")
+rich = lazy_import("rich")
+rich_console = lazy_import("rich.console")
+rich_live = lazy_import("rich.live")
+rich_markup = lazy_import("rich.markup")
+rich_progress = lazy_import("rich.progress")
+rich_table = lazy_import("rich.table")
+ams_cache = lazy_import("ams_cache")
+ams_client = lazy_import("ams_client")
+ams_export = lazy_import("ams_export")
+ams_jobs = lazy_import("ams_jobs")
+ams_journal = lazy_import("ams_journal")
+ams_probe = lazy_import("ams_probe")
+ams_registry = lazy_import("ams_registry")
+ams_stats = lazy_import("ams_stats")
+
 
 app = typer.Typer()
 
 
-@dataclass
-class Profile:
-    api_url: str
-    streams_csv: str
-    origin_ip: str
+@app.callback()
+def main(
+    ctx: typer.Context,
+    metrics_out: Path | None = typer.Option(
+        None, "--metrics-out", envvar="AMS_METRICS_OUT",
+        help="執行結束後寫出請求統計: .json 為 JSON, 其他 (如 .prom) 為 Prometheus textfile",
+    ),
+    show_metrics: bool = typer.Option(True, "--metrics/--no-metrics", help="執行結束後印出每個端點的請求統計"),
+):
+    """AMS 串流管理工具"""
+
+    def finish():
+        if (metrics := request_metrics()) is None:
+            return
+        if show_metrics:
+            metrics.print_summary()
+        if metrics_out:
+            metrics.write(metrics_out, ctx.invoked_subcommand or "")
+
+    ctx.call_on_close(finish)
 
 
 profiles = dict(
@@ -65,11 +158,6 @@ profiles = dict(
 )
 
 
-def generate_stream_id(name: str, secret_key: str = "ams") -> str:
-    h = hmac.new(secret_key.encode(), name.encode(), hashlib.md5)
-    return f"{name}{h.hexdigest()}"
-
-
 def print_result(success: bool, msg: str = ""):
     """印出成功或失敗訊息"""
     if success:
@@ -78,28 +166,307 @@ def print_result(success: bool, msg: str = ""):
         print(typer.style(f"failed: {msg}", fg=typer.colors.RED, bold=True))
 
 
-def check_result_response(resp: httpx.Response) -> tuple[bool, str]:
-    """檢查返回 Result 物件的 API 回應"""
-    if resp.status_code != 200:
-        return False, f"HTTP {resp.status_code}"
-    data = resp.json()
-    if data.get("success"):
-        return True, ""
-    return False, data.get("message", "Unknown error")
+@dataclass
+class ProfileReport:
+    """單一伺服器的批量操作結果"""
+    name: str
+    results: list[BulkResult] = field(default_factory=list)
+    error: str = ""
+    elapsed: float = 0.0
 
+    @property
+    def failed(self) -> list[BulkResult]:
+        return [r for r in self.results if not r.success]
+
+
+# 依 profile 與伺服器上的串流 (邊下載邊產生) 產生要執行的操作
+BuildOps = Callable[[Profile, AsyncIterator[dict]], AsyncIterator[BulkOp]]
+
+
+BULK_IN_FLIGHT = 2  # 同時進行的批次刪除請求數
+
+
+async def _run_bulk_delete(client: ams_client.AsyncAMSClient, stream_ids: list[str]) -> tuple[bool, bool]:
+    """(是否全部刪除成功, 伺服器是否有批次端點)"""
+    try:
+        resp = await client.bulk_delete(stream_ids)
+        success, _ = ams_client.check_result_response(resp)
+    except (httpx.RequestError, ValueError):
+        return False, True
+    if metrics := request_metrics():
+        metrics.outcome(resp.request, success)
+    return success, resp.status_code not in (404, 405)
+
+
+async def execute_batched(
+    client: ams_client.AsyncAMSClient,
+    ops: AsyncIterable[BulkOp],
+    concurrency: int,
+    batch_size: int,
+    results: list[BulkResult],
+    on_start: Callable[[BulkOp], None] = lambda op: None,
+    on_done: Callable[[BulkOp, BulkResult], None] = lambda op, result: None,
+):
+    """與 execute_ops 相同, 但刪除每 batch_size 個合併成一個 DELETE /broadcasts/bulk
+
+    批次失敗 (部分串流不存在或刪除失敗、連線錯誤) 時該批改為逐一刪除, 已被批次刪除的串流 (404) 視為成功;
+    伺服器沒有批次端點 (404/405) 時, 之後的刪除都逐一進行。其他操作照常逐一執行。
+    每個串流各自有一筆結果, on_done 也對每個串流呼叫; 結果依請求 (批次或單一操作) 送出的順序附加。
+    """
+    items = asyncio.Semaphore(concurrency)
+    batches = asyncio.Semaphore(BULK_IN_FLIGHT)
+    tasks: list[asyncio.Task] = []
+    chunk: list[BulkOp] = []
+    bulk = True
+
+    async def run_one(op: BulkOp) -> list[BulkResult]:
+        try:
+            result = await run_op(client, op)
+        finally:
+            items.release()
+        on_done(op, result)
+        return [result]
+
+    async def run_batch(batch: list[BulkOp]) -> list[BulkResult]:
+        nonlocal bulk
+        try:
+            success = False
+            if bulk:
+                success, bulk = await _run_bulk_delete(client, [op.stream_id for op in batch])
+        finally:
+            batches.release()
+        if success:
+            done = [BulkResult(op.stream_id, True) for op in batch]
+            for op, result in zip(batch, done):
+                on_done(op, result)
+            return done
+        fallback = []
+        for op in batch:
+            await items.acquire()
+            fallback.append(asyncio.create_task(run_one(replace(op, check=ams_client.check_deleted_response))))
+        return [result for done in await asyncio.gather(*fallback) for result in done]
+
+    async def submit_chunk():
+        await batches.acquire()
+        tasks.append(asyncio.create_task(run_batch(chunk.copy())))
+        chunk.clear()
+
+    try:
+        async for op in ops:
+            if bulk and op.action == "delete":
+                chunk.append(op)
+                on_start(op)
+                if len(chunk) >= batch_size:
+                    await submit_chunk()
+            else:
+                await items.acquire()
+                tasks.append(asyncio.create_task(run_one(op)))
+                on_start(op)
+    finally:
+        if chunk:
+            await submit_chunk()
+        results.extend(result for done in await asyncio.gather(*tasks) for result in done)
+
+
+async def server_version(client: ams_client.AsyncAMSClient, cache: ams_cache.InventoryCache) -> dict | None:
+    """/version 的回應; query 取得過的在 VERSION_TTL 內直接使用本機快取"""
+    if (info := cache.server_version()) is None and (info := await client.version()) is not None:
+        cache.store_version(info)
+    return info
+
+
+async def settle_unknown(
+    client: httpx.AsyncClient, journal: ams_journal.Journal, name: str, ops: list[BulkOp]
+) -> list[BulkOp]:
+    """送出後結果未知 (程式中斷) 的建立/刪除先查詢串流是否存在, 已經生效的記為成功, 不再送出"""
+    unknown = journal.unknown(name)
+
+    async def settled(op: BulkOp) -> bool:
+        if op.stream_id not in unknown or op.action not in ("create", "delete"):
+            return False
+        try:
+            resp = await client.get(f"/broadcasts/{op.stream_id}")
+        except httpx.RequestError:
+            return False
+        return resp.status_code == (200 if op.action == "create" else 404)
+
+    remaining = []
+    for op, done in zip(ops, await asyncio.gather(*(settled(op) for op in ops))):
+        if done:
+            journal.record_result(name, op.stream_id, True, "已生效 (查詢確認)")
+        else:
+            remaining.append(op)
+    return remaining
+
+
+def bulk_progress() -> rich_progress.Progress:
+    return rich_progress.Progress(
+        rich_progress.SpinnerColumn(),
+        rich_progress.TextColumn("{task.description}"),
+        rich_progress.BarColumn(),
+        rich_progress.MofNCompleteColumn(),
+        rich_progress.TextColumn("[red]失敗 {task.fields[failed]}"),
+        rich_progress.TimeElapsedColumn(),
+    )
+
+
+async def execute_bulk(
+    selected: dict[str, Profile],
+    build_ops: BuildOps,
+    description: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    until_empty: bool = False,
+    ttl: float = DEFAULT_TTL,
+    refresh: bool = False,
+    selector: Selector | None = None,
+    journal: ams_journal.Journal | None = None,
+    batch_size: int = 0,
+    progress: rich_progress.Progress | None = None,
+) -> list[ProfileReport]:
+    """對多台伺服器同時執行批量操作
+
+    每台伺服器各自擁有連線池與 concurrency 額度, 總耗時由最慢的一台決定。
+    操作在第一頁串流列表到達時就開始執行。until_empty 用於會移除串流的操作 (例如刪除):
+    翻頁期間的刪除會讓後面的 offset 位移而漏掉串流, 因此會重新向伺服器列表, 直到不再出現新的串流為止。
+    串流列表在 ttl 內會從本機快取取得, 成功的操作也會寫回快取。selector 限定要操作的串流。
+
+    有 journal 時每個操作都寫入日誌。繼續執行時, 已列表完畢的 profile 不再列表, 只重送日誌中尚未成功的操作;
+    其餘的 profile 重新向伺服器列表, 並略過日誌中已成功的串流。
+
+    batch_size 大於 1 且伺服器版本支援時, 刪除以 execute_batched 每 batch_size 個合併成一個請求。
+    progress 為同時執行的多個批量操作共用的進度顯示 (rich 同時只能有一個), 未指定時自行建立。
+    """
+    with contextlib.nullcontext(progress) if progress else bulk_progress() as progress:
+
+        async def run_profile(name: str, profile: Profile) -> ProfileReport:
+            report = ProfileReport(name)
+            listed = journal is not None and name in journal.listed
+            seen: set[str] = set()
+            if journal:
+                # 已列表完畢的 profile 只重送未成功的操作; 其餘重新列表並略過已成功的串流
+                seen = journal.recorded(name) if listed else set(journal.succeeded.get(name, ()))
+            done = len(seen & journal.succeeded.get(name, set())) if journal else 0
+            task = progress.add_task(f"{name} {description}", total=len(seen), completed=done, failed=0)
+            failed = 0
+
+            async def new_ops(refresh: bool) -> AsyncIterator[BulkOp]:
+                async for op in build_ops(profile, iter_streams(client, cache, ttl, refresh, selector)):
+                    if op.stream_id not in seen:
+                        seen.add(op.stream_id)
+                        yield op
+
+            def on_start(op: BulkOp):
+                if journal and op.stream_id not in journal.ops.get(name, {}):
+                    journal.record_op(name, op.action, op.stream_id, op.json)
+                progress.update(task, total=len(seen))
+
+            def on_done(op: BulkOp, result: BulkResult):
+                nonlocal failed
+                failed += not result.success
+                if result.success and op.apply:
+                    op.apply(cache)
+                if journal:
+                    journal.record_result(name, op.stream_id, result.success, result.msg)
+                progress.update(task, advance=1, failed=failed)
+
+            async def run_ops(ops: AsyncIterable[BulkOp]):
+                if bulk:
+                    await execute_batched(client, ops, concurrency, batch_size, report.results, on_start, on_done)
+                else:
+                    await execute_ops(client, ops, concurrency, report.results, on_start, on_done)
+
+            start = time.perf_counter()
+            with ams_cache.InventoryCache(name) as cache:
+                async with async_client(profile, concurrency) as client:
+                    bulk = batch_size > 1 and ams_client.supports_bulk_delete(await server_version(client, cache))
+                    try:
+                        if listed:
+                            replay = [op_from_record(r) for r in journal.pending(name)]
+                            remaining = await settle_unknown(client, journal, name, replay)
+                            progress.update(task, advance=len(replay) - len(remaining))
+                            await run_ops(iter_list(remaining))
+                        else:
+                            passes = 0
+                            while True:
+                                submitted = len(seen)
+                                # 繼續執行時快取中沒有中斷前最後一批操作的結果, 必須重新向伺服器列表
+                                ops = new_ops(refresh or passes > 0 or bool(journal and journal.resumed))
+                                await run_ops(ops)
+                                passes += 1
+                                if not until_empty or len(seen) == submitted:
+                                    break
+                            if journal:
+                                # 重新列表後沒有再產生的未完成操作已經生效 (例如中斷前已建立), 或已不需要
+                                for record in journal.pending(name):
+                                    if record["id"] not in seen:
+                                        journal.record_result(name, record["id"], True, "重新列表後不再需要")
+                                journal.mark_listed(name)
+                    except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                        report.error = f"無法獲取串流列表: {e}"
+            report.elapsed = time.perf_counter() - start
+            return report
+
+        return await asyncio.gather(*(run_profile(name, profile) for name, profile in selected.items()))
+
+
+def print_failures(reports: list[ProfileReport]):
+    for report in reports:
+        for r in report.failed:
+            print(f"[{report.name}] streamId {r.stream_id} ", end="")
+            print_result(False, r.msg)
 
-def check_broadcast_response(resp: httpx.Response) -> tuple[bool, str]:
-    """檢查返回 Broadcast 物件的 API 回應"""
-    if resp.status_code != 200:
-        return False, f"HTTP {resp.status_code}"
-    data = resp.json()
-    if data.get("streamId"):
-        return True, ""
-    return False, data.get("message", "Unknown error")
+
+def print_reports(reports: list[ProfileReport]):
+    """印出失敗項目與每台伺服器的彙總"""
+    print_failures(reports)
+    table = rich_table.Table("profile", "總數", "成功", "失敗", "耗時")
+    for report in reports:
+        if report.error:
+            table.add_row(report.name, "-", "-", "-", f"[red]{report.error}")
+            continue
+        failed = len(report.failed)
+        table.add_row(
+            report.name, str(len(report.results)), f"[green]{len(report.results) - failed}",
+            f"[red]{failed}" if failed else "0", f"{report.elapsed:.1f}s",
+        )
+    rich.print(table)
+
+
+def run_bulk(
+    selected: dict[str, Profile],
+    build_ops: BuildOps,
+    description: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    until_empty: bool = False,
+    ttl: float = DEFAULT_TTL,
+    refresh: bool = False,
+    selector: Selector | None = None,
+    journal: ams_journal.Journal | None = None,
+    batch_size: int = 0,
+) -> list[ProfileReport]:
+    """執行批量操作並印出結果; 中斷或有失敗時日誌會保留, 並提示以 --resume 繼續"""
+    if journal:
+        params = {"description": description, "selector": str(selector or Selector())}
+        if journal.resumed and journal.params != params:
+            print(typer.style(f"注意: 日誌記錄的參數為 {journal.params}, 與這次執行不同", fg=typer.colors.YELLOW))
+        journal.begin(list(selected), **params)
+    try:
+        reports = asyncio.run(
+            execute_bulk(
+                selected, build_ops, description, concurrency, until_empty, ttl, refresh, selector, journal, batch_size
+            )
+        )
+    finally:
+        if journal:
+            journal.close()
+            if journal.path.exists():
+                print(f"尚有未完成的項目, 以相同的命令加上 --resume {journal.path} 繼續")
+    print_reports(reports)
+    return reports
 
 
 def select_profile() -> Profile:
-    rprint("Profiles:", list(profiles.keys()))
+    rich.print("Profiles:", list(profiles.keys()))
     while True:
         selected = typer.prompt("使用profile").strip()
         if profile := profiles.get(selected):
@@ -107,216 +474,2149 @@ def select_profile() -> Profile:
         print(f"Profile '{selected}' not found.")
 
     print(f"--- profile: {selected} ---")
-    rprint(profile.__dict__)
+    rich.print(profile.__dict__)
     print("---")
     typer.confirm("請確認以上資料正確無誤, 確認執行?", abort=True)
     return profile
 
 
-def get_client_and_streams(profile: Profile) -> tuple[httpx.Client, list[dict]]:
-    """取得 HTTP client 和所有串流列表 (支援分頁)"""
-    client = httpx.Client(base_url=profile.api_url, timeout=60)
+def select_profiles(spec: str | None, confirm: bool = True) -> dict[str, Profile]:
+    """依 --profiles 選擇多個 profile (逗號分隔或 all), 未指定時互動選擇單一 profile"""
+    if spec is None:
+        profile = select_profile()
+        return {name: p for name, p in profiles.items() if p is profile}
+
+    names = list(profiles) if spec.strip() == "all" else [n.strip() for n in spec.split(",") if n.strip()]
+    if unknown := [n for n in names if n not in profiles]:
+        raise typer.BadParameter(f"Profile not found: {', '.join(unknown)}", param_hint="--profiles")
+
+    selected = {name: profiles[name] for name in names}
+    print(f"--- profiles: {', '.join(selected)} ---")
+    for name, profile in selected.items():
+        print(f"{name}: {profile.api_url}")
+    print("---")
+    if confirm:
+        typer.confirm("請確認以上資料正確無誤, 確認執行?", abort=True)
+    return selected
+
+
+def open_journal(command: str, resume: Path | None) -> ams_journal.Journal:
+    """新的批量操作日誌, 或 --resume 指定的既有日誌"""
+    if resume is None:
+        return ams_journal.Journal.create(command)
     try:
-        all_streams: list[dict] = []
-        offset = 0
-        size = 1000  # 每次獲取 1000 筆
-        while True:
-            resp = client.get(f"/broadcasts/list/{offset}/{size}")
-            resp.raise_for_status()  # 針對 4xx/5xx 回應拋出例外
-            batch = resp.json()
-            if not batch:
-                break
-            all_streams.extend(batch)
-            if len(batch) < size:
-                break
-            offset += size
-        return client, all_streams
-    except (httpx.HTTPStatusError, httpx.RequestError) as e:
-        print(typer.style(f"無法獲取串流列表: {e}", fg=typer.colors.RED, bold=True))
-        raise typer.Exit(1)
+        journal = ams_journal.Journal.load(resume, command)
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e), param_hint="--resume")
+    pending = sum(len(journal.pending(p)) for p in journal.profiles)
+    unlisted = [p for p in journal.profiles if p not in journal.listed]
+    print(f"--- 繼續 {resume}: 尚未成功 {pending} 筆", end="")
+    print(f", 需重新列表: {', '.join(unlisted)} ---" if unlisted else " ---")
+    return journal
 
 
-@app.command()
-def create_streams(
-    stream_type: str = typer.Option(
-        "ipcam", "--type",
-        help="串流類型: 'ipcam' (IP Camera) 或 'source' (RTSP 串流源)"
+def journal_profiles(profiles_spec: str | None, journal: ams_journal.Journal) -> str | None:
+    """繼續執行且未指定 --profiles 時沿用日誌中的 profile"""
+    return profiles_spec or ",".join(journal.profiles) or None
+
+
+def resume_option():
+    return typer.Option(
+        None, "--resume", exists=True, dir_okay=False,
+        help="從中斷的批量操作日誌繼續, 只執行尚未成功的項目 (日誌路徑會在中斷或失敗時印出)",
     )
-):
-    """建立流 (ipcam: IP Camera 模式, source: RTSP 串流源模式)"""
+
+
+def profiles_option():
+    return typer.Option(None, "--profiles", "-p", help="以逗號分隔的 profile 名稱, 或 all 代表全部; 未指定時互動選擇")
+
+
+def concurrency_option():
+    return typer.Option(DEFAULT_CONCURRENCY, "--concurrency", "-c", min=1, help="每台伺服器同時進行的請求數")
+
+
+def ttl_option():
+    return typer.Option(DEFAULT_TTL, "--cache-ttl", min=0, help="串流列表本機快取的有效秒數")
+
+
+def refresh_option():
+    return typer.Option(False, "--refresh", help="忽略本機快取, 重新向伺服器取得串流列表")
+
+
+def prefix_option():
+    return typer.Option(None, "--prefix", help="只選擇 name 以此開頭的串流 (例如區域 A)")
+
+
+def regex_option():
+    return typer.Option(None, "--regex", help="只選擇 name 符合此正規表示式的串流")
+
+
+def status_option():
+    return typer.Option(None, "--status", help="只選擇這些狀態的串流, 以逗號分隔 (例如 finished,error)")
+
+
+def type_filter_option():
+    return typer.Option(None, "--type", help="只選擇這些類型的串流, 以逗號分隔 (ipcam/source 或 AMS 的類型名稱)")
+
+
+def codes_option():
+    return typer.Option(None, "--codes", help="只選擇此 CSV 的 code 欄位列出的串流")
+
+
+def build_selector(
+    prefix: str | None,
+    regex: str | None,
+    status: str | None,
+    stream_type: str | None,
+    codes: Path | None,
+    announce: bool = True,
+) -> Selector:
+    """由命令列選項建立 Selector, 有條件時 (announce) 印出供確認"""
+    selector = Selector(prefix=prefix or None)
+    if regex is not None:
+        try:
+            selector.regex = re.compile(regex)
+        except re.error as e:
+            raise typer.BadParameter(str(e), param_hint="--regex")
+    if status is not None:
+        selector.statuses = {v.strip() for v in status.split(",") if v.strip()}
+    if stream_type is not None:
+        selector.types = {TYPE_ALIASES.get(v.strip(), v.strip()) for v in stream_type.split(",") if v.strip()}
+    if codes is not None:
+        with open(codes, newline="") as f:
+            rows = list(csv.DictReader(f))
+        if rows and "code" not in rows[0]:
+            raise typer.BadParameter(f"{codes} 沒有 code 欄位", param_hint="--codes")
+        selector.codes = {row["code"] for row in rows} | {ams_client.generate_stream_id(row["code"]) for row in rows}
+    if selector and announce:
+        print(f"--- 選擇條件: {selector} ---")
+    return selector
+
+
+def build_payload(row: dict, profile: Profile, stream_type: str) -> dict:
+    """由 CSV 的一列產生建立串流用的 payload"""
+    payload = {
+        "streamId": ams_client.generate_stream_id(row["code"]),
+        "name": row["code"],
+        "description": row.get("description", ""),
+        "originAdress": row.get("originAdress", profile.origin_ip),
+        "webRTCViewerLimit": 10,
+        "metaData": row.get("metaData", ""),
+    }
+
+    if stream_type == "ipcam":
+        payload.update({
+            "type": "ipCamera",
+            "ipAddr": row["stream_ip"],
+            "username": row.get("stream_username", ""),
+            "password": row.get("stream_password", ""),
+        })
+    else:
+        if row["stream_ip"].lower().startswith("rtsp://"):
+            stream_url = row["stream_ip"]
+        else:
+            stream_url = (
+                f"rtsp://{row.get('stream_username', '')}:{row.get('stream_password', '')}"
+                f"@{row['stream_ip']}/cam/realmonitor?channel=1&subtype=0&unicast=true&proto=Onvif"
+            )
+        payload.update({"type": "streamSource", "streamUrl": stream_url})
+    return payload
+
+
+def read_payloads(profile: Profile, stream_type: str) -> list[dict]:
+    """讀取 profile 的 CSV 並產生所有 payload"""
+    with open(profile.streams_csv, newline="") as csvfile:
+        return [build_payload(row, profile, stream_type) for row in csv.DictReader(csvfile)]
+
+
+def create_op(payload: dict, auto_start: bool = True) -> BulkOp:
+    url = "/broadcasts/create?autoStart=true" if auto_start else "/broadcasts/create"
+    return BulkOp(
+        payload["streamId"], "POST", url, ams_client.check_broadcast_response, payload,
+        apply=lambda cache: cache.upsert({**payload, "status": "created"}), action="create",
+    )
+
+
+def stream_type_option():
+    return typer.Option("ipcam", "--type", help="串流類型: 'ipcam' (IP Camera) 或 'source' (RTSP 串流源)")
+
+
+def check_stream_type(stream_type: str):
     if stream_type not in ["ipcam", "source"]:
         raise typer.Exit(f"錯誤: --type 必須是 'ipcam' 或 'source'")
 
-    profile = select_profile()
-    client, streams = get_client_and_streams(profile)
-    existing_ids = {s["streamId"] for s in streams}
 
-    with open(profile.streams_csv, newline="") as csvfile:
-        for row in csv.DictReader(csvfile):
-            stream_id = generate_stream_id(row["code"])
+def preflight_option():
+    return typer.Option(True, "--preflight/--no-preflight", help="建立前先探測每台攝影機的 RTSP 埠")
+
+
+def skip_unreachable_option():
+    return typer.Option(
+        False, "--skip-unreachable",
+        help="不建立探測失敗的攝影機 (預設仍然建立, 只列出); 探測是從本機進行, 本機連不到的攝影機 AMS 不一定連不到",
+    )
+
+
+def rtsp_options_option():
+    return typer.Option(False, "--rtsp-options", help="連線後再送出 RTSP OPTIONS, 收到 RTSP 回應才算可連線")
+
+
+def rtsp_port_option():
+    return typer.Option(RTSP_PORT, "--rtsp-port", help="ipCamera 的 RTSP 埠 (streamSource 使用 streamUrl 中的埠)")
 
-            if stream_id in existing_ids:
-                print(f"streamId {stream_id} already exists, skipping...")
+
+def probe_timeout_option():
+    return typer.Option(PROBE_TIMEOUT, "--probe-timeout", min=0.1, help="每台攝影機探測的逾時秒數")
+
+
+def probe_ttl_option():
+    return typer.Option(PROBE_TTL, "--probe-ttl", min=0, help="探測結果快取的有效秒數 (0 為每次重新探測)")
+
+
+@dataclass
+class Unreachable:
+    profile: str
+    payload: dict
+    result: ams_probe.ProbeResult | None  # None 表示 payload 中沒有可探測的位址
+
+
+def print_unreachable(rows: list[Unreachable], created: bool):
+    table = rich_table.Table("profile", "name", "位址", "原因", title="仍然建立的無法連線攝影機" if created else "略過的無法連線攝影機")
+    for row in sorted(rows, key=lambda r: (r.profile, r.payload["name"])):
+        target = str(row.result) if row.result else row.payload.get("ipAddr") or row.payload.get("streamUrl", "")
+        reason = row.result.detail if row.result else "沒有可探測的位址"
+        cached = " (快取)" if row.result and row.result.cached else ""
+        table.add_row(row.profile, row.payload["name"], target, f"[red]{reason}[/]{cached}")
+    rich.print(table)
+    if created:
+        rich.print("[dim]探測是從本機進行; 確定 AMS 也連不到時, 可加上 --skip-unreachable 略過這些攝影機[/]")
+
+
+@app.command()
+def create_streams(
+    stream_type: str = stream_type_option(),
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = concurrency_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+    preflight: bool = preflight_option(),
+    skip_unreachable: bool = skip_unreachable_option(),
+    rtsp_options: bool = rtsp_options_option(),
+    rtsp_port: int = rtsp_port_option(),
+    probe_timeout: float = probe_timeout_option(),
+    probe_ttl: float = probe_ttl_option(),
+    resume: Path | None = resume_option(),
+):
+    """建立流 (ipcam: IP Camera 模式, source: RTSP 串流源模式)
+
+    預設先同時探測所有要建立的攝影機, 結束時列出連不上的 (仍然建立, 因為探測是從本機而不是 AMS 所在的網路進行);
+    加上 --skip-unreachable 則不把它們送給 AMS。
+    """
+    check_stream_type(stream_type)
+    journal = open_journal("create-streams", resume)
+    selected = select_profiles(journal_profiles(profiles_spec, journal))
+    names = {id(profile): name for name, profile in selected.items()}
+    unreachable: list[Unreachable] = []
+
+    async def build_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+        existing_ids = {s["streamId"] async for s in streams}
+        payloads = []
+        for payload in read_payloads(profile, stream_type):
+            if payload["streamId"] in existing_ids:
+                print(f"streamId {payload['streamId']} already exists, skipping...")
                 continue
+            payloads.append(payload)
+
+        if preflight:
+            targets = {p["streamId"]: ams_probe.rtsp_target(p, rtsp_port) for p in payloads}
+            results = await ams_probe.probe_all(
+                (t for t in targets.values() if t), timeout=probe_timeout, rtsp_options=rtsp_options, ttl=probe_ttl
+            )
+            reachable = []
+            for payload in payloads:
+                target = targets[payload["streamId"]]
+                result = results[target] if target else None
+                if result is None or not result.reachable:
+                    unreachable.append(Unreachable(names[id(profile)], payload, result))
+                    if skip_unreachable:
+                        continue
+                reachable.append(payload)
+            payloads = reachable
+
+        for payload in payloads:
+            yield create_op(payload)
+
+    run_bulk(selected, build_ops, f"creating ({stream_type})", concurrency, ttl=ttl, refresh=refresh, journal=journal)
+    if unreachable:
+        print_unreachable(unreachable, not skip_unreachable)
+
+
+def update_op(stream_id: str, fields: dict) -> BulkOp:
+    return BulkOp(
+        stream_id, "PUT", f"/broadcasts/{stream_id}", ams_client.check_result_response, fields,
+        apply=lambda cache: cache.update(stream_id, **fields), action="update",
+    )
 
-            # 建立 payload
-            payload = {
-                "streamId": stream_id,
-                "name": row["code"],
-                "description": row.get("description", ""),
-                "originAdress": row.get("originAdress", profile.origin_ip),
-                "webRTCViewerLimit": 10,
-                "metaData": row.get("metaData", ""),
-            }
-
-            if stream_type == "ipcam":
-                payload.update({
-                    "type": "ipCamera",
-                    "ipAddr": row["stream_ip"],
-                    "username": row.get("stream_username", ""),
-                    "password": row.get("stream_password", ""),
-                })
-            else:
-                if row["stream_ip"].lower().startswith("rtsp://"):
-                    stream_url = row["stream_ip"]
-                else:
-                    stream_url = (
-                        f"rtsp://{row.get('stream_username', '')}:{row.get('stream_password', '')}"
-                        f"@{row['stream_ip']}/cam/realmonitor?channel=1&subtype=0&unicast=true&proto=Onvif"
-                    )
-                payload.update({"type": "streamSource", "streamUrl": stream_url})
 
-            print(f"streamId {stream_id} (type={payload['type']}) creating...", end="")
-            resp = client.post("/broadcasts/create?autoStart=true", json=payload)
-            success, msg = check_broadcast_response(resp)
-            print_result(success, msg)
+# 日誌中的動作 → 由 (streamId, payload) 重建操作
+OP_BUILDERS: dict[str, Callable[[str, dict | None], BulkOp]] = {
+    "create": lambda stream_id, payload: create_op(payload),
+    "start": lambda stream_id, payload: start_op(stream_id),
+    "stop": lambda stream_id, payload: stop_op(stream_id),
+    "delete": lambda stream_id, payload: delete_op(stream_id),
+    "update": update_op,
+}
+
+
+def op_from_record(record: dict) -> BulkOp:
+    return OP_BUILDERS[record["a"]](record["id"], record["json"])
 
 
 @app.command()
-def start_all_streams():
-    """啟動所有串流"""
-    profile = select_profile()
-    client, streams = get_client_and_streams(profile)
+def start_all_streams(
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = concurrency_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+    prefix: str | None = prefix_option(),
+    regex: str | None = regex_option(),
+    status: str | None = status_option(),
+    stream_type: str | None = type_filter_option(),
+    codes: Path | None = codes_option(),
+    resume: Path | None = resume_option(),
+):
+    """啟動所有 (或符合條件的) 串流"""
+    selector = build_selector(prefix, regex, status, stream_type, codes)
+    journal = open_journal("start-all-streams", resume)
 
-    for stream in streams:
-        stream_id = stream["streamId"]
-        print(f"streamId {stream_id} starting...", end="")
-        resp = client.post(f"/broadcasts/{stream_id}/start")
-        success, msg = check_result_response(resp)
-        print_result(success, msg)
+    async def build_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+        async for s in streams:
+            yield start_op(s["streamId"])
+
+    run_bulk(
+        select_profiles(journal_profiles(profiles_spec, journal)), build_ops, "starting", concurrency,
+        ttl=ttl, refresh=refresh, selector=selector, journal=journal,
+    )
 
 
 @app.command()
-def stop_all_streams():
-    """停止所有串流"""
-    profile = select_profile()
-    client, streams = get_client_and_streams(profile)
+def stop_all_streams(
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = concurrency_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+    prefix: str | None = prefix_option(),
+    regex: str | None = regex_option(),
+    status: str | None = status_option(),
+    stream_type: str | None = type_filter_option(),
+    codes: Path | None = codes_option(),
+    resume: Path | None = resume_option(),
+):
+    """停止所有 (或符合條件的) 串流"""
+    selector = build_selector(prefix, regex, status, stream_type, codes)
+    journal = open_journal("stop-all-streams", resume)
+
+    async def build_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+        async for s in streams:
+            yield stop_op(s["streamId"])
 
-    for stream in streams:
-        stream_id = stream["streamId"]
-        print(f"streamId {stream_id} stopping...", end="")
-        resp = client.post(f"/broadcasts/{stream_id}/stop")
-        success, msg = check_result_response(resp)
-        print_result(success, msg)
+    run_bulk(
+        select_profiles(journal_profiles(profiles_spec, journal)), build_ops, "stopping", concurrency,
+        ttl=ttl, refresh=refresh, selector=selector, journal=journal,
+    )
 
 
 @app.command()
-def delete_all_streams():
-    """刪除所有串流"""
-    profile = select_profile()
-    client, streams = get_client_and_streams(profile)
+def delete_all_streams(
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = concurrency_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+    prefix: str | None = prefix_option(),
+    regex: str | None = regex_option(),
+    status: str | None = status_option(),
+    stream_type: str | None = type_filter_option(),
+    codes: Path | None = codes_option(),
+    resume: Path | None = resume_option(),
+    batch_size: int = typer.Option(
+        BULK_BATCH, "--batch-size", help="AMS 2.4 以上每個批次刪除請求包含的串流數, 0 為逐一刪除"
+    ),
+):
+    """刪除所有 (或符合條件的) 串流
 
-    for stream in streams:
-        stream_id = stream["streamId"]
-        print(f"streamId {stream_id} deleting...", end="")
-        resp = client.delete(f"/broadcasts/{stream_id}")
-        success, msg = check_broadcast_response(resp)
-        print_result(success, msg)
+    伺服器支援時以批次刪除, 清空一台伺服器只需要少數幾個請求; 批次失敗時改為逐一刪除。
+    """
+    selector = build_selector(prefix, regex, status, stream_type, codes)
+    journal = open_journal("delete-all-streams", resume)
+
+    async def build_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+        async for s in streams:
+            yield delete_op(s["streamId"])
+
+    run_bulk(
+        select_profiles(journal_profiles(profiles_spec, journal)), build_ops, "deleting", concurrency,
+        until_empty=True, ttl=ttl, refresh=refresh, selector=selector, journal=journal, batch_size=batch_size,
+    )
+
+
+EXPORT_QUEUE = 2 * PAGE_SIZE  # 各 profile 的列表與寫檔之間最多暫存的串流數
 
 
 @app.command()
-def query():
-    """查詢伺服器上的串流狀態"""
-    profile = select_profile()
-    client, streams = get_client_and_streams(profile)
+def export(
+    profiles_spec: str | None = profiles_option(),
+    output: Path = typer.Option(
+        Path("streams_export.csv"), "--output", "-o", help="輸出檔案, 格式依副檔名 (.csv/.ndjson/.parquet/.arrow)"
+    ),
+    fmt: str | None = typer.Option(None, "--format", help=f"輸出格式 ({'/'.join(EXPORT_FORMATS)}), 未指定時依副檔名"),
+    fields: str = typer.Option(
+        ",".join(DEFAULT_EXPORT_FIELDS), "--fields", help=f"以逗號分隔的欄位: {', '.join(EXPORT_FIELDS)}"
+    ),
+    natural_sort: bool = typer.Option(False, "--sort", help="依 name 自然排序 (A2 在 A10 之前), 串流很多時以暫存檔分段排序"),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+    prefix: str | None = prefix_option(),
+    regex: str | None = regex_option(),
+    status: str | None = status_option(),
+    stream_type: str | None = type_filter_option(),
+    codes: Path | None = codes_option(),
+):
+    """將 (符合條件的) 串流匯出為 CSV / NDJSON / Parquet / Arrow
 
-    try:
-        # 伺服器資訊
-        resp = client.get("/version")
-        if resp.status_code == 200:
-            v = resp.json()
-            print(f"\n版本: {v.get('versionName')} ({v.get('versionType')}) Build: {v.get('buildNumber')}")
-
-        # 統計
-        resp = client.get("/broadcasts/active-live-stream-count")
-        if resp.status_code == 200:
-            print(f"活躍直播: {resp.json().get('number', 0)} / 總計: {len(streams)}")
-    except httpx.RequestError as e:
-        print(typer.style(f"獲取伺服器資訊失敗: {e}", fg=typer.colors.YELLOW))
+    各 profile 同時逐頁列表, 串流一到就寫入檔案, 記憶體用量與串流數無關。
+    """
+    fmt = fmt or ams_export.format_for(output) or "csv"
+    if fmt not in EXPORT_FORMATS:
+        raise typer.BadParameter(f"不支援的格式: {fmt}", param_hint="--format")
+    if fmt in ("parquet", "arrow") and importlib.util.find_spec("pyarrow") is None:
+        raise typer.BadParameter(f"{fmt} 格式需要 pyarrow, 例如 uv run --with pyarrow ams.py export ...", param_hint="--format")
+    columns = [f.strip() for f in fields.split(",") if f.strip()]
+    if unknown := [f for f in columns if f not in EXPORT_FIELDS]:
+        raise typer.BadParameter(f"未知的欄位: {', '.join(unknown)}", param_hint="--fields")
+    if not columns:
+        raise typer.BadParameter("至少需要一個欄位", param_hint="--fields")
+    selector = build_selector(prefix, regex, status, stream_type, codes)
+    selected = select_profiles(profiles_spec)
+    # 排序需要 name 與 profile; 只保留要輸出的欄位, 減少排序暫存檔的大小
+    kept = set(columns) | ({"name", "profile"} if natural_sort else set())
 
-    if not streams:
-        print("目前沒有任何串流")
+    async def produce(queue: asyncio.Queue, errors: dict[str, str]):
+        async def list_profile(name: str, profile: Profile):
+            try:
+                with ams_cache.InventoryCache(name) as cache:
+                    async with async_client(profile) as client:
+                        async for s in iter_streams(client, cache, ttl, refresh, selector):
+                            await queue.put({f: name if f == "profile" else s.get(f) for f in kept})
+            except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                errors[name] = f"無法獲取串流列表: {e}"
+
+        try:
+            await asyncio.gather(*(list_profile(n, p) for n, p in selected.items()))
+        finally:
+            await queue.put(None)
+
+    async def consume(emit: Callable[[dict], None]) -> dict[str, str]:
+        queue: asyncio.Queue = asyncio.Queue(EXPORT_QUEUE)
+        errors: dict[str, str] = {}
+        producer = asyncio.create_task(produce(queue, errors))
+        while (row := await queue.get()) is not None:
+            emit(row)
+        await producer
+        return errors
+
+    with ams_export.open_writer(output, fmt, columns) as writer:
+        if natural_sort:
+            with ams_export.ExternalSorter(ams_export.sort_key) as sorter:
+                errors = asyncio.run(consume(sorter.add))
+                for row in sorter.sorted():
+                    writer.write(row)
+        else:
+            errors = asyncio.run(consume(writer.write))
+    for name, error in errors.items():
+        print(typer.style(f"[{name}] {error}", fg=typer.colors.RED, bold=True))
+    print(f"已匯出 {writer.count} 筆 → {output}")
+    if errors:
+        raise typer.Exit(1)
+
+
+# plan/apply 比對的欄位, 其他欄位 (description 等) 不視為差異
+RECONCILED_FIELDS = ("type", "ipAddr", "username", "password", "streamUrl")
+
+
+@dataclass
+class Change:
+    """plan 中的一項變更"""
+    action: str  # create / update / delete
+    stream_id: str
+    name: str
+    payload: dict = field(default_factory=dict)  # create: 完整 payload, update: 要修改的欄位
+    before: dict = field(default_factory=dict)  # update: 修改前的值
+
+    def to_op(self) -> BulkOp:
+        if self.action == "create":
+            return create_op(self.payload)
+        if self.action == "update":
+            return update_op(self.stream_id, self.payload)
+        return delete_op(self.stream_id)
+
+
+def diff_streams(payloads: list[dict], streams: list[dict], prune: bool = True) -> list[Change]:
+    """比對 CSV 產生的 payload 與伺服器上的串流, 回傳最小變更集合"""
+    existing = {s["streamId"]: s for s in streams}
+    wanted = {p["streamId"]: p for p in payloads}
+    changes: list[Change] = []
+    for stream_id, payload in wanted.items():
+        current = existing.get(stream_id)
+        if current is None:
+            changes.append(Change("create", stream_id, payload["name"], payload))
+            continue
+        fields = {k: payload[k] for k in RECONCILED_FIELDS if k in payload and current.get(k) != payload[k]}
+        if fields:
+            before = {k: current.get(k) for k in fields}
+            changes.append(Change("update", stream_id, payload["name"], fields, before))
+    if prune:
+        for stream_id, current in existing.items():
+            if stream_id not in wanted:
+                changes.append(Change("delete", stream_id, current.get("name", "")))
+    return changes
+
+
+async def compute_plan(
+    name: str, profile: Profile, stream_type: str, prune: bool, ttl: float, refresh: bool
+) -> list[Change]:
+    with ams_cache.InventoryCache(name) as cache:
+        async with async_client(profile) as client:
+            streams = await fetch_streams(client, cache, ttl=ttl, refresh=refresh)
+    return diff_streams(read_payloads(profile, stream_type), streams, prune)
+
+
+def _mask(field_name: str, value) -> str:
+    return "***" if field_name == "password" and value else str(value)
+
+
+def print_plan(name: str, changes: list[Change]):
+    counts = Counter(c.action for c in changes)
+    print(typer.style(
+        f"\n=== {name}: 建立 {counts['create']}，更新 {counts['update']}，刪除 {counts['delete']} ===", bold=True
+    ))
+    if not changes:
+        print("無需變更")
         return
+    table = rich_table.Table("動作", "streamId", "name", "變更內容")
+    styles = {"create": "green", "update": "yellow", "delete": "red"}
+    for c in changes:
+        detail = ", ".join(f"{k}: {_mask(k, c.before.get(k))} → {_mask(k, v)}" for k, v in c.payload.items()) if c.action == "update" else ""
+        table.add_row(f"[{styles[c.action]}]{c.action}", c.stream_id, c.name, detail)
+    rich.print(table)
 
-    # 狀態統計
-    print(f"狀態: {dict(Counter(s.get('status', 'unknown') for s in streams))}")
-    print(f"類型: {dict(Counter(s.get('type', 'unknown') for s in streams))}")
-
-    # 串流列表
-    print(f"\n{'streamId':<50} {'name':<20} {'type':<15} {'status':<15}")
-    print("-" * 100)
-    status_colors = {
-        "broadcasting": typer.colors.GREEN,
-        "created": typer.colors.YELLOW,
-        "finished": typer.colors.RED,
-        "failed": typer.colors.RED,
-        "error": typer.colors.RED,
-    }
-    for s in streams:
+
+def prune_option():
+    return typer.Option(True, "--prune/--keep-extra", help="是否刪除伺服器上存在但 CSV 中沒有的串流")
+
+
+def plan_profiles(
+    selected: dict[str, Profile], stream_type: str, prune: bool, ttl: float, refresh: bool
+) -> dict[str, list[Change]]:
+    async def compute_all() -> list:
+        return await asyncio.gather(
+            *(compute_plan(n, p, stream_type, prune, ttl, refresh) for n, p in selected.items()),
+            return_exceptions=True,
+        )
+
+    plans = {}
+    for name, result in zip(selected, asyncio.run(compute_all())):
+        if isinstance(result, (httpx.HTTPStatusError, httpx.RequestError)):
+            print(typer.style(f"\n=== {name}: 無法獲取串流列表: {result} ===", fg=typer.colors.RED, bold=True))
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        plans[name] = result
+        print_plan(name, result)
+    return plans
+
+
+@app.command()
+def plan(
+    stream_type: str = stream_type_option(),
+    profiles_spec: str | None = profiles_option(),
+    prune: bool = prune_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+):
+    """比對 CSV 與伺服器, 列出讓伺服器符合 CSV 所需的變更 (不會修改伺服器)"""
+    check_stream_type(stream_type)
+    plan_profiles(select_profiles(profiles_spec), stream_type, prune, ttl, refresh)
+
+
+@app.command()
+def apply(
+    stream_type: str = stream_type_option(),
+    profiles_spec: str | None = profiles_option(),
+    prune: bool = prune_option(),
+    concurrency: int = concurrency_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+):
+    """依 plan 的結果併發建立、更新 (PUT) 與刪除串流, 讓伺服器符合 CSV"""
+    check_stream_type(stream_type)
+    selected = select_profiles(profiles_spec)
+    plans = plan_profiles(selected, stream_type, prune, ttl, refresh)
+    pending = {name: selected[name] for name, changes in plans.items() if changes}
+    if not pending:
+        return
+    typer.confirm("\n確認套用以上變更?", abort=True)
+
+    names = {id(profile): name for name, profile in pending.items()}
+
+    async def build_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+        # 直接套用剛才確認過的 plan, 不再列表一次
+        for change in plans[names[id(profile)]]:
+            yield change.to_op()
+
+    run_bulk(pending, build_ops, "applying", concurrency, batch_size=BULK_BATCH)
+
+
+@dataclass
+class ServerInfo:
+    """query 使用的伺服器狀態"""
+    streams: list[dict] = field(default_factory=list)
+    version: dict | None = None
+    active: int | None = None
+    total: int | None = None  # /broadcasts/count; 只有 --summary-only 取得
+    error: str = ""
+    warning: str = ""
+
+
+async def fetch_server_info(
+    name: str, profile: Profile, ttl: float = DEFAULT_TTL, refresh: bool = False, selector: Selector | None = None
+) -> ServerInfo:
+    """同時取得 (符合 selector 的) 串流列表 (優先使用本機快取)、版本與活躍直播數"""
+    info = ServerInfo()
+    with ams_cache.InventoryCache(name) as cache:
+        async with async_client(profile) as client:
+            streams, version_resp, count_resp = await asyncio.gather(
+                fetch_streams(client, cache, ttl=ttl, refresh=refresh, selector=selector),
+                client.get("/version"),
+                client.get("/broadcasts/active-live-stream-count"),
+                return_exceptions=True,
+            )
+        if isinstance(version_resp, httpx.Response) and version_resp.status_code == 200:
+            info.version = version_resp.json()
+            # 批量刪除依版本判斷是否可以使用批次端點
+            cache.store_version(info.version)
+    if isinstance(streams, BaseException):
+        info.error = f"無法獲取串流列表: {streams}"
+        return info
+    info.streams = streams
+
+    for resp in (version_resp, count_resp):
+        if isinstance(resp, httpx.RequestError):
+            info.warning = f"獲取伺服器資訊失敗: {resp}"
+    if isinstance(count_resp, httpx.Response) and count_resp.status_code == 200:
+        info.active = count_resp.json().get("number", 0)
+    return info
+
+
+async def fetch_server_summary(name: str, profile: Profile) -> ServerInfo:
+    """只以 /version 與兩個計數端點取得總數與活躍直播數, 不下載串流列表"""
+    info = ServerInfo()
+    async with async_client(profile) as client:
+        info.version, info.total, info.active = await asyncio.gather(
+            client.version(), client.count(), client.active_count()
+        )
+    if info.version is None and info.total is None and info.active is None:
+        info.error = "無法獲取伺服器資訊"
+    elif info.version:
+        with ams_cache.InventoryCache(name) as cache:
+            cache.store_version(info.version)
+    return info
+
+
+QUERY_FORMATS = ("table", "json", "ndjson", "csv")
+QUERY_SORT_KEYS = ("name", "status", "type", "streamId")
+QUERY_PAGE_SIZE = 50
+STATUS_STYLES = {"broadcasting": "green", "created": "yellow", "finished": "red", "failed": "red", "error": "red"}
+
+
+def sort_streams(streams: list[dict], key: str, descending: bool = False) -> list[dict]:
+    """name 依自然排序 (A2 在 A10 之前), 其他欄位依字串排序"""
+    if key == "name":
+        return sorted(streams, key=lambda s: ams_export.natural_key(s.get("name") or ""), reverse=descending)
+    return sorted(streams, key=lambda s: str(s.get(key) or ""), reverse=descending)
+
+
+def version_name(info: ServerInfo) -> str:
+    return (info.version or {}).get("versionName") or ""
+
+
+def summary_record(name: str, info: ServerInfo, with_streams: bool) -> dict:
+    """JSON / NDJSON / CSV 輸出中一個 profile 的彙總"""
+    record = {"profile": name, "version": version_name(info) or None, "active": info.active, "error": info.error or None}
+    if with_streams:
+        record["total"] = len(info.streams)
+        record["statuses"] = dict(Counter(s.get("status", "unknown") for s in info.streams))
+        record["types"] = dict(Counter(s.get("type", "unknown") for s in info.streams))
+    else:
+        record["total"] = info.total
+    return record
+
+
+def stream_record(name: str, stream: dict) -> dict:
+    return {f: name if f == "profile" else stream.get(f) for f in DEFAULT_EXPORT_FIELDS}
+
+
+def write_query_output(results: dict[str, ServerInfo], fmt: str, summary_only: bool):
+    """以機器可讀的格式寫到 stdout (一次寫出); 錯誤只寫到 stderr, 不影響輸出的格式"""
+    for name, info in results.items():
+        if info.error:
+            print(f"[{name}] {info.error}", file=sys.stderr)
+    out = sys.stdout
+    if fmt == "json":
+        records = []
+        for name, info in results.items():
+            record = summary_record(name, info, not summary_only)
+            if not summary_only:
+                record["streams"] = [stream_record(name, s) for s in info.streams]
+            records.append(record)
+        out.write(json.dumps(records, ensure_ascii=False, indent=2) + "\n")
+        return
+    if summary_only:
+        rows = [summary_record(name, info, False) for name, info in results.items()]
+        fields = ["profile", "version", "total", "active", "error"]
+    else:
+        rows = (stream_record(name, s) for name, info in results.items() for s in info.streams)
+        fields = list(DEFAULT_EXPORT_FIELDS)
+    if fmt == "ndjson":
+        out.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    else:
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_summary_table(results: dict[str, ServerInfo]):
+    table = rich_table.Table("profile", "版本", "總數", "活躍直播")
+    for name, info in results.items():
+        if info.error:
+            table.add_row(name, f"[red]{info.error}", "-", "-")
+            continue
+        table.add_row(
+            name, version_name(info) or "-", "-" if info.total is None else str(info.total),
+            "-" if info.active is None else str(info.active),
+        )
+    rich.print(table)
+
+
+def server_renderables(name: str, info: ServerInfo, page: int, page_size: int, filtered: bool) -> list:
+    """一台伺服器的摘要與串流表格的第 page 頁 (page_size 為 0 時為全部)"""
+    if info.error:
+        return [f"[bold red]{rich_markup.escape(info.error)}"]
+    streams = info.streams
+    lines = []
+    if info.warning:
+        lines.append(f"[yellow]{rich_markup.escape(info.warning)}")
+    if v := info.version:
+        lines.append(f"版本: {v.get('versionName')} ({v.get('versionType')}) Build: {v.get('buildNumber')}")
+    if info.active is not None:
+        lines.append(f"活躍直播: {info.active} / {'符合條件' if filtered else '總計'}: {len(streams)}")
+    if not streams:
+        return lines + ["目前沒有任何串流" if not filtered else "沒有符合條件的串流"]
+    lines.append(f"狀態: {dict(Counter(s.get('status', 'unknown') for s in streams))}")
+    lines.append(f"類型: {dict(Counter(s.get('type', 'unknown') for s in streams))}")
+
+    pages = -(-len(streams) // page_size) if page_size else 1
+    page = min(max(page, 1), pages)
+    shown = streams[(page - 1) * page_size:page * page_size] if page_size else streams
+    title = f"{name} 第 {page}/{pages} 頁 (共 {len(streams)} 筆)" if pages > 1 else name
+    table = rich_table.Table("streamId", "name", "type", "status", title=title)
+    for s in shown:
         status = s.get("status", "N/A")
-        color = status_colors.get(status)
-        status_display = typer.style(status, fg=color) if color else status
-        print(f"{s.get('streamId', 'N/A'):<50} {s.get('name', 'N/A'):<20} {s.get('type', 'N/A'):<15} {status_display:<15}")
+        style = STATUS_STYLES.get(status)
+        table.add_row(
+            s.get("streamId", "N/A"), s.get("name", "N/A"), s.get("type", "N/A"),
+            f"[{style}]{status}" if style else status,
+        )
+    footer = [f"下一頁: --page {page + 1}"] if page < pages else []
+    return lines + [table] + footer
+
+
+@app.command()
+def query(
+    profiles_spec: str | None = profiles_option(),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+    fmt: str = typer.Option("table", "--format", help=f"輸出格式: {'/'.join(QUERY_FORMATS)}; 非 table 時輸出全部串流到 stdout"),
+    summary_only: bool = typer.Option(
+        False, "--summary-only", help="只以計數端點取得總數與活躍直播數, 不下載串流列表"
+    ),
+    sort: str = typer.Option("name", "--sort", help=f"排序欄位: {'/'.join(QUERY_SORT_KEYS)} (name 為自然排序)"),
+    descending: bool = typer.Option(False, "--desc", help="反向排序"),
+    page: int = typer.Option(1, "--page", min=1, help="table 格式顯示的頁數"),
+    page_size: int = typer.Option(QUERY_PAGE_SIZE, "--page-size", min=0, help="table 格式每頁的串流數, 0 為全部"),
+    pager: bool = typer.Option(False, "--pager", help="以 less 等分頁程式顯示 table 輸出"),
+    prefix: str | None = prefix_option(),
+    regex: str | None = regex_option(),
+    status: str | None = status_option(),
+    stream_type: str | None = type_filter_option(),
+    codes: Path | None = codes_option(),
+):
+    """查詢伺服器上的串流狀態
+
+    table 格式每次只顯示一頁 (依 --sort 排序); json / ndjson / csv 寫出全部 (符合條件的) 串流, 可接給其他程式處理。
+    """
+    if fmt not in QUERY_FORMATS:
+        raise typer.BadParameter(f"不支援的格式: {fmt}", param_hint="--format")
+    if sort not in QUERY_SORT_KEYS:
+        raise typer.BadParameter(f"不支援的排序欄位: {sort}", param_hint="--sort")
+    machine = fmt != "table"
+    if machine and profiles_spec is None:
+        raise typer.BadParameter(f"--format {fmt} 需要以 -p 指定 profile", param_hint="--profiles")
+    # 機器可讀的輸出時, 選擇的 profile 與條件印到 stderr, stdout 只有資料
+    with contextlib.redirect_stdout(sys.stderr) if machine else contextlib.nullcontext():
+        selector = build_selector(prefix, regex, status, stream_type, codes)
+        selected = select_profiles(profiles_spec, confirm=not machine)
+    if summary_only and selector:
+        print(typer.style("注意: --summary-only 只有伺服器的總數, 不套用選擇條件", fg=typer.colors.YELLOW), file=sys.stderr)
+
+    async def fetch_all() -> list[ServerInfo]:
+        if summary_only:
+            return await asyncio.gather(*(fetch_server_summary(n, p) for n, p in selected.items()))
+        return await asyncio.gather(*(fetch_server_info(n, p, ttl, refresh, selector) for n, p in selected.items()))
+
+    results = dict(zip(selected, asyncio.run(fetch_all())))
+    for info in results.values():
+        info.streams = sort_streams(info.streams, sort, descending)
+
+    if machine:
+        write_query_output(results, fmt, summary_only)
+        if any(info.error for info in results.values()):
+            raise typer.Exit(1)
+        return
+    if summary_only:
+        print_summary_table(results)
+        return
+
+    console = rich_console.Console()
+    renderables = []
+    for name, info in results.items():
+        if len(selected) > 1:
+            renderables.append(f"\n[bold]=== {name} ({rich_markup.escape(selected[name].api_url)}) ===")
+        renderables += server_renderables(name, info, page, page_size, bool(selector))
+    # 整個輸出組好後一次寫出; --pager 時交給分頁程式
+    with console.pager(styles=True) if pager else contextlib.nullcontext():
+        console.print(*renderables, sep="\n")
+
+
+CAMERA_TYPES = ("ipCamera", "streamSource")
 
 
 @app.command()
 def query_stream(stream_id: str = typer.Argument(..., help="要查詢的串流 ID")):
     """查詢單一串流的詳細資訊"""
     profile = select_profile()
-    client = httpx.Client(base_url=profile.api_url, timeout=60)
 
+    async def fetch() -> list[httpx.Response | BaseException]:
+        # 三個查詢互不相依, 同時送出
+        async with async_client(profile) as client:
+            return await asyncio.gather(
+                client.get(f"/broadcasts/{stream_id}"),
+                client.get(f"/broadcasts/{stream_id}/broadcast-statistics"),
+                client.get(f"/broadcasts/{stream_id}/ip-camera-error"),
+                return_exceptions=True,
+            )
+
+    resp, stats_resp, err_resp = asyncio.run(fetch())
+    for r in (resp, stats_resp, err_resp):
+        if isinstance(r, httpx.RequestError):
+            print(typer.style(f"網路請求失敗: {r}", fg=typer.colors.RED, bold=True))
+            return
+        if isinstance(r, BaseException):
+            raise r
+
+    if resp.status_code == 404:
+        print(f"串流 {stream_id} 不存在")
+        return
+    if resp.status_code != 200:
+        print(f"查詢失敗: HTTP {resp.status_code}")
+        return
+
+    stream = resp.json()
+    rich.print("\n--- 串流詳細資訊 ---", stream)
+
+    # 觀看統計
+    if viewers := ams_client.parse_viewers(stats_resp):
+        hls, webrtc, rtmp, dash = viewers
+        print(f"\n觀眾: HLS={hls} WebRTC={webrtc} RTMP={rtmp} DASH={dash}")
+
+    # IP Camera 錯誤檢查
+    if stream.get("type") in CAMERA_TYPES and err_resp.status_code == 200:
+        if error := ams_client.parse_camera_error(err_resp):
+            print(typer.style(f"錯誤: {error}", fg=typer.colors.RED))
+        else:
+            print(typer.style("無錯誤", fg=typer.colors.GREEN))
+
+
+# --- collect / stats ---
+
+COLLECT_CONCURRENCY = 2  # 每台伺服器同時進行的列表請求, 取樣不應增加伺服器的負擔
+COLLECT_PRUNE_EVERY = 3600.0  # 秒, 刪除超過保留期間資料的間隔
+
+
+async def sample_profile(
+    name: str, client: ams_client.AsyncAMSClient, store: ams_stats.StatsStore, ts: float, timeout: float
+) -> str:
+    """列出一台伺服器的所有串流 (同時更新本機快取) 並寫入統計, 回傳一行摘要
+
+    超過 timeout (取樣間隔) 仍未列完的伺服器略過這次取樣, 不拖慢其他伺服器的下一次取樣。
+    """
+    try:
+        with ams_cache.InventoryCache(name) as cache:
+            streams = await asyncio.wait_for(fetch_streams(client, cache, refresh=True), timeout)
+    except (httpx.HTTPStatusError, httpx.RequestError) as e:
+        return typer.style(f"{name} 無法獲取串流列表: {e}", fg=typer.colors.RED)
+    except TimeoutError:
+        return typer.style(f"{name} {timeout:.0f} 秒內未完成列表, 略過這次取樣", fg=typer.colors.RED)
+    live, viewers = store.record(name, streams, ts)
+    return f"{name} 直播 {live}/{len(streams)} 觀眾 {viewers}"
+
+
+@app.command()
+def collect(
+    profiles_spec: str | None = typer.Option(None, "--profiles", "-p", help="以逗號分隔的 profile 名稱; 未指定時為全部"),
+    interval: float = typer.Option(STATS_INTERVAL, "--interval", min=5, help="取樣間隔秒數"),
+    once: bool = typer.Option(False, "--once", help="只取樣一次 (例如由 cron 或 systemd timer 執行)"),
+    db: Path = typer.Option(STATS_DB, "--db", help="統計資料庫"),
+):
+    """定期記錄每個串流的狀態與觀眾數, 供 stats 查詢趨勢 (按 Ctrl+C 結束)
+
+    每台伺服器每次只需要幾個 /broadcasts/list 請求 (每頁 1000 個串流), 不逐一查詢 broadcast-statistics。
+    """
+    selected = select_profiles(profiles_spec or "all", confirm=False)
+
+    async def run():
+        clients = {name: async_client(profile, COLLECT_CONCURRENCY) for name, profile in selected.items()}
+        pruned_at = 0.0
+        try:
+            with ams_stats.StatsStore(db) as store:
+                while True:
+                    started = time.monotonic()
+                    ts = time.time()
+                    lines = await asyncio.gather(*(sample_profile(n, c, store, ts, interval) for n, c in clients.items()))
+                    print(f"{time.strftime('%H:%M:%S')} " + "; ".join(lines))
+                    if started - pruned_at >= COLLECT_PRUNE_EVERY:
+                        store.prune()
+                        pruned_at = started
+                    if once:
+                        return
+                    await asyncio.sleep(max(0.0, started + interval - time.monotonic()))
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("已停止")
+
+
+def print_server_trends(trends: list[ams_stats.ServerTrend], series: bool):
+    table = rich_table.Table(
+        "profile", *(["時間"] if series else []), "樣本", "串流數", "直播 平均", "直播 峰值", "觀眾 平均", "觀眾 峰值", "進入錯誤"
+    )
+    for t in trends:
+        table.add_row(
+            t.profile, *([time.strftime("%m-%d %H:%M", time.localtime(t.bucket))] if series else []), str(t.samples),
+            str(t.streams_peak), f"{t.live_avg:.0f}", str(t.live_peak), f"{t.viewers_avg:.1f}", str(t.viewers_peak),
+            f"[red]{t.errors}" if t.errors else "0",
+        )
+    rich.print(table)
+
+
+def print_stream_trends(trends: list[tuple[int, ams_stats.StreamTrend]], series: bool):
+    table = rich_table.Table(
+        "profile", "name", *(["時間"] if series else []), "樣本", "直播比例", "觀眾 平均", "觀眾 峰值", "進入錯誤"
+    )
+    for bucket, t in trends:
+        table.add_row(
+            t.profile, t.name or t.stream_id, *([time.strftime("%m-%d %H:%M", time.localtime(bucket))] if series else []),
+            str(t.samples), f"{t.uptime:.0%}", f"{t.viewers_avg:.1f}", str(t.viewers_peak),
+            f"[red]{t.errors}" if t.errors else "0",
+        )
+    rich.print(table)
+
+
+@app.command()
+def stats(
+    profiles_spec: str | None = typer.Option(None, "--profiles", "-p", help="以逗號分隔的 profile 名稱; 未指定時為全部"),
+    since: str = typer.Option("24h", "--since", help="查詢最近多久, 例如 30m、24h、7d"),
+    stream: str | None = typer.Option(None, "--stream", help="只看這個串流 (name 或 streamId)"),
+    bucket: str | None = typer.Option(None, "--bucket", help="以此間隔列出時間序列, 例如 1h、1d"),
+    order: str = typer.Option("viewers", "--sort", help="串流的排序: viewers (峰值觀眾) / uptime (直播比例低的在前) / errors"),
+    limit: int = typer.Option(20, "--limit", min=1, help="列出的串流數"),
+    db: Path = typer.Option(STATS_DB, "--db", help="統計資料庫"),
+):
+    """查詢 collect 記錄的趨勢: 各伺服器的活躍直播與觀眾數, 以及各串流的峰值觀眾、直播比例與錯誤次數"""
     try:
-        resp = client.get(f"/broadcasts/{stream_id}")
-        if resp.status_code == 404:
-            print(f"串流 {stream_id} 不存在")
+        since_seconds = ams_stats.parse_duration(since)
+        bucket_seconds = ams_stats.parse_duration(bucket) if bucket else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    if order not in ("viewers", "uptime", "errors"):
+        raise typer.BadParameter(f"未知的排序: {order}", param_hint="--sort")
+    if not db.exists():
+        print(f"{db} 不存在, 請先執行 collect")
+        raise typer.Exit(1)
+    names = [n.strip() for n in profiles_spec.split(",") if n.strip()] if profiles_spec else None
+
+    with ams_stats.StatsStore(db) as store:
+        if not stream:
+            print_server_trends(store.server_trends(since_seconds, names, bucket_seconds), bucket_seconds is not None)
+        trends = store.stream_trends(since_seconds, names, stream, order, limit, bucket_seconds if stream else None)
+    if stream and not trends:
+        print(f"最近 {since} 沒有 {stream} 的紀錄")
+        return
+    print_stream_trends(trends, bool(stream and bucket_seconds))
+
+
+# --- registry ---
+
+
+DUPLICATES_SHOWN = 10  # 每一組重複項目最多列出的數量
+
+
+def _shown(values: list[str]) -> str:
+    more = f" ... 另有 {len(values) - DUPLICATES_SHOWN} 個" if len(values) > DUPLICATES_SHOWN else ""
+    return ", ".join(values[:DUPLICATES_SHOWN]) + more
+
+
+def print_duplicates(duplicates: list[ams_registry.Duplicate]):
+    """重複的 code 依所在的 profile 分組, 每組與位址重複都只列出前 DUPLICATES_SHOWN 個"""
+    warn = typer.colors.YELLOW
+    codes: dict[tuple[str, ...], list[str]] = {}
+    addresses = []
+    for d in duplicates:
+        if d.kind == "file":
+            print(typer.style(f"內容完全相同的 CSV: {', '.join(d.sources)}", fg=warn))
+        elif d.kind == "code":
+            codes.setdefault(tuple(d.sources), []).append(d.value)
+        else:
+            addresses.append(f"{d.value} ({', '.join(d.sources)})")
+    for sources, values in codes.items():
+        print(typer.style(f"重複的 code ({', '.join(sources)}) 共 {len(values)} 個: {_shown(values)}", fg=warn))
+    if addresses:
+        print(typer.style(f"被多個 code 使用的攝影機位址共 {len(addresses)} 個: {_shown(addresses)}", fg=warn))
+
+
+@app.command("registry")
+def registry_lookup(
+    terms: list[str] | None = typer.Argument(None, help="IP、code 或 streamId (ams.py 或 ams_script 的格式)"),
+    subnet: int | None = typer.Option(None, "--subnet", help="列出此網段 (IP 的第三段) 的所有攝影機"),
+    master: Path = typer.Option(Path(MASTER_CSV), "--master", help="攝影機總表"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="不比對 mtime 與 sha1, 重新編譯所有 CSV"),
+    db: Path = typer.Option(REGISTRY_DB, "--db", help="登錄表的 SQLite 檔"),
+):
+    """查詢攝影機在哪個 profile 與其 streamId; 未指定條件時列出各來源的攝影機數與重複項目
+
+    登錄表由總表與所有 profile 的 CSV 編譯而成, 只有內容變更的 CSV 會重新解析。
+    """
+    with ams_registry.Registry(db) as registry:
+        report = registry.refresh({name: Path(p.streams_csv) for name, p in profiles.items()}, master, rebuild)
+        if report.changed:
+            print(f"已重新編譯: {', '.join(report.rebuilt) or '-'}" + (f", 已移除: {', '.join(report.removed)}" if report.removed else ""))
+            print_duplicates(report.duplicates)
+
+        cameras = [c for term in terms or () for c in registry.lookup(term)]
+        if subnet is not None:
+            cameras += registry.by_subnet(subnet)
+        if not terms and subnet is None:
+            table = rich_table.Table("來源", "攝影機數")
+            for source, count in registry.sources().items():
+                table.add_row(source, str(count))
+            rich.print(table)
+            if not report.changed:
+                print_duplicates(registry.duplicates())
             return
-        if resp.status_code != 200:
-            print(f"查詢失敗: HTTP {resp.status_code}")
+        if not cameras:
+            print(typer.style("找不到符合的攝影機", fg=typer.colors.RED))
+            raise typer.Exit(1)
+
+    table = rich_table.Table("來源", "code", "位址", "streamId", "舊格式 streamId")
+    for c in cameras:
+        table.add_row(c.location, c.code, c.address, c.stream_id, c.legacy_id)
+    rich.print(table)
+
+
+# --- place ---
+
+
+def parse_capacities(spec: str | None, selected: dict[str, Profile]) -> dict[str, int]:
+    """--capacity sms1=400,sms2=300; 未列出的使用 profile 的設定"""
+    capacities = {name: profile.capacity for name, profile in selected.items()}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        if name.strip() not in capacities or not value.strip().isdigit():
+            raise typer.BadParameter(f"無效的容量設定: {item}", param_hint="--capacity")
+        capacities[name.strip()] = int(value)
+    return capacities
+
+
+def current_locations(servers: dict[str, Profile], infos: dict[str, ServerInfo]) -> dict[str, tuple[str, dict | None]]:
+    """串流名稱 → (目前的伺服器, 串流物件); 伺服器上沒有的再參考各 profile 目前的 CSV"""
+    locations: dict[str, tuple[str, dict | None]] = {}
+    for name, info in infos.items():
+        for stream in info.streams:
+            locations.setdefault(stream.get("name") or "", (name, stream))
+    for name, profile in servers.items():
+        if Path(profile.streams_csv).exists():
+            with open(profile.streams_csv, newline="") as f:
+                for row in csv.DictReader(f):
+                    locations.setdefault(row["code"], (name, None))
+    return locations
+
+
+def print_placement(section: MasterSection, loads: dict[str, ServerLoad], placements: list[Placement]):
+    table = rich_table.Table("profile", "容量", "既有負載", "主源", "備源", "使用率", "搬入", title=f"區段 {section.name}")
+    for name, load in loads.items():
+        mine = [p for p in placements if p.server == name]
+        before = (load.base + load.before) / max(load.capacity, 1)
+        table.add_row(
+            name, str(load.capacity), f"{load.base:.0f}",
+            str(sum(p.primary is None for p in mine)), str(sum(p.primary is not None for p in mine)),
+            f"{before:.0%} → {load.utilization():.0%}", str(sum(p.moved for p in mine)),
+        )
+    rich.print(table)
+    if section.duplicates:
+        print(f"[{section.name}] 總表中重複的 code (只保留第一筆): {', '.join(section.duplicates)}")
+    if unplaced := [p.code for p in placements if p.server is None]:
+        print(f"[{section.name}] 只有一台伺服器, 無法放置備源: {len(unplaced)} 筆")
+
+
+@app.command("place")
+def place_cameras(
+    profiles_spec: str | None = profiles_option(),
+    master: Path = typer.Option(Path(MASTER_CSV), "--master", help="攝影機總表"),
+    capacity: str | None = typer.Option(None, "--capacity", help="各伺服器的容量, 例如 sms1=400,sms2=300"),
+    backup: bool = typer.Option(True, "--backup/--no-backup", help="每台攝影機另外在不同伺服器建立備源 (code-1)"),
+    slack: float = typer.Option(DEFAULT_SLACK, "--slack", min=0, help="使用率高於平均多少比例以內, 串流仍留在目前的伺服器"),
+    out_dir: Path | None = typer.Option(None, "--out-dir", help="CSV 的輸出目錄; 未指定時覆寫各 profile 的 CSV"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只顯示分配結果, 不寫出 CSV"),
+    ttl: float = ttl_option(),
+    refresh: bool = refresh_option(),
+):
+    """依容量與目前負載把攝影機總表分配到各伺服器, 寫出每個 profile 的 CSV (之後以 plan / apply 同步)"""
+    selected = select_profiles(profiles_spec or "all")
+    capacities = parse_capacities(capacity, selected)
+    sections = [s for s in read_master(master) if s.name in PLACEMENT_GROUPS]
+
+    async def fetch_all() -> dict[str, ServerInfo]:
+        infos = await asyncio.gather(*(fetch_server_info(n, p, ttl, refresh) for n, p in selected.items()))
+        return dict(zip(selected, infos))
+
+    infos = asyncio.run(fetch_all())
+    for name, info in infos.items():
+        if info.error:
+            print(typer.style(f"[{name}] {info.error}", fg=typer.colors.RED))
+
+    for section in sections:
+        group = PLACEMENT_GROUPS[section.name]
+        servers = {n: selected[n] for n in group if n in selected and not infos[n].error}
+        if not servers:
+            continue
+        # 沒有參與分配的伺服器的 CSV 不會更新, 其中的攝影機會被重複分配到其他伺服器
+        if excluded := [n for n in group if n not in servers]:
+            print(typer.style(
+                f"區段 {section.name}: {', '.join(excluded)} 無法取得資訊或未選擇, 不分配這個區段", fg=typer.colors.RED
+            ))
+            continue
+        managed = {r["code"] for r in section.rows} | {r["code"] + BACKUP_SUFFIX for r in section.rows}
+        loads = {
+            n: server_load(n, capacities[n], infos[n].active, infos[n].streams, managed) for n in servers
+        }
+        placements = place(section, loads, current_locations(servers, {n: infos[n] for n in servers}), backup, slack)
+        print_placement(section, loads, placements)
+        if dry_run:
+            continue
+        for name, profile in servers.items():
+            # 不在總表這個區段中的既有資料列原樣保留, 否則之後的 apply (預設 prune) 會刪除它們
+            existing_fields, existing = read_assignment(Path(profile.streams_csv))
+            kept = [row for row in existing if row.get("code") not in managed]
+            fieldnames = section.fieldnames + [f for f in existing_fields if f not in section.fieldnames]
+            path = out_dir / Path(profile.streams_csv).name if out_dir else Path(profile.streams_csv)
+            if count := write_assignment(path, fieldnames, [p for p in placements if p.server == name], kept):
+                print(f"已寫出 {path} ({count} 筆" + (f", 保留不在總表中的 {len(kept)} 筆)" if kept else ")"))
+            elif existing:
+                print(typer.style(
+                    f"[{name}] 沒有分配到任何攝影機, 不寫出 {path}; 原有的 {len(existing)} 筆已分配到其他伺服器, 請手動移除",
+                    fg=typer.colors.RED,
+                ))
+            else:
+                print(typer.style(f"[{name}] 沒有分配到任何攝影機, 不寫出 {path}", fg=typer.colors.YELLOW))
+
+
+# --- migrate ---
+
+MIGRATE_IN_FLIGHT = 8  # 同時搬移中 (兩邊都在拉流) 的串流數
+MIGRATE_VERIFY_TIMEOUT = 30.0  # 秒, 目的地建立後等待進入 broadcasting 的時間
+MIGRATE_POLL = 1.0  # 秒, 等待時查詢狀態的間隔
+# 搬移時複製的設定; status、觀眾數與時間等執行期欄位由目的地產生, originAdress 改為目的地
+MIGRATED_FIELDS = (
+    "streamId", "name", "description", "type", "ipAddr", "username", "password", "streamUrl", "metaData",
+    "webRTCViewerLimit", "hlsViewerLimit", "dashViewerLimit", "mp4Enabled", "webMEnabled", "subFolder",
+    "listenerHookURL", "playListItemList", "playlistLoopEnabled", "latitude", "longitude", "altitude",
+)
+
+
+def migrate_payload(stream: dict, target: Profile) -> dict:
+    """以來源串流的 streamId 與設定產生在目的地建立的 payload"""
+    payload = {f: stream[f] for f in MIGRATED_FIELDS if stream.get(f) is not None}
+    payload["originAdress"] = target.origin_ip
+    return payload
+
+
+async def wait_broadcasting(client: httpx.AsyncClient, stream_id: str, timeout: float) -> str:
+    """查詢串流狀態直到進入 broadcasting 或逾時, 回傳最後的狀態"""
+    last = "unknown"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            resp = await client.get(f"/broadcasts/{stream_id}")
+            if resp.status_code == 200:
+                last = resp.json().get("status", "unknown")
+        except (httpx.RequestError, ValueError):
+            pass
+        if last == "broadcasting" or time.monotonic() >= deadline:
+            return last
+        await asyncio.sleep(MIGRATE_POLL)
+
+
+@dataclass
+class MigrateSide:
+    """搬移的一端 (來源或目的地)"""
+    name: str
+    profile: Profile
+    client: ams_client.AsyncAMSClient
+    cache: ams_cache.InventoryCache
+
+    async def run(self, op: BulkOp) -> BulkResult:
+        result = await run_op(self.client, op)
+        if result.success and op.apply:
+            op.apply(self.cache)
+        return result
+
+
+async def migrate_stream(
+    stream: dict, source: MigrateSide, target: MigrateSide, existing: set[str], verify_timeout: float
+) -> BulkResult:
+    """先在目的地建立並確認開始直播, 才從來源刪除 (先接後斷, 觀眾不會看到中斷)
+
+    來源沒有在直播的串流在目的地建立時不自動啟動, 建立後直接刪除來源。
+    目的地逾時未開始直播時刪除剛建立的串流, 來源保持不變。目的地已有同一個 streamId
+    (例如上次搬移中斷) 時不再建立, 只確認狀態。
+    """
+    stream_id = stream["streamId"]
+    live = stream.get("status") == "broadcasting"
+    created = stream_id not in existing
+    if created:
+        result = await target.run(create_op(migrate_payload(stream, target.profile), auto_start=live))
+        if not result.success:
+            return BulkResult(stream_id, False, f"{target.name} 建立失敗: {result.msg}")
+
+    if live:
+        status = await wait_broadcasting(target.client, stream_id, verify_timeout)
+        target.cache.update(stream_id, status=status)
+        if status != "broadcasting":
+            msg = f"{target.name} {verify_timeout:.0f} 秒內未進入 broadcasting (狀態 {status}), 保留 {source.name} 的串流"
+            if created and not (rollback := await target.run(delete_op(stream_id))).success:
+                msg += f"; 刪除 {target.name} 剛建立的串流失敗: {rollback.msg}"
+            return BulkResult(stream_id, False, msg)
+
+    result = await source.run(delete_op(stream_id))
+    if not result.success:
+        return BulkResult(stream_id, False, f"{source.name} 刪除失敗 (兩邊都有此串流): {result.msg}")
+    return BulkResult(stream_id, True)
+
+
+async def execute_migrate(
+    source: MigrateSide,
+    target: MigrateSide,
+    selector: Selector,
+    in_flight: int,
+    verify_timeout: float,
+    max_active: int,
+    progress: rich_progress.Progress | None = None,
+) -> ProfileReport:
+    """一邊列出來源的串流一邊搬移, 同時搬移中的串流不超過 in_flight
+
+    是否在直播決定了要不要等待目的地, 因此兩邊都一律向伺服器列表 (並更新快取), 不使用可能過期的快取。
+    刪除來源會讓翻頁的 offset 位移, 因此和 delete-all-streams 一樣重新列表, 直到不再出現新的串流。
+    目的地的活躍直播數 (加上搬入中的) 達到 max_active 後, 其餘直播中的串流留在來源。
+    progress 與 execute_bulk 相同。
+    """
+    report = ProfileReport(f"{source.name} → {target.name}")
+    start = time.perf_counter()
+    seen: set[str] = set()
+    sem = asyncio.Semaphore(in_flight)
+    tasks: list[asyncio.Task] = []
+    failed = 0
+
+    with contextlib.nullcontext(progress) if progress else bulk_progress() as progress:
+        task = progress.add_task(f"{report.name} migrating", total=0, failed=0)
+
+        def done(result: BulkResult):
+            nonlocal failed
+            failed += not result.success
+            progress.update(task, advance=1, failed=failed)
+
+        async def run(stream: dict, counted: bool) -> BulkResult:
+            nonlocal active
+            try:
+                result = await migrate_stream(stream, source, target, existing, verify_timeout)
+            finally:
+                sem.release()
+            if counted and not result.success:
+                active -= 1
+            done(result)
+            return result
+
+        try:
+            existing = {s["streamId"] async for s in iter_streams(target.client, target.cache, refresh=True)}
+            active = await target.client.active_count()
+            if active is None:
+                active = sum(s.get("status") == "broadcasting" for s in target.cache.streams())
+            while True:
+                submitted = len(seen)
+                async for stream in iter_streams(source.client, source.cache, refresh=True, selector=selector):
+                    if stream["streamId"] in seen:
+                        continue
+                    seen.add(stream["streamId"])
+                    progress.update(task, total=len(seen))
+                    counted = stream.get("status") == "broadcasting" and stream["streamId"] not in existing
+                    if counted and active >= max_active:
+                        result = BulkResult(stream["streamId"], False, f"{target.name} 已有 {active} 個活躍直播, 未搬移")
+                        report.results.append(result)
+                        done(result)
+                        continue
+                    active += counted
+                    await sem.acquire()
+                    tasks.append(asyncio.create_task(run(stream, counted)))
+                # 這一輪的刪除都完成後才重新列表
+                report.results.extend(await asyncio.gather(*tasks))
+                tasks = []
+                if len(seen) == submitted:
+                    break
+        except (httpx.HTTPStatusError, httpx.RequestError) as e:
+            report.error = f"無法獲取串流列表: {e}"
+        finally:
+            report.results.extend(await asyncio.gather(*tasks))
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def move_csv_rows(source: Profile, target: Profile, stream_ids: set[str]) -> int:
+    """把已搬移的攝影機從來源的 CSV 移到目的地的 CSV, 之後的 plan / apply 才不會把它們搬回去"""
+    source_path, target_path = Path(source.streams_csv), Path(target.streams_csv)
+    if not stream_ids or not source_path.exists():
+        return 0
+    with open(source_path, newline="") as f:
+        reader = csv.DictReader(f)
+        fieldnames, rows = reader.fieldnames or [], list(reader)
+    moved = [r for r in rows if ams_client.generate_stream_id(r["code"]) in stream_ids]
+    if not moved:
+        return 0
+    target_fieldnames, target_rows = fieldnames, []
+    if target_path.exists():
+        with open(target_path, newline="") as f:
+            reader = csv.DictReader(f)
+            target_fieldnames, target_rows = reader.fieldnames or fieldnames, list(reader)
+
+    for path, names, content in (
+        (source_path, fieldnames, [r for r in rows if r not in moved]),
+        (target_path, target_fieldnames, target_rows + moved),
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=names, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(content)
+    return len(moved)
+
+
+@app.command()
+def migrate(
+    source_name: str = typer.Option(..., "--from", help="來源 profile"),
+    target_name: str = typer.Option(..., "--to", help="目的地 profile"),
+    concurrency: int = concurrency_option(),
+    in_flight: int = typer.Option(MIGRATE_IN_FLIGHT, "--in-flight", min=1, help="同時搬移中 (兩台都在拉流) 的串流數上限"),
+    verify_timeout: float = typer.Option(
+        MIGRATE_VERIFY_TIMEOUT, "--verify-timeout", min=1, help="目的地建立後等待進入 broadcasting 的秒數"
+    ),
+    max_active: int | None = typer.Option(
+        None, "--max-active", min=1, help="目的地活躍直播數上限, 達到時其餘串流留在來源; 預設為目的地 profile 的容量"
+    ),
+    update_csv: bool = typer.Option(True, "--update-csv/--no-update-csv", help="把搬移成功的攝影機從來源的 CSV 移到目的地的 CSV"),
+    prefix: str | None = prefix_option(),
+    regex: str | None = regex_option(),
+    status: str | None = status_option(),
+    stream_type: str | None = type_filter_option(),
+    codes: Path | None = codes_option(),
+):
+    """把 (符合條件的) 串流以相同的 streamId 與設定搬到另一台伺服器, 目的地開始直播後才刪除來源
+
+    中斷後以相同的命令再執行一次即可: 已在目的地的串流不會重複建立, 已刪除的來源不會再列出。
+    """
+    if source_name == target_name:
+        raise typer.BadParameter("來源與目的地相同", param_hint="--to")
+    selector = build_selector(prefix, regex, status, stream_type, codes)
+    selected = select_profiles(f"{source_name},{target_name}")
+    source_profile, target_profile = selected[source_name], selected[target_name]
+    limit = max_active or target_profile.capacity
+
+    async def run() -> ProfileReport:
+        with ams_cache.InventoryCache(source_name) as source_cache, ams_cache.InventoryCache(target_name) as target_cache:
+            async with async_client(source_profile, concurrency) as source_client, \
+                    async_client(target_profile, concurrency) as target_client:
+                return await execute_migrate(
+                    MigrateSide(source_name, source_profile, source_client, source_cache),
+                    MigrateSide(target_name, target_profile, target_client, target_cache),
+                    selector, in_flight, verify_timeout, limit,
+                )
+
+    report = asyncio.run(run())
+    print_reports([report])
+    if update_csv:
+        moved = {r.stream_id for r in report.results if r.success}
+        if count := move_csv_rows(source_profile, target_profile, moved):
+            print(f"已將 {count} 台攝影機從 {source_profile.streams_csv} 移到 {target_profile.streams_csv}")
+
+
+# --- serve ---
+
+
+@app.command()
+def serve(
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = concurrency_option(),
+    socket_path: Path | None = typer.Option(None, "--socket", help="Unix socket 的路徑 (預設同 amsctl.py)"),
+    host: str = typer.Option("127.0.0.1", "--host", help="以 HTTP 提供 API 時的監聽位址 (API 沒有身分驗證, 只接受本機位址)"),
+    port: int | None = typer.Option(None, "--port", help="以 HTTP 提供 API (取代 Unix socket)"),
+    refresh_interval: float = typer.Option(30.0, "--refresh-interval", min=1, help="背景重新取得串流列表的秒數"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="不詢問確認 (供 systemd 等背景執行)"),
+):
+    """常駐執行: 保持連線與串流列表, 透過本機 socket 提供操作 (以 amsctl.py 呼叫)"""
+    from amsctl import DEFAULT_SOCKET
+    from ams_serve import Daemon, is_loopback
+
+    if port is not None and not is_loopback(host):
+        raise typer.BadParameter("API 沒有身分驗證, 只能監聽本機位址 (127.0.0.1 / ::1 / localhost)", param_hint="--host")
+    selected = select_profiles(profiles_spec or "all", confirm=not yes)
+
+    async def run():
+        await Daemon(selected, concurrency, refresh_interval).serve(socket_path or Path(DEFAULT_SOCKET), host, port)
+
+    asyncio.run(run())
+
+
+# --- watch ---
+
+WATCH_INTERVAL = 5.0  # 秒, 重新列表與有問題串流的診斷間隔
+WATCH_MAX_INTERVAL = 120.0  # 秒, 持續健康的串流最長的診斷間隔
+WATCH_HIGHLIGHT = 30.0  # 秒, 變動過的串流在畫面上保留的時間
+
+
+@dataclass
+class Diagnosis:
+    status: str
+    viewers: tuple[int, ...] | None = None
+    camera_error: str | None = None
+    error: str | None = None  # 查詢本身失敗
+
+    @property
+    def healthy(self) -> bool:
+        return self.status == "broadcasting" and not self.camera_error and not self.error
+
+    @property
+    def health(self) -> tuple:
+        """影響輪詢間隔的部分 (觀眾數變動不算)"""
+        return self.status, self.camera_error, self.error
+
+
+async def diagnose(client: httpx.AsyncClient, stream: dict) -> Diagnosis:
+    """同時查詢觀看統計與 (IP Camera / 串流來源的) 錯誤訊息, 串流狀態取自列表"""
+    stream_id = stream["streamId"]
+    calls = [client.get(f"/broadcasts/{stream_id}/broadcast-statistics")]
+    if stream.get("type") in CAMERA_TYPES:
+        calls.append(client.get(f"/broadcasts/{stream_id}/ip-camera-error"))
+    resps = await asyncio.gather(*calls, return_exceptions=True)
+    diagnosis = Diagnosis(stream.get("status", "unknown"))
+    if failed := [r for r in resps if isinstance(r, BaseException)]:
+        diagnosis.error = f"{type(failed[0]).__name__}: {failed[0]}"
+        return diagnosis
+    try:
+        diagnosis.viewers = ams_client.parse_viewers(resps[0])
+        if len(resps) > 1:
+            diagnosis.camera_error = ams_client.parse_camera_error(resps[1])
+    except ValueError:  # 回應不是 JSON
+        diagnosis.error = "回應格式錯誤"
+    return diagnosis
+
+
+@dataclass
+class WatchedStream:
+    profile: str
+    stream: dict
+    sample: Diagnosis | None = None
+    interval: float = WATCH_INTERVAL
+    due: float = 0.0  # 下次診斷的時間 (monotonic)
+    changed_at: float = 0.0
+
+
+@dataclass
+class WatchView:
+    """watch 的畫面狀態: 只保留有問題或最近變動的串流, 有變動時才重畫"""
+    streams: dict[tuple[str, str], WatchedStream] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)  # profile → 列表失敗的原因
+    live: bool = True  # 終端機中即時重畫; 否則逐行輸出變動
+    dirty: bool = True
+
+    def changed(self, w: WatchedStream, before: Diagnosis | None):
+        after = w.sample
+        self.dirty = True
+        if before is None and (after is None or after.healthy):
+            return  # 第一次診斷就是健康的, 不算變動
+        w.changed_at = time.monotonic()
+        if self.live or (before and after and before.health == after.health):
             return
+        # 非終端機 (例如輸出到記錄檔) 時只輸出健康狀態的變動
+        old = f"{before.status} {before.camera_error or ''}" if before else "-"
+        new = f"{after.status} {after.error or after.camera_error or ''}" if after else "已移除"
+        print(f"{time.strftime('%H:%M:%S')} [{w.profile}] {w.stream.get('name')} {old.strip()} → {new.strip()}", flush=True)
 
-        stream = resp.json()
-        rprint("\n--- 串流詳細資訊 ---", stream)
-
-        # 觀看統計
-        stats_resp = client.get(f"/broadcasts/{stream_id}/broadcast-statistics")
-        if stats_resp.status_code == 200:
-            stats = stats_resp.json()
-            print(f"\n觀眾: HLS={stats.get('totalHLSWatchersCount', 0)} WebRTC={stats.get('totalWebRTCWatchersCount', 0)} "
-                  f"RTMP={stats.get('totalRTMPWatchersCount', 0)} DASH={stats.get('totalDASHWatchersCount', 0)}")
-
-        # IP Camera 錯誤檢查
-        if stream.get("type") in ["ipCamera", "streamSource"]:
-            err_resp = client.get(f"/broadcasts/{stream_id}/ip-camera-error")
-            if err_resp.status_code == 200:
-                err = err_resp.json()
-                # 注意: /ip-camera-error API 的回應中, 'success' 為 true 表示「成功獲取到錯誤訊息」,
-                # 亦即串流本身有錯誤。這與其他 API 的 'success' 欄位含義相反。
-                if err.get("success"):
-                    print(typer.style(f"錯誤: {err.get('message', 'N/A')}", fg=typer.colors.RED))
-                else:
-                    print(typer.style("無錯誤", fg=typer.colors.GREEN))
-    except httpx.RequestError as e:
-        print(typer.style(f"網路請求失敗: {e}", fg=typer.colors.RED, bold=True))
+    def render(self, height: int) -> rich_table.Table:
+        now = time.monotonic()
+        summary = Counter()
+        rows = []
+        for w in self.streams.values():
+            healthy = w.sample is None or w.sample.healthy
+            summary[w.profile, healthy] += 1
+            if not healthy or now - w.changed_at < WATCH_HIGHLIGHT:
+                rows.append(w)
+        rows.sort(key=lambda w: (w.sample is None or w.sample.healthy, w.profile, w.stream.get("name", "")))
+
+        profiles_line = "  ".join(
+            f"{name}: [green]{summary[name, True]}[/] [red]{summary[name, False]}[/]"
+            + (f" [yellow]({self.errors[name]})[/]" if name in self.errors else "")
+            for name in sorted({w.profile for w in self.streams.values()} | set(self.errors))
+        )
+        table = rich_table.Table("profile", "name", "type", "status", "觀眾", "錯誤", "間隔", title=profiles_line)
+        limit = max(1, height - 8)
+        for w in rows[:limit]:
+            d = w.sample
+            recent = now - w.changed_at < WATCH_HIGHLIGHT
+            table.add_row(
+                w.profile, w.stream.get("name", ""), w.stream.get("type", ""),
+                f"[{'green' if d.healthy else 'red'}]{d.status}" if d else "",
+                str(sum(d.viewers)) if d and d.viewers else "-",
+                (d.error or d.camera_error or "") if d else "",
+                f"{w.interval:.0f}s", style="bold" if recent else None,
+            )
+        if len(rows) > limit:
+            table.caption = f"... 另有 {len(rows) - limit} 個串流"
+        self.dirty = False
+        return table
+
+
+async def watch_profile(
+    name: str, profile: Profile, view: WatchView, concurrency: int, interval: float, max_interval: float
+):
+    """定期重新列表, 並依各串流的間隔併發診斷; 健康的串流間隔加倍, 有問題或狀態改變時回到最短間隔"""
+
+    async def probe(w: WatchedStream, sem: asyncio.Semaphore):
+        async with sem:
+            sample = await diagnose(client, w.stream)
+        before = w.sample
+        w.sample = sample
+        if sample.healthy and before is not None and before.health == sample.health:
+            w.interval = min(max_interval, w.interval * 2)
+        else:
+            w.interval = interval
+        # 加上隨機量, 避免同一批串流永遠在同一時間被診斷
+        w.due = time.monotonic() + w.interval * random.uniform(0.8, 1.0)
+        if before is None or before.health != sample.health or before.viewers != sample.viewers:
+            view.changed(w, before)
+
+    sem = asyncio.Semaphore(concurrency)
+    with ams_cache.InventoryCache(name) as cache:
+        async with async_client(profile, concurrency) as client:
+            while True:
+                tick = time.monotonic()
+                try:
+                    listed = await fetch_streams(client, cache, refresh=True)
+                except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                    view.errors[name] = f"無法獲取串流列表: {type(e).__name__}"
+                    view.dirty = True
+                    await asyncio.sleep(interval)
+                    continue
+                if view.errors.pop(name, None):
+                    view.dirty = True
+
+                current = {s["streamId"]: s for s in listed}
+                for stream_id, stream in current.items():
+                    w = view.streams.get((name, stream_id))
+                    if w is None:
+                        view.streams[name, stream_id] = WatchedStream(name, stream)
+                        continue
+                    if w.stream.get("status") != stream.get("status"):
+                        # 列表中的狀態已改變, 不等間隔立刻診斷
+                        w.due = 0.0
+                        w.interval = interval
+                    w.stream = stream
+                for key in [k for k in view.streams if k[0] == name and k[1] not in current]:
+                    w = view.streams.pop(key)
+                    before, w.sample = w.sample, None
+                    view.changed(w, before)
+
+                now = time.monotonic()
+                due = [w for (p, _), w in view.streams.items() if p == name and w.due <= now]
+                await asyncio.gather(*(probe(w, sem) for w in due))
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - tick)))
+
+
+@app.command()
+def watch(
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = typer.Option(4, "--concurrency", "-c", min=1, help="每台伺服器同時進行的診斷請求數"),
+    interval: float = typer.Option(WATCH_INTERVAL, "--interval", min=1, help="重新列表與有問題串流的診斷間隔 (秒)"),
+    max_interval: float = typer.Option(WATCH_MAX_INTERVAL, "--max-interval", min=1, help="健康串流最長的診斷間隔 (秒)"),
+):
+    """持續監看串流狀態、觀眾數與 IP Camera 錯誤, 直到按下 Ctrl+C"""
+    selected = select_profiles(profiles_spec)
+    console = rich_console.Console()
+    view = WatchView(live=console.is_terminal)
+
+    async def run():
+        tasks = [
+            asyncio.create_task(watch_profile(n, p, view, concurrency, interval, max(interval, max_interval)))
+            for n, p in selected.items()
+        ]
+        if not view.live:
+            await asyncio.gather(*tasks)
+            return
+        with rich_live.Live(console=console, auto_refresh=False, screen=False) as live:
+            while not any(t.done() for t in tasks):
+                if view.dirty:
+                    live.update(view.render(console.height), refresh=True)
+                await asyncio.sleep(0.5)
+        await asyncio.gather(*tasks)  # 讓例外浮現
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("已停止監看")
+
+
+# --- heal ---
+
+HEAL_WAVE = 10  # 第一波重啟的串流數
+HEAL_MAX_WAVE = 200
+HEAL_VERIFY_TIMEOUT = 30.0  # 秒, 重啟後等待進入 broadcasting 的時間
+HEAL_POLL = 2.0  # 秒, 驗證時查詢狀態的間隔
+HEAL_BACKOFF = 60.0  # 秒, 重啟失敗的串流在 --loop 中再次嘗試前的等待時間 (每次失敗加倍)
+HEAL_MAX_BACKOFF = 3600.0
+
+
+async def find_broken(
+    client: ams_client.AsyncAMSClient,
+    cache: ams_cache.InventoryCache,
+    concurrency: int,
+    include_stopped: bool,
+    check_broadcasting: bool,
+) -> list[tuple[dict, str]]:
+    """找出需要重啟的 ipCamera / streamSource 串流, 回傳 (串流, 原因)
+
+    狀態為 error/failed, 或 /ip-camera-error 回報錯誤的串流視為故障; finished/created 且沒有錯誤訊息的串流
+    可能是被刻意停止的, 只有 include_stopped 時才重啟。broadcasting 的串流預設不檢查。
+    """
+    streams = await fetch_streams(client, cache, refresh=True)
+    candidates = [
+        s for s in streams
+        if s.get("type") in CAMERA_TYPES and (check_broadcasting or s.get("status") != "broadcasting")
+    ]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def check(s: dict) -> tuple[dict, str] | None:
+        async with sem:
+            try:
+                error = ams_client.parse_camera_error(await client.get(f"/broadcasts/{s['streamId']}/ip-camera-error"))
+            except (httpx.RequestError, ValueError):
+                error = None
+        status = s.get("status", "unknown")
+        if error:
+            return s, error
+        if status in ("error", "failed") or (include_stopped and status != "broadcasting"):
+            return s, f"status {status}"
+        return None
+
+    return [b for b in await asyncio.gather(*(check(s) for s in candidates)) if b]
+
+
+async def heal_wave(
+    client: ams_client.AsyncAMSClient, cache: ams_cache.InventoryCache, wave: list[dict], concurrency: int, verify_timeout: float
+) -> list[BulkResult]:
+    """重啟一波串流, 並等待每個串流進入 broadcasting; 只有確實開始直播的才算成功"""
+    started: list[BulkResult] = []
+    await execute_ops(client, iter_list([start_op(s["streamId"]) for s in wave]), concurrency, started)
+    results = {r.stream_id: r for r in started}
+    pending = {r.stream_id: "unknown" for r in started if r.success}
+    sem = asyncio.Semaphore(concurrency)
+
+    async def status(stream_id: str):
+        async with sem:
+            try:
+                resp = await client.get(f"/broadcasts/{stream_id}")
+                if resp.status_code == 200:
+                    pending[stream_id] = resp.json().get("status", "unknown")
+            except (httpx.RequestError, ValueError):
+                pass
+
+    deadline = time.monotonic() + verify_timeout
+    while pending and time.monotonic() < deadline:
+        await asyncio.sleep(HEAL_POLL)
+        await asyncio.gather(*(status(stream_id) for stream_id in pending))
+        for stream_id in [i for i, st in pending.items() if st == "broadcasting"]:
+            del pending[stream_id]
+            cache.update(stream_id, status="broadcasting")
+    for stream_id, last in pending.items():
+        results[stream_id] = BulkResult(stream_id, False, f"{verify_timeout:.0f} 秒內未進入 broadcasting (狀態 {last})")
+        cache.update(stream_id, status=last)
+    return [results[s["streamId"]] for s in wave]
+
+
+@dataclass
+class HealState:
+    """單一伺服器在 --loop 之間保留的狀態"""
+    wave: int = HEAL_WAVE
+    failures: Counter = field(default_factory=Counter)  # streamId → 連續重啟失敗次數
+    retry_at: dict[str, float] = field(default_factory=dict)  # streamId → 可再次嘗試的時間
+
+
+async def heal_profile(
+    name: str,
+    profile: Profile,
+    state: HealState,
+    concurrency: int,
+    max_wave: int,
+    max_active: int | None,
+    verify_timeout: float,
+    include_stopped: bool,
+    check_broadcasting: bool,
+) -> ProfileReport:
+    """找出故障串流並分波重啟
+
+    每一波之後比較活躍直播數的增加量: 增加量與成功數相符表示伺服器跟得上, 下一波加倍;
+    否則 (其他串流因負載掉線) 減半。攝影機本身連不上而失敗的串流不影響波的大小。
+    """
+    report = ProfileReport(name)
+    start = time.perf_counter()
+    with ams_cache.InventoryCache(name) as cache:
+        async with async_client(profile, concurrency) as client:
+            try:
+                broken = await find_broken(client, cache, concurrency, include_stopped, check_broadcasting)
+            except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                report.error = f"無法獲取串流列表: {e}"
+                return report
+            now = time.monotonic()
+            queue = [s for s, _ in broken if state.retry_at.get(s["streamId"], 0) <= now]
+            if skipped := len(broken) - len(queue):
+                print(f"[{name}] {skipped} 個串流最近重啟失敗, 稍後再試")
+            reasons = {s["streamId"]: reason for s, reason in broken}
+
+            while queue:
+                active = await client.active_count()
+                size = min(state.wave, max_wave)
+                if max_active is not None and active is not None:
+                    size = min(size, max_active - active)
+                    if size <= 0:
+                        print(f"[{name}] 活躍直播數 {active} 已達上限 {max_active}, 停止重啟")
+                        break
+                wave, queue = queue[:size], queue[size:]
+                results = await heal_wave(client, cache, wave, concurrency, verify_timeout)
+                healed = sum(r.success for r in results)
+                after = await client.active_count()
+
+                if active is not None and after is not None and healed:
+                    if after - active >= healed * 0.8:
+                        state.wave = min(max_wave, state.wave * 2)
+                    else:
+                        state.wave = max(1, state.wave // 2)
+                print(f"[{name}] 重啟 {len(wave)} 個, 成功 {healed}, 活躍直播 {active} → {after}, 下一波 {state.wave}")
+
+                for r in results:
+                    if r.success:
+                        state.failures.pop(r.stream_id, None)
+                        state.retry_at.pop(r.stream_id, None)
+                    else:
+                        r.msg = f"{r.msg} (原因: {reasons[r.stream_id]})"
+                        state.failures[r.stream_id] += 1
+                        backoff = min(HEAL_MAX_BACKOFF, HEAL_BACKOFF * 2 ** (state.failures[r.stream_id] - 1))
+                        state.retry_at[r.stream_id] = time.monotonic() + backoff
+                report.results.extend(results)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+@app.command()
+def heal(
+    profiles_spec: str | None = profiles_option(),
+    concurrency: int = concurrency_option(),
+    wave: int = typer.Option(HEAL_WAVE, "--wave", min=1, help="第一波重啟的串流數, 之後依活躍直播數的變化調整"),
+    max_wave: int = typer.Option(HEAL_MAX_WAVE, "--max-wave", min=1, help="每一波最多重啟的串流數"),
+    max_active: int | None = typer.Option(None, "--max-active", min=1, help="伺服器活躍直播數上限, 達到時停止重啟"),
+    verify_timeout: float = typer.Option(HEAL_VERIFY_TIMEOUT, "--verify-timeout", min=1, help="重啟後等待進入 broadcasting 的秒數"),
+    include_stopped: bool = typer.Option(False, "--include-stopped", help="也重啟沒有錯誤訊息的 finished/created 串流"),
+    check_broadcasting: bool = typer.Option(False, "--check-broadcasting", help="也檢查 broadcasting 串流的 IP Camera 錯誤"),
+    loop: bool = typer.Option(False, "--loop", help="持續執行, 直到按下 Ctrl+C"),
+    every: float = typer.Option(30.0, "--every", min=1, help="--loop 時每一輪的間隔秒數"),
+):
+    """只重啟故障的 ipCamera / streamSource 串流, 分波進行並確認恢復直播"""
+    selected = select_profiles(profiles_spec)
+    states = {name: HealState(wave=wave) for name in selected}
+
+    async def run_round() -> list[ProfileReport]:
+        return await asyncio.gather(*(
+            heal_profile(n, p, states[n], concurrency, max_wave, max_active, verify_timeout, include_stopped,
+                         check_broadcasting)
+            for n, p in selected.items()
+        ))
+
+    async def run():
+        while True:
+            reports = await run_round()
+            if any(r.results or r.error for r in reports):
+                print_reports(reports)
+            elif loop:
+                print(f"{time.strftime('%H:%M:%S')} 沒有需要重啟的串流")
+            if not loop:
+                return
+            await asyncio.sleep(every)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("已停止")
+
+
+# --- run ---
+
+JOB_VERIFY_TIMEOUT = 300.0  # 秒, verify 步驟等待所有串流進入 broadcasting 的時間
+JOB_VERIFY_POLL = 5.0  # 秒, verify 步驟重新列表的間隔
+JOB_SELECT_KEYS = {"prefix", "regex", "status", "type", "codes"}
+# action → 可用的參數 (id、action、needs、allow_failure、concurrency 為共用); 說明見 README
+JOB_ACTIONS = {
+    "start": {"profile", "max_failures", *JOB_SELECT_KEYS},
+    "stop": {"profile", "max_failures", *JOB_SELECT_KEYS},
+    "delete": {"profile", "max_failures", "batch_size", *JOB_SELECT_KEYS},
+    "create": {"profile", "max_failures", "stream_type", "prefix", "regex", "codes"},  # CSV 的 payload 沒有 status/type 可比對
+    "apply": {"profile", "max_failures", "stream_type", "prune"},
+    "migrate": {
+        "from", "to", "max_failures", "in_flight", "verify_timeout", "max_active", "update_csv", *JOB_SELECT_KEYS
+    },
+    "verify": {"profile", "max_failures", "timeout", *JOB_SELECT_KEYS},
+    "heal": {"profile", "max_failures", "wave", "max_wave", "max_active", "verify_timeout", "include_stopped"},
+}
+JOB_STATUS_STYLES = {"ok": ("成功", "green"), "failed": ("失敗", "red"), "skipped": ("略過", "yellow")}
+
+
+@dataclass
+class JobStep:
+    """檢查過參數、可以執行的步驟"""
+    target: str  # profile, migrate 為 "來源 → 目的地"
+    condition: str  # 選擇條件或其他參數的說明
+    max_failures: int  # 失敗的串流數不超過此數時步驟仍算成功
+    run: Callable[[rich_progress.Progress], Awaitable[ProfileReport]]
+    profiles: tuple[str, ...]  # 步驟會寫入快取的 profile; 同一 profile 的步驟依序執行
+
+
+def step_param(step: ams_jobs.Step, key: str, kind: type | tuple, default=None):
+    """取得步驟的參數並檢查型別; default 為 None 且未設定時視為必要參數"""
+    value = step.params.get(key, default)
+    if value is None:
+        raise ams_jobs.JobError(f"步驟 {step.id}: 缺少 {key}")
+    if not isinstance(value, kind) or (isinstance(value, bool) and kind is not bool):
+        raise ams_jobs.JobError(f"步驟 {step.id}: {key} 的型別錯誤 ({value!r})")
+    return value
+
+
+def step_profile(step: ams_jobs.Step, key: str = "profile") -> tuple[str, Profile]:
+    name = step_param(step, key, str)
+    if name not in profiles:
+        raise ams_jobs.JobError(f"步驟 {step.id}: Profile not found: {name}")
+    return name, profiles[name]
+
+
+def step_selector(step: ams_jobs.Step) -> Selector:
+    p = step.params
+    codes = p.get("codes")
+    try:
+        return build_selector(
+            p.get("prefix"), p.get("regex"), p.get("status"), p.get("type"), Path(codes) if codes else None,
+            announce=False,
+        )
+    except (typer.BadParameter, OSError) as e:
+        raise ams_jobs.JobError(f"步驟 {step.id}: {e}") from e
+
+
+def step_stream_type(step: ams_jobs.Step) -> str:
+    stream_type = step_param(step, "stream_type", str, "ipcam")
+    if stream_type not in ("ipcam", "source"):
+        raise ams_jobs.JobError(f"步驟 {step.id}: stream_type 必須是 'ipcam' 或 'source'")
+    return stream_type
+
+
+async def verify_streams(
+    name: str, profile: Profile, selector: Selector, timeout: float, progress: rich_progress.Progress, description: str
+) -> ProfileReport:
+    """重新列表直到符合條件的串流都在 broadcasting 或逾時; 每個串流的最後狀態記為一筆結果"""
+    report = ProfileReport(name)
+    start = time.perf_counter()
+    task = progress.add_task(f"{name} {description}", total=None, failed=0)
+    deadline = time.monotonic() + timeout
+    with ams_cache.InventoryCache(name) as cache:
+        async with async_client(profile) as client:
+            while True:
+                try:
+                    streams = await fetch_streams(client, cache, refresh=True, selector=selector)
+                except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                    report.error = f"無法獲取串流列表: {e}"
+                    break
+                live = sum(s.get("status") == "broadcasting" for s in streams)
+                progress.update(task, total=len(streams), completed=live, failed=len(streams) - live)
+                if (streams and live == len(streams)) or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(min(JOB_VERIFY_POLL, deadline - time.monotonic()))
+    if not report.error:
+        if not streams:
+            report.error = "沒有符合條件的串流"
+        report.results = [
+            BulkResult(s["streamId"], s.get("status") == "broadcasting", f"{timeout:.0f} 秒內未進入 broadcasting (狀態 {s.get('status')})")
+            for s in streams
+        ]
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def prepare_step(step: ams_jobs.Step, job: ams_jobs.Job) -> JobStep:
+    """檢查步驟的參數並建立執行它的函式; 參數錯誤時引發 JobError, 因此執行前就能發現所有錯誤"""
+    concurrency = step.concurrency or job.concurrency
+    max_failures = step_param(step, "max_failures", int, 0)
+    if step.action == "migrate":
+        source_name, source = step_profile(step, "from")
+        target_name, target = step_profile(step, "to")
+        if source_name == target_name:
+            raise ams_jobs.JobError(f"步驟 {step.id}: 來源與目的地相同")
+        selector = step_selector(step)
+        in_flight = step_param(step, "in_flight", int, MIGRATE_IN_FLIGHT)
+        verify_timeout = step_param(step, "verify_timeout", (int, float), MIGRATE_VERIFY_TIMEOUT)
+        max_active = step_param(step, "max_active", int, target.capacity)
+        update_csv = step_param(step, "update_csv", bool, True)
+
+        async def run_migrate(progress: rich_progress.Progress) -> ProfileReport:
+            with ams_cache.InventoryCache(source_name) as source_cache, ams_cache.InventoryCache(target_name) as target_cache:
+                async with async_client(source, concurrency) as source_client, \
+                        async_client(target, concurrency) as target_client:
+                    report = await execute_migrate(
+                        MigrateSide(source_name, source, source_client, source_cache),
+                        MigrateSide(target_name, target, target_client, target_cache),
+                        selector, in_flight, verify_timeout, max_active, progress,
+                    )
+            if update_csv:
+                move_csv_rows(source, target, {r.stream_id for r in report.results if r.success})
+            return report
+
+        return JobStep(
+            f"{source_name} → {target_name}", str(selector), max_failures, run_migrate, (source_name, target_name)
+        )
+
+    name, profile = step_profile(step)
+    selected = {name: profile}
+
+    def bulk(build_ops: BuildOps, description: str, selector: Selector | None = None, **kwargs):
+        async def run_bulk_step(progress: rich_progress.Progress) -> ProfileReport:
+            reports = await execute_bulk(
+                selected, build_ops, f"{step.id} {description}", concurrency, ttl=job.ttl, selector=selector,
+                progress=progress, **kwargs,
+            )
+            return reports[0]
+
+        return run_bulk_step
+
+    if step.action in ("start", "stop", "delete"):
+        selector = step_selector(step)
+        make_op, description = {
+            "start": (start_op, "starting"), "stop": (stop_op, "stopping"), "delete": (delete_op, "deleting")
+        }[step.action]
+
+        async def build_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+            async for s in streams:
+                yield make_op(s["streamId"])
+
+        if step.action == "delete":
+            kwargs = dict(until_empty=True, batch_size=step_param(step, "batch_size", int, BULK_BATCH))
+        else:
+            kwargs = {}
+        return JobStep(name, str(selector), max_failures, bulk(build_ops, description, selector, **kwargs), (name,))
+
+    if step.action == "create":
+        stream_type = step_stream_type(step)
+        selector = step_selector(step)
+
+        async def build_create_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+            existing_ids = {s["streamId"] async for s in streams}
+            for payload in read_payloads(profile, stream_type):
+                if payload["streamId"] not in existing_ids and selector.matches(payload):
+                    yield create_op(payload)
+
+        return JobStep(name, f"{stream_type}, {selector}", max_failures, bulk(build_create_ops, f"creating ({stream_type})"), (name,))
+
+    if step.action == "apply":
+        stream_type = step_stream_type(step)
+        prune = step_param(step, "prune", bool, True)
+        changes: list[Change] = []
+
+        async def build_apply_ops(profile: Profile, streams: AsyncIterator[dict]) -> AsyncIterator[BulkOp]:
+            for change in changes:
+                yield change.to_op()
+
+        apply_ops = bulk(build_apply_ops, "applying", batch_size=BULK_BATCH)
+
+        async def run_apply(progress: rich_progress.Progress) -> ProfileReport:
+            changes.extend(await compute_plan(name, profile, stream_type, prune, job.ttl, False))
+            return await apply_ops(progress)
+
+        return JobStep(name, f"{stream_type}, {'prune' if prune else 'keep-extra'}", max_failures, run_apply, (name,))
+
+    if step.action == "verify":
+        selector = step_selector(step)
+        timeout = step_param(step, "timeout", (int, float), JOB_VERIFY_TIMEOUT)
+
+        async def run_verify(progress: rich_progress.Progress) -> ProfileReport:
+            return await verify_streams(name, profile, selector, timeout, progress, f"{step.id} verifying")
+
+        return JobStep(name, f"{selector}, {timeout:.0f} 秒內", max_failures, run_verify, (name,))
+
+    # heal
+    state = HealState(wave=step_param(step, "wave", int, HEAL_WAVE))
+    max_wave = step_param(step, "max_wave", int, HEAL_MAX_WAVE)
+    max_active = step_param(step, "max_active", int) if "max_active" in step.params else None
+    verify_timeout = step_param(step, "verify_timeout", (int, float), HEAL_VERIFY_TIMEOUT)
+    include_stopped = step_param(step, "include_stopped", bool, False)
+
+    async def run_heal(progress: rich_progress.Progress) -> ProfileReport:
+        return await heal_profile(
+            name, profile, state, concurrency, max_wave, max_active, verify_timeout, include_stopped, False
+        )
+
+    return JobStep(name, "包含停止的串流" if include_stopped else "故障的串流", max_failures, run_heal, (name,))
+
+
+def step_outcome(report: ProfileReport, max_failures: int) -> tuple[bool, str]:
+    if report.error:
+        return False, report.error
+    if not report.results:
+        return True, "沒有需要處理的串流"
+    failed = len(report.failed)
+    detail = f"成功 {len(report.results) - failed}/{len(report.results)}"
+    return failed <= max_failures, detail + (f", 容許失敗 {max_failures}" if failed and max_failures else "")
+
+
+def print_job_plan(job: ams_jobs.Job, prepared: dict[str, JobStep]):
+    print(f"--- 工作: {job.name} (on_failure={job.on_failure}, parallel={job.parallel or '不限'}) ---")
+    table = rich_table.Table("階段", "步驟", "動作", "目標", "條件", "依賴")
+    for level, step_ids in enumerate(ams_jobs.levels(job), 1):
+        for step_id in step_ids:
+            step = job.steps[step_id]
+            needs = ", ".join(step.needs) + (" [yellow](允許失敗)" if step.allow_failure else "")
+            table.add_row(
+                str(level), step_id, step.action, prepared[step_id].target,
+                rich_markup.escape(prepared[step_id].condition), needs,
+            )
+    rich.print(table)
+
+
+def print_job_summary(job: ams_jobs.Job, prepared: dict[str, JobStep], outcomes: dict, elapsed: float):
+    table = rich_table.Table("步驟", "動作", "目標", "結果", "耗時", "說明")
+    for step_id, step in job.steps.items():
+        outcome = outcomes[step_id]
+        label, style = JOB_STATUS_STYLES[outcome.status]
+        took = f"{outcome.elapsed:.1f}s" if outcome.status != "skipped" else "-"
+        table.add_row(
+            step_id, step.action, prepared[step_id].target, f"[{style}]{label}", took, rich_markup.escape(outcome.detail)
+        )
+    rich.print(table)
+    path, critical = ams_jobs.critical_path(job, outcomes)
+    print(f"總耗時 {elapsed:.1f}s, 關鍵路徑 {' → '.join(path)} ({critical:.1f}s)")
+
+
+@app.command("run")
+def run_job_file(
+    job_file: Path = typer.Argument(..., exists=True, dir_okay=False, help="工作檔 (TOML), 格式見 README"),
+    dry_run: bool = typer.Option(False, "--dry-run", help="只檢查工作檔並列出執行順序, 不執行"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="不確認直接執行 (無人值守)"),
+):
+    """依工作檔執行跨 profile 的多個步驟, 依賴都完成的步驟立即開始, 互不相依的步驟同時執行
+
+    所有步驟共用各 profile 的串流列表快取 (有效秒數為工作檔的 ttl), 前面步驟的結果會寫回快取;
+    為了不讓一個步驟重新整理快取時蓋掉另一個步驟的寫入, 同一 profile 的步驟不會同時執行。
+    有步驟失敗或被略過時結束碼為 1。
+    """
+    try:
+        job = ams_jobs.load_job(job_file, JOB_ACTIONS)
+        prepared = {step_id: prepare_step(step, job) for step_id, step in job.steps.items()}
+    except ams_jobs.JobError as e:
+        raise typer.BadParameter(str(e), param_hint="JOB_FILE")
+    print_job_plan(job, prepared)
+    if dry_run:
+        return
+    if not yes:
+        typer.confirm("請確認以上步驟正確無誤, 確認執行?", abort=True)
+
+    reports: list[ProfileReport] = []
+
+    async def run() -> dict:
+        locks = {name: asyncio.Lock() for p in prepared.values() for name in p.profiles}
+        with bulk_progress() as progress:
+
+            async def run_step(step: ams_jobs.Step) -> tuple[bool, str]:
+                names = sorted(set(prepared[step.id].profiles))  # 固定順序取得, 避免 migrate 互相等待
+                if busy := [name for name in names if locks[name].locked()]:
+                    print(f"{time.strftime('%H:%M:%S')} {step.id} 等待 {', '.join(busy)} 上進行中的步驟")
+                async with contextlib.AsyncExitStack() as stack:
+                    for name in names:
+                        await stack.enter_async_context(locks[name])
+                    report = await prepared[step.id].run(progress)
+                report.name = step.id
+                reports.append(report)
+                return step_outcome(report, prepared[step.id].max_failures)
+
+            def on_start(step: ams_jobs.Step):
+                print(f"{time.strftime('%H:%M:%S')} 開始 {step.id} ({step.action} {prepared[step.id].target})")
+
+            def on_finish(step: ams_jobs.Step, outcome: ams_jobs.StepOutcome):
+                label, style = JOB_STATUS_STYLES[outcome.status]
+                line = f"{time.strftime('%H:%M:%S')} {label} {step.id}: {outcome.detail}"
+                if outcome.status != "skipped":
+                    line += f" ({outcome.elapsed:.1f}s)"
+                print(typer.style(line, fg=style))
+
+            return await ams_jobs.run_job(job, run_step, on_start, on_finish)
+
+    start = time.perf_counter()
+    outcomes = asyncio.run(run())
+    print_failures(reports)
+    print_job_summary(job, prepared, outcomes, time.perf_counter() - start)
+    if any(o.status == "skipped" or (o.status == "failed" and not job.steps[i].allow_failure) for i, o in outcomes.items()):
+        raise typer.Exit(1)
 
 
 if __name__ == "__main__":
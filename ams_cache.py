@@ -0,0 +1,169 @@
+"""
+每個 profile 的串流列表本機快取 (SQLite)
+
+快取以頁為單位保存 /broadcasts/list 的結果與每頁的摘要; 重新整理時內容沒變的頁不會重寫。
+本工具自己做的建立/刪除/啟動/停止會直接更新快取, 讓快取在 TTL 內保持可信。
+串流物件中有攝影機的帳號密碼, 快取檔只有自己可讀寫 (0600)。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterator
+
+from ams_defaults import CACHE_DIR, DEFAULT_TTL, PAGE_SIZE
+
+VERSION_TTL = 86400.0  # 秒, /version 的結果保留的時間 (伺服器很少升級)
+BUSY_TIMEOUT = 30.0  # 秒, 其他程序 (serve、collect、另一個命令) 正在寫入同一個快取時等待的時間
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS pages (page INTEGER PRIMARY KEY, digest TEXT);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    stream_id TEXT PRIMARY KEY,
+    page INTEGER,
+    position INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS broadcasts_page ON broadcasts (page, position);
+"""
+
+
+def connect_private(path: Path, **kwargs) -> sqlite3.Connection:
+    """開啟只有自己可讀寫的 SQLite 檔; 新建的目錄為 0700 (既有的目錄可能是共用的, 不變更)"""
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+    for file in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+        if file.exists():
+            os.chmod(file, 0o600)  # 舊版以預設權限建立的檔案
+    return sqlite3.connect(path, **kwargs)
+
+
+def page_digest(batch: list[dict]) -> str:
+    return hashlib.sha1(json.dumps(batch, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class InventoryCache:
+    """單一 profile 的串流列表快取"""
+
+    def __init__(self, name: str, cache_dir: Path = CACHE_DIR):
+        self.path = cache_dir / f"{name}.sqlite"
+        self.db = connect_private(self.path, timeout=BUSY_TIMEOUT)
+        self.db.execute("PRAGMA journal_mode=WAL")  # 讀取不會被另一個程序的寫入擋住
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "InventoryCache":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def fetched_at(self) -> float | None:
+        """上次完整重新整理的時間 (epoch 秒), 從未整理或已失效時為 None"""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'fetched_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def is_fresh(self, ttl: float = DEFAULT_TTL) -> bool:
+        fetched_at = self.fetched_at
+        return fetched_at is not None and time.time() - fetched_at < ttl
+
+    def invalidate(self):
+        with self.db:
+            self.db.execute("DELETE FROM meta WHERE key = 'fetched_at'")
+
+    def server_version(self, ttl: float = VERSION_TTL) -> dict | None:
+        """上次記錄的 /version 回應, 超過 ttl 或從未記錄時為 None"""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row and time.time() - (record := json.loads(row[0]))["at"] < ttl:
+            return record["info"]
+        return None
+
+    def store_version(self, info: dict):
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                (json.dumps({"at": time.time(), "info": info}),),
+            )
+
+    def streams(self) -> Iterator[dict]:
+        """依伺服器列表順序產生快取中的串流 (本工具新建的串流排在最後)
+
+        一次只讀入一頁, 記憶體用量與串流總數無關; 產生期間可以更新或刪除快取中的串流。
+        """
+        pages = [row[0] for row in self.db.execute("SELECT page FROM pages ORDER BY page")]
+        for page in pages:
+            rows = self.db.execute("SELECT data FROM broadcasts WHERE page = ? ORDER BY position", (page,)).fetchall()
+            for (data,) in rows:
+                yield json.loads(data)
+        last = 0
+        while rows := self.db.execute(
+            "SELECT rowid, data FROM broadcasts WHERE page IS NULL AND rowid > ? ORDER BY rowid LIMIT ?",
+            (last, PAGE_SIZE),
+        ).fetchall():
+            last = rows[-1][0]
+            for _, data in rows:
+                yield json.loads(data)
+
+    def stream_ids(self) -> set[str]:
+        return {row[0] for row in self.db.execute("SELECT stream_id FROM broadcasts")}
+
+    # --- 重新整理 ---
+
+    def store_page(self, page: int, batch: list[dict]) -> bool:
+        """寫入一頁列表結果, 內容與快取相同時不重寫; 回傳是否有變動"""
+        digest = page_digest(batch)
+        row = self.db.execute("SELECT digest FROM pages WHERE page = ?", (page,)).fetchone()
+        if row and row[0] == digest:
+            return False
+        with self.db:
+            self.db.execute("DELETE FROM broadcasts WHERE page = ?", (page,))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO broadcasts (stream_id, page, position, data) VALUES (?, ?, ?, ?)",
+                [(s["streamId"], page, i, json.dumps(s)) for i, s in enumerate(batch)],
+            )
+            self.db.execute("INSERT OR REPLACE INTO pages (page, digest) VALUES (?, ?)", (page, digest))
+        return True
+
+    def finish_refresh(self, pages: int):
+        """完整翻頁結束後呼叫: 移除已不存在的頁與只在本機新增過的串流, 並記錄整理時間"""
+        with self.db:
+            self.db.execute("DELETE FROM broadcasts WHERE page IS NULL OR page >= ?", (pages,))
+            self.db.execute("DELETE FROM pages WHERE page >= ?", (pages,))
+            self.db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('fetched_at', ?)", (str(time.time()),)
+            )
+
+    # --- 本工具的寫入 ---
+
+    def _touch_page(self, stream_id: str):
+        # 該頁在本機已和伺服器上次的內容不同, 下次重新整理時必須重寫
+        self.db.execute(
+            "UPDATE pages SET digest = NULL WHERE page = (SELECT page FROM broadcasts WHERE stream_id = ?)",
+            (stream_id,),
+        )
+
+    def upsert(self, stream: dict):
+        with self.db:
+            self._touch_page(stream["streamId"])
+            self.db.execute(
+                "INSERT INTO broadcasts (stream_id, page, position, data) VALUES (?, NULL, NULL, ?) "
+                "ON CONFLICT (stream_id) DO UPDATE SET data = excluded.data",
+                (stream["streamId"], json.dumps(stream)),
+            )
+
+    def update(self, stream_id: str, **fields):
+        row = self.db.execute("SELECT data FROM broadcasts WHERE stream_id = ?", (stream_id,)).fetchone()
+        if row:
+            self.upsert({**json.loads(row[0]), **fields})
+
+    def delete(self, stream_id: str):
+        with self.db:
+            self._touch_page(stream_id)
+            self.db.execute("DELETE FROM broadcasts WHERE stream_id = ?", (stream_id,))
@@ -0,0 +1,275 @@
+"""
+AMS REST API 的共用用戶端: ams.py、ams_script.py 與 AMS-script.ipynb 都透過這裡連線
+
+- AMSClient (同步) 與 AsyncAMSClient (非同步) 各自持有一個保持連線 (keep-alive) 的連線池,
+  同一台伺服器的所有請求共用連線, 不必每個請求重新建立 TCP 連線
+- 傳輸層使用 ams_transport 的重試與斷路器 (非同步版本另有自適應併發)
+- 分頁列表、串流 ID 產生與回應檢查的邏輯集中在此
+"""
+
+import asyncio
+import hashlib
+import hmac
+import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from ams_defaults import BACKUP_SUFFIX, DEFAULT_CONCURRENCY, PAGE_SIZE, PARALLEL_PAGES
+from ams_transport import AMSAsyncTransport, AMSTransport
+
+API_PATH = "/WebRTCAppEE/rest/v2"
+DEFAULT_TIMEOUT = 60.0
+KEEPALIVE_EXPIRY = 30.0  # 秒, 閒置連線保留的時間
+BULK_DELETE_SINCE = (2, 4)  # DELETE /broadcasts/bulk (body 為 streamId 陣列) 自這個版本開始提供
+VIEWER_FIELDS = ("totalHLSWatchersCount", "totalWebRTCWatchersCount", "totalRTMPWatchersCount", "totalDASHWatchersCount")
+CREDENTIAL_FIELDS = ("username", "password")  # 串流物件中攝影機的帳號密碼
+
+
+def api_url(host: str, port: int = 5080) -> str:
+    return f"http://{host}:{port}{API_PATH}"
+
+
+def without_credentials(stream: dict) -> dict:
+    """去掉攝影機帳號密碼 (包含 streamUrl 中的 user:pass@) 的串流物件, 供對外提供時使用"""
+    stream = {k: v for k, v in stream.items() if k not in CREDENTIAL_FIELDS}
+    if (url := stream.get("streamUrl")) and "@" in (parts := urlsplit(url)).netloc:
+        stream["streamUrl"] = urlunsplit(parts._replace(netloc=parts.netloc.rpartition("@")[2]))
+    return stream
+
+
+def generate_hash_from_name(name: str, secret_key: str = "ams") -> str:
+    h = hmac.new(secret_key.encode(), name.encode(), hashlib.md5)
+    return h.hexdigest()
+
+
+def generate_stream_id(name: str, secret_key: str = "ams") -> str:
+    """備源 (name 以 -1 結尾) 與 ams_script 相同, 使用主源名稱的 hash"""
+    return f"{name}{generate_hash_from_name(name.removesuffix(BACKUP_SUFFIX), secret_key)}"
+
+
+def legacy_stream_id(name: str, secret_key: str = "ams") -> str:
+    """ams_script 寫入 created_streams.csv 的舊格式: 與 generate_stream_id 相同但名稱轉小寫"""
+    return f"{name.lower()}{generate_hash_from_name(name.removesuffix(BACKUP_SUFFIX), secret_key)}"
+
+
+def sorted_by_name(first_page: list[dict], last: list[dict]) -> bool:
+    """伺服器是否確實依 sort_by=name 排序, 只有確認後才能在名稱超過範圍時提早停止翻頁
+
+    first_page 為 order_by=asc 的第一頁, last 為相同條件但 order_by=desc 的第一筆。第一頁須為遞增,
+    且 last 不小於第一頁的最後一筆; 忽略 sort_by 的伺服器兩次回傳相同的順序, last 就是第一頁的第一筆。
+    """
+    names = [s.get("name") or "" for s in first_page]
+    if not names or names != sorted(names) or names[0] == names[-1]:
+        return False
+    return bool(last) and (last[0].get("name") or "") >= names[-1]
+
+
+def check_result_response(resp: httpx.Response) -> tuple[bool, str]:
+    """檢查返回 Result 物件的 API 回應"""
+    if resp.status_code != 200:
+        return False, f"HTTP {resp.status_code}"
+    data = resp.json()
+    if data.get("success"):
+        return True, ""
+    return False, data.get("message", "Unknown error")
+
+
+def check_deleted_response(resp: httpx.Response) -> tuple[bool, str]:
+    """刪除的回應; 串流已不存在 (404, 例如已被批次刪除) 也視為成功"""
+    if resp.status_code == 404:
+        return True, "已不存在"
+    return check_result_response(resp)
+
+
+def parse_version(info: dict | None) -> tuple[int, ...] | None:
+    """/version 回應的 versionName (例如 2.9.0 或 2.4.3-SNAPSHOT) → (2, 9, 0)"""
+    m = re.match(r"\d+(\.\d+)*", (info or {}).get("versionName") or "")
+    return tuple(int(part) for part in m[0].split(".")) if m else None
+
+
+def supports_bulk_delete(info: dict | None) -> bool:
+    """版本不明 (沒有 /version 或格式不符) 時視為不支援"""
+    version = parse_version(info)
+    return version is not None and version >= BULK_DELETE_SINCE
+
+
+def check_broadcast_response(resp: httpx.Response) -> tuple[bool, str]:
+    """檢查返回 Broadcast 物件的 API 回應"""
+    if resp.status_code != 200:
+        return False, f"HTTP {resp.status_code}"
+    data = resp.json()
+    if data.get("streamId"):
+        return True, ""
+    return False, data.get("message", "Unknown error")
+
+
+def parse_viewers(resp: httpx.Response) -> tuple[int, ...] | None:
+    """由 /broadcast-statistics 取得 (HLS, WebRTC, RTMP, DASH) 觀眾數"""
+    if resp.status_code != 200:
+        return None
+    stats = resp.json()
+    return tuple(stats.get(f, 0) for f in VIEWER_FIELDS)
+
+
+def parse_camera_error(resp: httpx.Response) -> str | None:
+    """由 /ip-camera-error 取得錯誤訊息, 沒有錯誤時回傳 None"""
+    if resp.status_code != 200:
+        return None
+    err = resp.json()
+    # 注意: /ip-camera-error API 的回應中, 'success' 為 true 表示「成功獲取到錯誤訊息」,
+    # 亦即串流本身有錯誤。這與其他 API 的 'success' 欄位含義相反。
+    if err.get("success"):
+        return err.get("message") or "N/A"
+    return None
+
+
+def _number(resp: httpx.Response) -> int | None:
+    if resp.status_code == 200:
+        return resp.json().get("number")
+    return None
+
+
+def _json_object(resp: httpx.Response) -> dict | None:
+    if resp.status_code == 200 and isinstance(data := resp.json(), dict):
+        return data
+    return None
+
+
+def pool_limits(concurrency: int) -> httpx.Limits:
+    """連線池上限即為對該主機的併發上限, 所有連線都保持 keep-alive 供後續請求重用"""
+    return httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency, keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+class AMSClient(httpx.Client):
+    """同步用戶端; 可安全地在多個執行緒間共用"""
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        **kwargs,
+    ):
+        transport = AMSTransport(limits=pool_limits(concurrency))
+        super().__init__(base_url=base_url, timeout=timeout, transport=transport, **kwargs)
+
+    def list_page(self, offset: int, size: int = PAGE_SIZE, params: dict | None = None) -> list[dict]:
+        resp = self.get(f"/broadcasts/list/{offset}/{size}", params=params)
+        resp.raise_for_status()  # 針對 4xx/5xx 回應拋出例外
+        return resp.json()
+
+    def count(self) -> int | None:
+        """由 /broadcasts/count 取得串流總數, 不支援時回傳 None"""
+        try:
+            return _number(self.get("/broadcasts/count"))
+        except (httpx.RequestError, ValueError):
+            return None
+
+    def active_count(self) -> int | None:
+        try:
+            return _number(self.get("/broadcasts/active-live-stream-count"))
+        except (httpx.RequestError, ValueError):
+            return None
+
+    def version(self) -> dict | None:
+        """/version 的回應, 無法取得時回傳 None"""
+        try:
+            return _json_object(self.get("/version"))
+        except (httpx.RequestError, ValueError):
+            return None
+
+    def bulk_delete(self, stream_ids: list[str]) -> httpx.Response:
+        """以一個請求刪除多個串流; 只在 supports_bulk_delete 的伺服器上可用"""
+        return self.request("DELETE", "/broadcasts/bulk", json=stream_ids)
+
+    def iter_broadcasts(self, page_size: int = PAGE_SIZE, params: dict | None = None, offset: int = 0) -> Iterator[dict]:
+        """逐筆產生 (自 offset 起的) 串流, 處理目前這頁時會在背景預先下載下一頁"""
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future: Future | None = pool.submit(self.list_page, offset, page_size, params)
+            while future is not None:
+                batch = future.result()
+                if len(batch) < page_size:
+                    future = None  # 最後一批
+                else:
+                    offset += page_size
+                    future = pool.submit(self.list_page, offset, page_size, params)
+                yield from batch
+
+
+class AsyncAMSClient(httpx.AsyncClient):
+    """非同步用戶端; 實際同時進行的請求數由 AMSAsyncTransport 依伺服器狀況在 concurrency 內調整"""
+
+    def __init__(
+        self,
+        base_url: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = DEFAULT_TIMEOUT,
+        **kwargs,
+    ):
+        transport = AMSAsyncTransport(concurrency, limits=pool_limits(concurrency))
+        super().__init__(base_url=base_url, timeout=timeout, transport=transport, **kwargs)
+
+    async def list_page(self, offset: int, size: int = PAGE_SIZE, params: dict | None = None) -> list[dict]:
+        resp = await self.get(f"/broadcasts/list/{offset}/{size}", params=params)
+        resp.raise_for_status()  # 針對 4xx/5xx 回應拋出例外
+        return resp.json()
+
+    async def count(self) -> int | None:
+        """由 /broadcasts/count 取得串流總數, 不支援時回傳 None"""
+        try:
+            return _number(await self.get("/broadcasts/count"))
+        except (httpx.RequestError, ValueError):
+            return None
+
+    async def active_count(self) -> int | None:
+        try:
+            return _number(await self.get("/broadcasts/active-live-stream-count"))
+        except (httpx.RequestError, ValueError):
+            return None
+
+    async def version(self) -> dict | None:
+        """/version 的回應, 無法取得時回傳 None"""
+        try:
+            return _json_object(await self.get("/version"))
+        except (httpx.RequestError, ValueError):
+            return None
+
+    async def bulk_delete(self, stream_ids: list[str]) -> httpx.Response:
+        """以一個請求刪除多個串流; 只在 supports_bulk_delete 的伺服器上可用"""
+        return await self.request("DELETE", "/broadcasts/bulk", json=stream_ids)
+
+    async def iter_pages(
+        self, page_size: int = PAGE_SIZE, parallel_pages: int = PARALLEL_PAGES
+    ) -> AsyncIterator[list[dict]]:
+        """依序逐頁產生伺服器上的串流, 不需先下載完整列表
+
+        已知總數時同時下載多頁, 否則在處理目前這頁時預先下載下一頁。
+        若最後一頁是滿的 (列表期間有新增串流), 會繼續往後翻頁直到取得不滿一頁為止。
+        """
+        total = await self.count()
+        window = parallel_pages if total else 1
+        next_offset = 0
+        pending: deque[asyncio.Task] = deque()
+
+        def schedule():
+            nonlocal next_offset
+            pending.append(asyncio.create_task(self.list_page(next_offset, page_size)))
+            next_offset += page_size
+
+        schedule()
+        try:
+            while pending:
+                batch = await pending.popleft()
+                if len(batch) == page_size:
+                    while len(pending) < window and (not pending or total is None or next_offset < total):
+                        schedule()
+                yield batch
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,44 @@
+"""
+命令列選項與各模組共用的預設值
+
+ams.py 定義命令時就需要這些值; 放在這個不匯入任何套件的模組, 讓 `--help` 與參數錯誤等
+不需要連線的情況不必載入 httpx / asyncio / rich。各模組仍以原本的名稱重新匯出。
+"""
+
+import os
+from pathlib import Path
+
+# ams_client
+DEFAULT_CONCURRENCY = 16
+PAGE_SIZE = 1000  # 每次獲取 1000 筆
+PARALLEL_PAGES = 4  # 已知總數時同時下載的頁數
+BACKUP_SUFFIX = "-1"  # 備源的名稱為主源名稱加上 -1
+BULK_BATCH = 500  # 批次刪除每個請求包含的串流數
+# /broadcasts/list 的串流物件中的觀眾數欄位 (與 /broadcast-statistics 的名稱不同)
+LIST_VIEWER_FIELDS = ("hlsViewerCount", "webRTCViewerCount", "rtmpViewerCount", "dashViewerCount")
+
+# ams_cache
+CACHE_DIR = Path(os.environ.get("AMS_CACHE_DIR", Path.home() / ".cache" / "ams"))
+DEFAULT_TTL = float(os.environ.get("AMS_CACHE_TTL", 60))  # 秒
+
+# ams_probe
+RTSP_PORT = 554
+PROBE_TIMEOUT = 1.5  # 秒, 連線 (與 OPTIONS 回應) 的逾時
+PROBE_TTL = float(os.environ.get("AMS_PROBE_TTL", 300))  # 秒
+
+# ams_place
+MASTER_CSV = "AMS/all.csv"
+DEFAULT_SLACK = 0.05  # 使用率高於平均水位這個比例以內, 串流仍留在目前的伺服器
+
+# ams_export
+EXPORT_FORMATS = ("csv", "ndjson", "parquet", "arrow")
+# 可匯出的欄位; profile 為串流所在的 profile 名稱, 其餘為 AMS 串流物件的欄位
+EXPORT_FIELDS = ("profile", "name", "streamId", "type", "status", "ipAddr", "streamUrl", "username", "description")
+DEFAULT_EXPORT_FIELDS = ("profile", "name", "streamId", "type", "status", "ipAddr")
+
+# ams_registry
+REGISTRY_DB = CACHE_DIR / "registry.sqlite"
+
+# ams_stats
+STATS_DB = CACHE_DIR / "stats.sqlite"
+STATS_INTERVAL = 60.0  # 秒, collect 的取樣間隔
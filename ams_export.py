@@ -0,0 +1,178 @@
+"""
+串流列表的匯出: 逐筆寫入 CSV / NDJSON / Parquet / Arrow, 記憶體用量與串流數無關
+
+自然排序 (A2 排在 A10 之前) 以外部合併排序進行: 每 RUN_SIZE 筆排序後寫成暫存檔,
+最後以 heapq.merge 逐筆合併。Parquet 與 Arrow 需要 pyarrow (選用, `uv run --with pyarrow`),
+每 ROW_GROUP 筆寫出一個 row group / record batch, 所有欄位皆為字串。
+"""
+
+import csv
+import heapq
+import json
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Iterator
+
+SUFFIXES = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".parquet": "parquet", ".arrow": "arrow",
+            ".feather": "arrow"}
+RUN_SIZE = 50_000  # 外部排序每段在記憶體中排序的筆數
+ROW_GROUP = 10_000
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def natural_key(name: str) -> tuple:
+    """A2 < A10 < B1; 數字段依數值比較, 其餘依字串比較"""
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part) for part in _DIGITS.split(name) if part)
+
+
+def sort_key(row: dict) -> tuple:
+    """匯出列的自然排序: 依 name, 同名時依 profile"""
+    return natural_key(row.get("name") or ""), row.get("profile") or ""
+
+
+def format_for(path: Path) -> str | None:
+    return SUFFIXES.get(path.suffix.lower())
+
+
+class ExternalSorter:
+    """依 key 排序 JSON 可序列化的項目; 每 run_size 筆排序後寫入暫存檔, 取出時逐筆合併"""
+
+    def __init__(self, key: Callable, run_size: int = RUN_SIZE):
+        self.key = key
+        self.run_size = run_size
+        self._tmp = tempfile.TemporaryDirectory(prefix="ams-export-")
+        self._runs: list[Path] = []
+        self._buffer: list = []
+
+    def __enter__(self) -> "ExternalSorter":
+        return self
+
+    def __exit__(self, *exc):
+        self._tmp.cleanup()
+
+    def add(self, item):
+        self._buffer.append(item)
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        self._buffer.sort(key=self.key)
+        path = Path(self._tmp.name) / f"run-{len(self._runs)}.ndjson"
+        with open(path, "w", encoding="utf-8") as f:
+            for item in self._buffer:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self._runs.append(path)
+        self._buffer.clear()
+
+    def sorted(self) -> Iterator:
+        if not self._runs:
+            yield from sorted(self._buffer, key=self.key)
+            return
+        if self._buffer:
+            self._spill()
+        files = [open(path, encoding="utf-8") for path in self._runs]
+        try:
+            yield from heapq.merge(*((json.loads(line) for line in f) for f in files), key=self.key)
+        finally:
+            for f in files:
+                f.close()
+
+
+class ExportWriter(ABC):
+    """逐筆寫入一個匯出檔; 以 with 使用, 結束時寫出剩餘內容"""
+
+    def __init__(self, path: Path, fields: list[str]):
+        self.path = path
+        self.fields = fields
+        self.count = 0
+
+    def __enter__(self) -> "ExportWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @abstractmethod
+    def write(self, row: dict):
+        ...
+
+    def close(self):
+        pass
+
+
+class CsvWriter(ExportWriter):
+    def __init__(self, path: Path, fields: list[str]):
+        super().__init__(path, fields)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(fields)
+
+    def write(self, row: dict):
+        self._writer.writerow(["" if row.get(f) is None else row[f] for f in self.fields])
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class NdjsonWriter(ExportWriter):
+    def __init__(self, path: Path, fields: list[str]):
+        super().__init__(path, fields)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, row: dict):
+        self._file.write(json.dumps({f: row.get(f) for f in self.fields}, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+class ArrowWriter(ExportWriter):
+    """Parquet 或 Arrow IPC 檔; 欄位以 ROW_GROUP 筆為單位轉成欄式批次寫出"""
+
+    def __init__(self, path: Path, fields: list[str], parquet: bool):
+        super().__init__(path, fields)
+        import pyarrow as pa
+
+        self._pa = pa
+        self._schema = pa.schema([(f, pa.string()) for f in fields])
+        if parquet:
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            import pyarrow.ipc
+
+            self._writer = pyarrow.ipc.new_file(str(path), self._schema)
+        self._columns: dict[str, list] = {f: [] for f in fields}
+
+    def write(self, row: dict):
+        for f, column in self._columns.items():
+            value = row.get(f)
+            column.append(None if value is None else str(value))
+        self.count += 1
+        if len(self._columns[self.fields[0]]) >= ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._columns[self.fields[0]]:
+            self._writer.write_table(self._pa.Table.from_pydict(self._columns, schema=self._schema))
+            for column in self._columns.values():
+                column.clear()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_writer(path: Path, fmt: str, fields: list[str]) -> ExportWriter:
+    """Parquet / Arrow 在沒有安裝 pyarrow 時引發 ImportError"""
+    if fmt == "csv":
+        return CsvWriter(path, fields)
+    if fmt == "ndjson":
+        return NdjsonWriter(path, fields)
+    return ArrowWriter(path, fields, parquet=fmt == "parquet")
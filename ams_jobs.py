@@ -0,0 +1,225 @@
+"""
+工作檔 (TOML): 以相依關係描述跨 profile 的維護步驟, 互不相依的步驟同時執行
+
+    name = "E 區從 sms3 搬到 sms4"
+    on_failure = "stop"        # stop: 有步驟失敗就不再開始新的步驟; continue: 只略過依賴失敗步驟的步驟
+    parallel = 0               # 同時執行的步驟數上限, 0 為不限制
+    concurrency = 16           # 步驟未指定 concurrency 時, 每台伺服器同時進行的請求數
+
+    [[steps]]
+    id = "stop-e"
+    action = "stop"
+    profile = "sms3"
+    prefix = "E"
+
+    [[steps]]
+    id = "delete-e"
+    action = "delete"
+    profile = "sms3"
+    prefix = "E"
+    needs = ["stop-e"]
+
+每個步驟的 action 與其參數由 ams.py 的 run 命令提供 (本模組只負責格式檢查與排程)。
+步驟可設定 allow_failure = true, 失敗時仍視為完成, 不影響依賴它的步驟與 on_failure。
+"""
+
+import asyncio
+import time
+import tomllib
+from dataclasses import dataclass, field
+from graphlib import CycleError, TopologicalSorter
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from ams_defaults import DEFAULT_CONCURRENCY, DEFAULT_TTL
+
+ON_FAILURE = ("stop", "continue")
+JOB_KEYS = {"name", "on_failure", "parallel", "concurrency", "ttl", "steps"}
+STEP_KEYS = {"id", "action", "needs", "allow_failure", "concurrency"}  # 所有 action 共用的鍵
+
+
+class JobError(ValueError):
+    """工作檔的格式或內容有誤"""
+
+
+@dataclass
+class Step:
+    id: str
+    action: str
+    needs: list[str] = field(default_factory=list)
+    params: dict = field(default_factory=dict)  # action 專屬的參數
+    allow_failure: bool = False
+    concurrency: int | None = None
+
+
+@dataclass
+class Job:
+    name: str
+    steps: dict[str, Step]  # 依工作檔中的順序
+    on_failure: str = "stop"
+    parallel: int = 0
+    concurrency: int = DEFAULT_CONCURRENCY
+    ttl: float = DEFAULT_TTL
+
+
+@dataclass
+class StepOutcome:
+    status: str  # ok / failed / skipped
+    detail: str = ""
+    elapsed: float = 0.0
+
+
+def _positive_int(value, where: str) -> int:
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise JobError(f"{where} 必須是非負整數")
+    return value
+
+
+def load_job(path: Path, actions: dict[str, set[str]]) -> Job:
+    """讀取並檢查工作檔; actions 為 action → 該 action 可用的參數"""
+    try:
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    except tomllib.TOMLDecodeError as e:
+        raise JobError(f"{path}: {e}") from e
+    if unknown := set(data) - JOB_KEYS:
+        raise JobError(f"未知的設定: {', '.join(sorted(unknown))}")
+    on_failure = data.get("on_failure", "stop")
+    if on_failure not in ON_FAILURE:
+        raise JobError(f"on_failure 必須是 {' 或 '.join(ON_FAILURE)}")
+
+    steps: dict[str, Step] = {}
+    for i, raw in enumerate(data.get("steps", []), 1):
+        step_id = str(raw.get("id") or f"step{i}")
+        where = f"步驟 {step_id}"
+        if step_id in steps:
+            raise JobError(f"{where}: id 重複")
+        action = raw.get("action")
+        if action not in actions:
+            raise JobError(f"{where}: 未知的 action {action!r}, 可用的有 {', '.join(actions)}")
+        if unknown := set(raw) - STEP_KEYS - actions[action]:
+            raise JobError(f"{where}: {action} 不支援 {', '.join(sorted(unknown))}")
+        needs = raw.get("needs", [])
+        needs = [needs] if isinstance(needs, str) else list(needs)
+        concurrency = raw.get("concurrency")
+        steps[step_id] = Step(
+            step_id, action, needs, {k: v for k, v in raw.items() if k not in STEP_KEYS},
+            allow_failure=bool(raw.get("allow_failure", False)),
+            concurrency=None if concurrency is None else _positive_int(concurrency, f"{where} 的 concurrency") or None,
+        )
+    if not steps:
+        raise JobError("工作檔中沒有任何步驟 ([[steps]])")
+    for step in steps.values():
+        if missing := [n for n in step.needs if n not in steps]:
+            raise JobError(f"步驟 {step.id}: needs 中的 {', '.join(missing)} 不存在")
+
+    job = Job(
+        str(data.get("name") or path.stem), steps, on_failure,
+        parallel=_positive_int(data.get("parallel", 0), "parallel"),
+        concurrency=_positive_int(data.get("concurrency", DEFAULT_CONCURRENCY), "concurrency") or DEFAULT_CONCURRENCY,
+        ttl=float(data.get("ttl", DEFAULT_TTL)),
+    )
+    try:
+        graph(job).prepare()
+    except CycleError as e:
+        raise JobError(f"步驟的相依關係有循環: {' → '.join(e.args[1])}") from e
+    return job
+
+
+def graph(job: Job) -> TopologicalSorter:
+    return TopologicalSorter({step.id: step.needs for step in job.steps.values()})
+
+
+def levels(job: Job) -> list[list[str]]:
+    """依相依深度分組: 同一組的步驟可以同時執行 (供 --dry-run 顯示)"""
+    depth: dict[str, int] = {}
+    for step_id in graph(job).static_order():
+        depth[step_id] = 1 + max((depth[n] for n in job.steps[step_id].needs), default=-1)
+    grouped: list[list[str]] = [[] for _ in range(max(depth.values()) + 1)]
+    for step_id in job.steps:
+        grouped[depth[step_id]].append(step_id)
+    return grouped
+
+
+def critical_path(job: Job, outcomes: dict[str, StepOutcome]) -> tuple[list[str], float]:
+    """依實際耗時計算最長的相依鏈 (整個工作至少需要的時間)"""
+    finish: dict[str, float] = {}
+    via: dict[str, str | None] = {}
+    for step_id in graph(job).static_order():
+        before = max(job.steps[step_id].needs, key=lambda n: finish[n], default=None)
+        via[step_id] = before
+        elapsed = outcomes[step_id].elapsed if step_id in outcomes else 0.0
+        finish[step_id] = elapsed + (finish[before] if before else 0.0)
+    last = max(finish, key=finish.get)
+    path = [last]
+    while via[path[-1]]:
+        path.append(via[path[-1]])
+    return path[::-1], finish[last]
+
+
+def blocked_by(job: Job, step: Step, outcomes: dict[str, StepOutcome]) -> list[str]:
+    """依賴中沒有完成的步驟 (失敗且不允許失敗, 或被略過)"""
+    return [
+        n for n in step.needs
+        if outcomes[n].status == "skipped" or (outcomes[n].status == "failed" and not job.steps[n].allow_failure)
+    ]
+
+
+async def run_job(
+    job: Job,
+    run_step: Callable[[Step], Awaitable[tuple[bool, str]]],
+    on_start: Callable[[Step], None] = lambda step: None,
+    on_finish: Callable[[Step, StepOutcome], None] = lambda step, outcome: None,
+) -> dict[str, StepOutcome]:
+    """依相依關係執行所有步驟, 依賴都完成的步驟立即開始 (最多同時 job.parallel 個)
+
+    run_step 回傳 (是否成功, 說明); 引發例外也算失敗。on_failure 為 stop 時, 有不允許失敗的步驟失敗後
+    不再開始新的步驟 (進行中的會完成), 其餘記為略過。
+    """
+    sorter = graph(job)
+    sorter.prepare()
+    outcomes: dict[str, StepOutcome] = {}
+    running: dict[asyncio.Task, Step] = {}
+    ready: list[str] = []
+    limit = job.parallel or len(job.steps)
+    stopping = False
+
+    async def timed(step: Step) -> StepOutcome:
+        start = time.perf_counter()
+        try:
+            ok, detail = await run_step(step)
+        except Exception as e:  # 單一步驟的錯誤不應中斷整個工作
+            ok, detail = False, f"{type(e).__name__}: {e}"
+        return StepOutcome("ok" if ok else "failed", detail, time.perf_counter() - start)
+
+    def finish(step: Step, outcome: StepOutcome):
+        outcomes[step.id] = outcome
+        sorter.done(step.id)
+        on_finish(step, outcome)
+
+    try:
+        while sorter.is_active():
+            ready.extend(sorter.get_ready())
+            while ready and len(running) < limit:
+                step = job.steps[ready.pop(0)]
+                if stopping:
+                    finish(step, StepOutcome("skipped", "工作已因失敗停止"))
+                elif blocked := blocked_by(job, step, outcomes):
+                    finish(step, StepOutcome("skipped", f"依賴的 {', '.join(blocked)} 未完成"))
+                else:
+                    on_start(step)
+                    running[asyncio.create_task(timed(step))] = step
+                ready.extend(sorter.get_ready())
+            if not running:
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step = running.pop(task)
+                outcome = task.result()
+                finish(step, outcome)
+                if outcome.status == "failed" and not step.allow_failure and job.on_failure == "stop":
+                    stopping = True
+    finally:
+        for task in running:
+            task.cancel()
+    return outcomes
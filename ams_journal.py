@@ -0,0 +1,151 @@
+"""
+批量操作的預寫日誌 (NDJSON), 讓中斷的批量操作可以只執行剩下的部分
+
+每個操作送出前記錄一筆 op (profile、動作、streamId、payload), 完成後記錄一筆 result;
+某個 profile 的操作全部產生完畢 (串流列表已翻完) 時記錄 listed。重新執行時 (--resume)
+只重送還沒成功的操作, 已 listed 的 profile 不必再列表一次。
+
+紀錄先寫在記憶體中, 每 FLUSH_EVERY 筆或每 FLUSH_INTERVAL 秒批次寫入並 fsync;
+程式被強制終止時最多遺失最後一批, 那些操作會在 --resume 時再送一次
+(建立會回應已存在、刪除會回應不存在, 啟動/停止可以重複, 都不會造成重複的串流)。
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from ams_defaults import CACHE_DIR
+
+JOURNAL_DIR = CACHE_DIR / "journal"
+FLUSH_EVERY = 200  # 筆
+FLUSH_INTERVAL = 1.0  # 秒
+
+
+class Journal:
+    """單次批量操作 (可跨越多個 profile) 的日誌"""
+
+    def __init__(self, path: Path, command: str):
+        self.path = path
+        self.command = command
+        self.profiles: list[str] = []
+        self.params: dict = {}
+        self.ops: dict[str, dict[str, dict]] = {}  # profile → streamId → op 紀錄 (依記錄順序)
+        self.succeeded: dict[str, set[str]] = {}
+        self.answered: dict[str, set[str]] = {}  # 有記錄結果 (成功或失敗) 的 streamId
+        self.listed: set[str] = set()
+        self.resumed = False
+        self._file = None
+        self._buffer: list[str] = []
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    def create(cls, command: str, journal_dir: Path = JOURNAL_DIR) -> "Journal":
+        """新的日誌; 檔案在 begin 時才建立"""
+        name = f"{command}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.ndjson"
+        return cls(journal_dir / name, command)
+
+    @classmethod
+    def load(cls, path: Path, command: str) -> "Journal":
+        """讀取既有的日誌以繼續執行; 最後一行寫到一半 (程式被強制終止) 時略過"""
+        journal = cls(path, command)
+        journal.resumed = True
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                journal._replay(record)
+        return journal
+
+    def _replay(self, record: dict):
+        kind = record.get("t")
+        if kind == "begin":
+            if record["command"] != self.command:
+                raise ValueError(f"{self.path} 是 {record['command']} 的日誌, 不是 {self.command}")
+            self.profiles = record["profiles"]
+            self.params = record.get("params", {})
+        elif kind == "resume":
+            self.profiles = list(dict.fromkeys(self.profiles + record["profiles"]))
+        elif kind == "op":
+            self.ops.setdefault(record["p"], {})[record["id"]] = record
+        elif kind == "result":
+            self.answered.setdefault(record["p"], set()).add(record["id"])
+            if record["ok"]:
+                self.succeeded.setdefault(record["p"], set()).add(record["id"])
+        elif kind == "listed":
+            self.listed.add(record["p"])
+
+    # --- 讀取 ---
+
+    def pending(self, profile: str) -> list[dict]:
+        """已記錄但尚未成功的 op (包含失敗與結果未知的)"""
+        done = self.succeeded.get(profile, set())
+        return [op for stream_id, op in self.ops.get(profile, {}).items() if stream_id not in done]
+
+    def unknown(self, profile: str) -> set[str]:
+        """已送出但沒有記錄結果的 streamId (中斷時還在進行, 或結果在最後一批未寫入)"""
+        return self.recorded(profile) - self.answered.get(profile, set())
+
+    def recorded(self, profile: str) -> set[str]:
+        return set(self.ops.get(profile, {}))
+
+    # --- 寫入 ---
+
+    def begin(self, profiles: list[str], **params):
+        """開始 (或繼續) 執行; 新的日誌記錄命令、profile 與參數"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # payload 中有攝影機帳號密碼, 只有自己可讀
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._file = os.fdopen(fd, "a", encoding="utf-8")
+        if self.resumed:
+            self.profiles = list(dict.fromkeys(self.profiles + list(profiles)))
+            self._write({"t": "resume", "profiles": list(profiles), "at": time.time()})
+        else:
+            self.profiles, self.params = list(profiles), params
+            self._write({"t": "begin", "command": self.command, "profiles": self.profiles, "params": params,
+                         "at": time.time()})
+        self.flush()
+
+    def record_op(self, profile: str, action: str, stream_id: str, payload: dict | None = None):
+        record = {"t": "op", "p": profile, "a": action, "id": stream_id, "json": payload}
+        self.ops.setdefault(profile, {})[stream_id] = record
+        self._write(record)
+
+    def record_result(self, profile: str, stream_id: str, ok: bool, msg: str = ""):
+        self.answered.setdefault(profile, set()).add(stream_id)
+        if ok:
+            self.succeeded.setdefault(profile, set()).add(stream_id)
+        self._write({"t": "result", "p": profile, "id": stream_id, "ok": ok, "msg": msg})
+
+    def mark_listed(self, profile: str):
+        self.listed.add(profile)
+        self._write({"t": "listed", "p": profile})
+
+    def _write(self, record: dict):
+        self._buffer.append(json.dumps(record, ensure_ascii=False))
+        if len(self._buffer) >= FLUSH_EVERY or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._buffer and self._file:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer.clear()
+        self._flushed_at = time.monotonic()
+
+    @property
+    def complete(self) -> bool:
+        """所有 profile 都已列表完畢且每個操作都成功"""
+        return set(self.profiles) <= self.listed and not any(self.pending(p) for p in self.profiles)
+
+    def close(self, remove_if_complete: bool = True):
+        """寫出剩餘的紀錄; 全部成功時刪除日誌 (已無需繼續的內容)"""
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+            if remove_if_complete and self.complete:
+                self.path.unlink(missing_ok=True)
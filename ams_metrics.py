@@ -0,0 +1,285 @@
+"""
+AMS 請求層級的量測: 每個端點的延遲直方圖、狀態碼計數、重試次數與傳輸的位元組
+
+AMSTransport / AMSAsyncTransport 會把每一次嘗試記錄到 REGISTRY。執行結束時可以印出摘要表,
+或寫成 JSON / Prometheus textfile (供 node_exporter 的 textfile collector 讀取)。
+
+延遲是從送出請求到收到回應標頭的時間; 「排隊」是請求在斷路器與併發限制前等待的時間,
+排隊時間高而延遲正常代表瓶頸在本機的併發設定, 延遲高則是伺服器或網路。
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator
+
+import httpx
+from rich import print as rprint
+from rich.table import Table
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # 秒
+
+# /broadcasts/<這些名稱> 是固定端點, 其他的第二段都是 streamId
+_BROADCAST_ENDPOINTS = {"list", "create", "count", "active-live-stream-count", "bulk"}
+
+
+def endpoint(url: httpx.URL) -> str:
+    """把 URL 轉成端點樣板, 例如 /broadcasts/{id}/start, 避免每個 streamId 各自成為一組統計"""
+    path = url.path.split("/rest/v2", 1)[-1]
+    parts = path.strip("/").split("/")
+    if parts[0] == "broadcasts" and len(parts) > 1:
+        if parts[1] == "list":
+            return "/broadcasts/list/{offset}/{size}"
+        if parts[1] not in _BROADCAST_ENDPOINTS:
+            parts[1] = "{id}"
+    return "/" + "/".join(parts)
+
+
+@dataclass
+class Histogram:
+    counts: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))  # 最後一格為 +Inf
+    sum: float = 0.0
+    count: int = 0
+    max: float = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """與 Prometheus histogram_quantile 相同, 在所在的桶內線性內插"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+@dataclass
+class EndpointStats:
+    latency: Histogram = field(default_factory=Histogram)
+    statuses: Counter[str] = field(default_factory=Counter)  # 狀態碼, 連線錯誤則為例外名稱
+    retries: int = 0
+    rejected: int = 0  # HTTP 成功但 AMS 回應 success=false 等邏輯失敗
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    queued: float = 0.0  # 秒
+
+
+class _CountingAsyncStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_bytes: Callable[[int], None]):
+        self._stream = stream
+        self._on_bytes = on_bytes
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._on_bytes(len(chunk))
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class _CountingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, on_bytes: Callable[[int], None]):
+        self._stream = stream
+        self._on_bytes = on_bytes
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._on_bytes(len(chunk))
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class Metrics:
+    """以 (伺服器, 方法, 端點) 分組的請求統計; 可同時被多個執行緒與 event loop 使用"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.stats: dict[tuple[str, str, str], EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stats.clear()
+
+    def _get(self, request: httpx.Request) -> EndpointStats:
+        key = (request.url.netloc.decode(), request.method, endpoint(request.url))
+        if (stats := self.stats.get(key)) is None:
+            stats = self.stats[key] = EndpointStats()
+        return stats
+
+    def observe(self, request: httpx.Request, status: int | str, latency: float | None = None):
+        """記錄一次嘗試的結果; latency 為 None 表示請求沒有送出 (例如斷路器已放棄)"""
+        try:
+            sent = len(request.content)
+        except httpx.RequestNotRead:
+            sent = 0
+        with self._lock:
+            stats = self._get(request)
+            stats.statuses[str(status)] += 1
+            if latency is not None:
+                stats.latency.observe(latency)
+                stats.bytes_sent += sent
+
+    def retry(self, request: httpx.Request):
+        with self._lock:
+            self._get(request).retries += 1
+
+    def queued(self, request: httpx.Request, seconds: float):
+        with self._lock:
+            self._get(request).queued += seconds
+
+    def outcome(self, request: httpx.Request, ok: bool):
+        """記錄回應在應用層是否成功 (check_result_response 等的結果)"""
+        if not ok:
+            with self._lock:
+                self._get(request).rejected += 1
+
+    def track_body(self, request: httpx.Request, response: httpx.Response):
+        """包住回應的 stream, 讀取時累計下載的位元組數"""
+
+        def on_bytes(n: int):
+            with self._lock:
+                self._get(request).bytes_received += n
+
+        if isinstance(response.stream, httpx.AsyncByteStream):
+            response.stream = _CountingAsyncStream(response.stream, on_bytes)
+        else:
+            response.stream = _CountingStream(response.stream, on_bytes)
+
+    # --- 輸出 ---
+
+    def print_summary(self):
+        if not self.stats:
+            return
+        table = Table("endpoint", "請求", "狀態", "重試", "拒絕", "p50/p95", "排隊", "下載")
+        last_server = None
+        for (server, method, path), s in sorted(self.stats.items()):
+            if server != last_server:
+                table.add_row(f"[bold]{server}", end_section=False)
+                last_server = server
+            statuses = " ".join(f"{status}×{n}" for status, n in s.statuses.most_common())
+            table.add_row(
+                f"  {method} {path}", str(s.latency.count), statuses, str(s.retries),
+                f"[red]{s.rejected}" if s.rejected else "0",
+                f"{_ms(s.latency.quantile(0.5))}/{_ms(s.latency.quantile(0.95))}",
+                f"{s.queued:.1f}s", _size(s.bytes_received),
+            )
+        rprint(table)
+
+    def to_json(self, command: str = "") -> dict:
+        return {
+            "command": command,
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "endpoints": [
+                {
+                    "server": server, "method": method, "endpoint": path,
+                    "requests": s.latency.count, "statuses": dict(s.statuses), "retries": s.retries,
+                    "rejected": s.rejected, "bytes_sent": s.bytes_sent, "bytes_received": s.bytes_received,
+                    "queued_seconds": s.queued,
+                    "latency": {
+                        "sum": s.latency.sum, "max": s.latency.max,
+                        "p50": s.latency.quantile(0.5), "p95": s.latency.quantile(0.95), "p99": s.latency.quantile(0.99),
+                        "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], s.latency.counts)),
+                    },
+                }
+                for (server, method, path), s in sorted(self.stats.items())
+            ],
+        }
+
+    def to_prometheus(self, command: str = "") -> str:
+        """Prometheus text exposition format; 每個 series 都帶 command 標籤, 讓多個排程各寫一個檔案而不衝突"""
+        now = time.time()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+
+        def sample(name: str, labels: dict[str, str], value: float):
+            body = ",".join(f'{k}="{_escape(v)}"' for k, v in {"command": command, **labels}.items())
+            lines.append(f"{name}{{{body}}} {value:g}")
+
+        items = sorted(self.stats.items())
+
+        metric("ams_http_request_duration_seconds", "histogram", "AMS REST 請求延遲 (每次嘗試, 至收到回應標頭)")
+        for (server, method, path), s in items:
+            labels = {"server": server, "method": method, "endpoint": path}
+            cumulative = 0
+            for le, n in zip([*map(str, BUCKETS), "+Inf"], s.latency.counts):
+                cumulative += n
+                sample("ams_http_request_duration_seconds_bucket", {**labels, "le": le}, cumulative)
+            sample("ams_http_request_duration_seconds_sum", labels, s.latency.sum)
+            sample("ams_http_request_duration_seconds_count", labels, s.latency.count)
+
+        metric("ams_http_requests_total", "counter", "依狀態碼 (或連線例外) 分類的請求嘗試次數")
+        for (server, method, path), s in items:
+            for status, n in sorted(s.statuses.items()):
+                sample("ams_http_requests_total", {"server": server, "method": method, "endpoint": path, "status": status}, n)
+
+        for name, kind, help_text, value in [
+            ("ams_http_retries_total", "counter", "重試次數", lambda s: s.retries),
+            ("ams_http_rejected_total", "counter", "HTTP 成功但 AMS 回報失敗的請求數", lambda s: s.rejected),
+            ("ams_http_request_bytes_total", "counter", "上傳的位元組數", lambda s: s.bytes_sent),
+            ("ams_http_response_bytes_total", "counter", "下載的位元組數", lambda s: s.bytes_received),
+            ("ams_http_queue_seconds_total", "counter", "在斷路器與併發限制前等待的總秒數", lambda s: s.queued),
+        ]:
+            metric(name, kind, help_text)
+            for (server, method, path), s in items:
+                sample(name, {"server": server, "method": method, "endpoint": path}, value(s))
+
+        metric("ams_run_duration_seconds", "gauge", "本次執行的耗時")
+        sample("ams_run_duration_seconds", {}, now - self.started)
+        metric("ams_run_last_timestamp_seconds", "gauge", "本次執行結束的時間")
+        sample("ams_run_last_timestamp_seconds", {}, now)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path, command: str = ""):
+        """依副檔名寫出 JSON (.json) 或 Prometheus textfile (其他, 建議 .prom)
+
+        先寫入暫存檔再改名, 避免 node_exporter 讀到寫到一半的檔案。
+        """
+        if path.suffix == ".json":
+            text = json.dumps(self.to_json(command), indent=2, ensure_ascii=False)
+        else:
+            text = self.to_prometheus(command)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms"
+
+
+def _size(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+REGISTRY = Metrics()
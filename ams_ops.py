@@ -0,0 +1,278 @@
+"""
+ams.py、ams_serve 與 ams_script 共用的 profile、串流選擇與批量操作
+
+ams_serve 與 ams_script 透過這裡使用與 ams.py 相同的邏輯, 不必匯入 ams.py (命令列的進入點)。
+httpx、asyncio 與連線相關的模組以 lazy_import 延遲載入, 匯入本模組不會拖慢 `ams.py --help`。
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import re
+import sys
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Callable
+
+from ams_defaults import DEFAULT_CONCURRENCY, DEFAULT_TTL, PAGE_SIZE
+
+
+def lazy_import(name: str):
+    """回傳模組, 但直到第一次存取其屬性時才執行模組的程式碼"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+asyncio = lazy_import("asyncio")
+httpx = lazy_import("httpx")
+ams_cache = lazy_import("ams_cache")
+ams_client = lazy_import("ams_client")
+
+
+def request_metrics():
+    """請求統計; 尚未送出任何請求 (ams_metrics 未載入) 時為 None"""
+    module = sys.modules.get("ams_metrics")
+    return module.REGISTRY if module else None
+
+
+# 每台伺服器建議同時拉流的上限, place 依此分配攝影機
+DEFAULT_CAPACITY = 300
+
+
+@dataclass
+class Profile:
+    api_url: str
+    streams_csv: str
+    origin_ip: str
+    capacity: int = DEFAULT_CAPACITY
+
+
+@dataclass
+class BulkOp:
+    """批量操作中的單一請求 (一個串流對應一個 HTTP 請求)"""
+    stream_id: str
+    method: str
+    url: str
+    check: Callable[[httpx.Response], tuple[bool, str]]
+    json: dict | None = None
+    apply: Callable[[ams_cache.InventoryCache], None] | None = None  # 成功後更新本機快取
+    idempotent: bool = False  # POST 但可安全重試 (例如 start/stop)
+    action: str = ""  # OP_BUILDERS 的鍵, 記錄在日誌中以便 --resume 時重建
+
+
+@dataclass
+class BulkResult:
+    stream_id: str
+    success: bool
+    msg: str = ""
+
+
+def async_client(profile: Profile, concurrency: int = DEFAULT_CONCURRENCY) -> ams_client.AsyncAMSClient:
+    """建立連到 profile 伺服器的非同步用戶端 (保持連線的連線池, 並有重試、自適應併發與斷路保護)"""
+    return ams_client.AsyncAMSClient(profile.api_url, concurrency)
+
+
+@dataclass
+class Selector:
+    """選擇要操作的串流; 所有條件皆需符合, 未指定的條件不限制"""
+    prefix: str | None = None  # name 開頭
+    regex: re.Pattern | None = None  # 以 search 比對 name
+    statuses: set[str] | None = None
+    types: set[str] | None = None
+    codes: set[str] | None = None  # CSV 中的 code, 比對 name 或由 code 產生的 streamId
+
+    def __bool__(self) -> bool:
+        return any(v is not None for v in (self.prefix, self.regex, self.statuses, self.types, self.codes))
+
+    def __str__(self) -> str:
+        parts = []
+        if self.prefix is not None:
+            parts.append(f"prefix={self.prefix}")
+        if self.regex is not None:
+            parts.append(f"regex={self.regex.pattern}")
+        if self.statuses is not None:
+            parts.append(f"status={','.join(sorted(self.statuses))}")
+        if self.types is not None:
+            parts.append(f"type={','.join(sorted(self.types))}")
+        if self.codes is not None:
+            parts.append(f"codes={len(self.codes)} 個")
+        return ", ".join(parts) or "全部"
+
+    def matches(self, stream: dict) -> bool:
+        name = stream.get("name") or ""
+        return (
+            (self.prefix is None or name.startswith(self.prefix))
+            and (self.regex is None or self.regex.search(name) is not None)
+            and (self.statuses is None or stream.get("status") in self.statuses)
+            and (self.types is None or stream.get("type") in self.types)
+            and (self.codes is None or name in self.codes or stream.get("streamId") in self.codes)
+        )
+
+    @property
+    def server_side(self) -> bool:
+        """是否能以伺服器端的 search / type_by 縮小列表範圍"""
+        return bool(self.prefix) or (self.types is not None and len(self.types) == 1)
+
+    def query_params(self) -> dict[str, str]:
+        params = {}
+        if self.prefix:
+            # search 為子字串比對; 依名稱排序後, 超過 prefix 的範圍即可停止翻頁
+            params.update(search=self.prefix, sort_by="name", order_by="asc")
+        if self.types is not None and len(self.types) == 1:
+            params["type_by"] = next(iter(self.types))
+        return params
+
+
+async def iter_selected(client: ams_client.AsyncAMSClient, selector: Selector, page_size: int = PAGE_SIZE) -> AsyncIterator[dict]:
+    """以伺服器端的 search / sort_by / type_by 翻頁, 逐筆產生符合 selector 的串流
+
+    有 prefix 且第一頁是滿的時, 另以 order_by=desc 取一筆確認伺服器確實依名稱排序 (見 ams_client.sorted_by_name),
+    確認後出現比 prefix 範圍大的名稱就停止翻頁。舊版 AMS 會忽略 sort_by, 此時不提早停止, 翻完所有頁並在本機篩選。
+    """
+    params = selector.query_params()
+    offset = 0
+    task: asyncio.Task | None = asyncio.create_task(client.list_page(offset, page_size, params))
+    ordered: bool | None = None  # 伺服器是否依名稱排序, 第一頁到達後才確認
+    try:
+        while task:
+            batch = await task
+            task = None
+            if len(batch) == page_size:
+                offset += page_size
+                task = asyncio.create_task(client.list_page(offset, page_size, params))
+            if ordered is None:
+                ordered = bool(selector.prefix and task) and ams_client.sorted_by_name(
+                    batch, await client.list_page(0, 1, {**params, "order_by": "desc"})
+                )
+            for stream in batch:
+                name = stream.get("name") or ""
+                if ordered and name > selector.prefix and not name.startswith(selector.prefix):
+                    return
+                if selector.matches(stream):
+                    yield stream
+    finally:
+        if task:
+            task.cancel()
+
+
+async def iter_streams(
+    client: ams_client.AsyncAMSClient,
+    cache: ams_cache.InventoryCache | None = None,
+    ttl: float = DEFAULT_TTL,
+    refresh: bool = False,
+    selector: Selector | None = None,
+) -> AsyncIterator[dict]:
+    """逐筆產生伺服器上 (符合 selector) 的串流
+
+    有快取且未過期 (並且沒有要求 refresh) 時直接從快取產生。selector 能在伺服器端縮小範圍時只列出符合的部分
+    (不寫入快取); 否則從伺服器翻完所有頁並同步寫入快取。
+    """
+    selector = selector or Selector()
+    if cache and not refresh and cache.is_fresh(ttl):
+        for stream in cache.streams():
+            if selector.matches(stream):
+                yield stream
+        return
+
+    if selector.server_side:
+        async for stream in iter_selected(client, selector):
+            yield stream
+        return
+
+    pages = 0
+    async for batch in client.iter_pages():
+        if cache:
+            cache.store_page(pages, batch)
+        pages += 1
+        for stream in batch:
+            if selector.matches(stream):
+                yield stream
+    if cache:
+        cache.finish_refresh(pages)
+
+
+async def fetch_streams(client: ams_client.AsyncAMSClient, cache: ams_cache.InventoryCache | None = None, **kwargs) -> list[dict]:
+    """取得所有串流列表"""
+    return [s async for s in iter_streams(client, cache, **kwargs)]
+
+
+async def run_op(client: httpx.AsyncClient, op: BulkOp) -> BulkResult:
+    try:
+        extensions = {"idempotent": True} if op.idempotent else None
+        resp = await client.request(op.method, op.url, json=op.json, extensions=extensions)
+    except httpx.RequestError as e:
+        return BulkResult(op.stream_id, False, f"{type(e).__name__}: {e}")
+    try:
+        success, msg = op.check(resp)
+    except ValueError:  # 回應不是 JSON
+        success, msg = False, f"HTTP {resp.status_code}: {resp.text[:100]}"
+    if metrics := request_metrics():
+        metrics.outcome(resp.request, success)
+    return BulkResult(op.stream_id, success, msg)
+
+
+async def iter_list(items: list) -> AsyncIterator:
+    for item in items:
+        yield item
+
+
+async def execute_ops(
+    client: httpx.AsyncClient,
+    ops: AsyncIterable[BulkOp],
+    concurrency: int,
+    results: list[BulkResult],
+    on_start: Callable[[BulkOp], None] = lambda op: None,
+    on_done: Callable[[BulkOp, BulkResult], None] = lambda op, result: None,
+):
+    """一邊從 ops 取得操作一邊併發執行, 結果依提交順序附加到 results
+
+    即使 ops 來源中途失敗 (例如翻頁時斷線), 已送出的請求仍會完成並保留結果。
+    """
+    sem = asyncio.Semaphore(concurrency)
+    tasks: list[asyncio.Task] = []
+
+    async def run(op: BulkOp) -> BulkResult:
+        try:
+            result = await run_op(client, op)
+        finally:
+            sem.release()
+        on_done(op, result)
+        return result
+
+    try:
+        async for op in ops:
+            await sem.acquire()
+            tasks.append(asyncio.create_task(run(op)))
+            on_start(op)
+    finally:
+        results.extend(await asyncio.gather(*tasks))
+
+
+def start_op(stream_id: str) -> BulkOp:
+    return BulkOp(
+        stream_id, "POST", f"/broadcasts/{stream_id}/start", ams_client.check_result_response, idempotent=True,
+        apply=lambda cache: cache.update(stream_id, status="broadcasting"), action="start",
+    )
+
+
+def stop_op(stream_id: str) -> BulkOp:
+    return BulkOp(
+        stream_id, "POST", f"/broadcasts/{stream_id}/stop", ams_client.check_result_response, idempotent=True,
+        apply=lambda cache: cache.update(stream_id, status="finished"), action="stop",
+    )
+
+
+def delete_op(stream_id: str) -> BulkOp:
+    return BulkOp(
+        stream_id, "DELETE", f"/broadcasts/{stream_id}", ams_client.check_result_response,
+        apply=lambda cache: cache.delete(stream_id), action="delete",
+    )
+
+
+# --type 接受與 create-streams 相同的簡稱
+TYPE_ALIASES = {"ipcam": "ipCamera", "source": "streamSource"}
@@ -0,0 +1,182 @@
+"""
+依各伺服器的容量與目前負載, 把攝影機總表分配到各 profile 的 CSV
+
+總表 (AMS/all.csv) 由多個區段組成: 只有區段名稱的一行 (例如 super、7live), 接著是 CSV 標頭與資料列。
+每個區段分配到 PLACEMENT_GROUPS 中對應的一組伺服器; 同一區段內重複的 code 只保留第一筆。
+
+每台攝影機有一個主源與一個備源 (code 加上 -1), 兩者一定放在不同的伺服器。
+一個串流的負載為 1 (拉流) 加上目前觀眾數乘以 VIEWER_WEIGHT; 不在總表中的直播串流是搬不動的既有負載。
+分配目標是讓各伺服器的使用率 (負載 / 容量) 一致, 並盡量讓串流留在目前的伺服器以減少搬移。
+"""
+
+import csv
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ams_defaults import BACKUP_SUFFIX, DEFAULT_SLACK, LIST_VIEWER_FIELDS
+
+PLACEMENT_GROUPS = {
+    "super": ("sms1", "sms2", "sms3", "sms4"),
+    "7live": ("_7ms1", "_7ms2", "_7ms3", "_7ms4"),
+}
+VIEWER_WEIGHT = 0.05  # 每位觀眾換算成的拉流負載
+
+
+@dataclass
+class MasterSection:
+    name: str
+    fieldnames: list[str]
+    rows: list[dict] = field(default_factory=list)
+    duplicates: list[str] = field(default_factory=list)  # 重複出現 (已略過) 的 code
+
+
+def read_master(path: Path) -> list[MasterSection]:
+    """讀取總表; 區段沒有自己的標頭時沿用前一個區段的標頭"""
+    sections: list[MasterSection] = []
+    fieldnames: list[str] = []
+    seen: set[str] = set()
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for values in csv.reader(f):
+            values = [v.strip() for v in values]
+            if not any(values):
+                continue
+            if len(values) == 1:
+                sections.append(MasterSection(values[0], fieldnames))
+                seen = set()
+            elif "code" in values:
+                fieldnames = values
+                if sections:
+                    sections[-1].fieldnames = fieldnames
+            elif sections and fieldnames:
+                row = dict(zip(fieldnames, values + [""] * (len(fieldnames) - len(values))))
+                if row["code"] in seen:
+                    sections[-1].duplicates.append(row["code"])
+                    continue
+                seen.add(row["code"])
+                sections[-1].rows.append(row)
+    return sections
+
+
+def viewers(stream: dict) -> int:
+    return sum(stream.get(f) or 0 for f in LIST_VIEWER_FIELDS)
+
+
+def stream_weight(stream: dict | None) -> float:
+    return 1 + VIEWER_WEIGHT * viewers(stream) if stream else 1.0
+
+
+@dataclass
+class ServerLoad:
+    name: str
+    capacity: int
+    base: float = 0.0  # 不在總表中的直播串流與其觀眾 (不會被搬動的負載)
+    before: float = 0.0  # 分配前總表中的串流在這台的負載
+    assigned: float = 0.0
+
+    def utilization(self, extra: float = 0.0) -> float:
+        return (self.base + self.assigned + extra) / max(self.capacity, 1)
+
+
+def server_load(name: str, capacity: int, active: int | None, streams: list[dict], managed: set[str]) -> ServerLoad:
+    """由伺服器的活躍直播數與串流列表計算既有負載; managed 為總表中的串流名稱 (含備源)"""
+    load = ServerLoad(name, capacity)
+    unmanaged = [s for s in streams if s.get("name") not in managed]
+    live = [s for s in streams if s.get("status") == "broadcasting"]
+    if active is None:
+        active = len(live)
+    managed_live = sum(s.get("name") in managed for s in live)
+    load.base = max(0, active - managed_live) + VIEWER_WEIGHT * sum(viewers(s) for s in unmanaged)
+    load.before = sum(stream_weight(s) for s in streams if s.get("name") in managed)
+    return load
+
+
+@dataclass
+class Placement:
+    code: str  # 主源為攝影機的 code, 備源再加上 -1
+    row: dict
+    weight: float
+    current: str | None  # 目前所在的伺服器
+    primary: "Placement | None" = None  # 備源對應的主源
+    server: str | None = None
+
+    @property
+    def moved(self) -> bool:
+        return self.server is not None and self.server != self.current
+
+
+def _assign(items: list[Placement], servers: dict[str, ServerLoad], level: float, slack: float):
+    def allowed(item: Placement) -> list[ServerLoad]:
+        # 備源不能和主源在同一台
+        return [s for s in servers.values() if not item.primary or s.name != item.primary.server]
+
+    def put(item: Placement, server: ServerLoad):
+        item.server = server.name
+        server.assigned += item.weight
+
+    # 第一輪: 目前的伺服器還在水位內就留在原處
+    items = sorted(items, key=lambda i: (-i.weight, i.code))
+    for item in items:
+        current = servers.get(item.current or "")
+        if current in allowed(item) and current.utilization(item.weight) <= level * (1 + slack):
+            put(item, current)
+
+    # 第二輪: 其餘的由大到小放到加入後使用率最低的伺服器
+    for item in items:
+        if item.server is None and (candidates := allowed(item)):
+            put(item, min(candidates, key=lambda s: (s.utilization(item.weight), s.name)))
+
+
+def place(
+    section: MasterSection,
+    servers: dict[str, ServerLoad],
+    streams: dict[str, tuple[str, dict | None]],
+    backup: bool = True,
+    slack: float = DEFAULT_SLACK,
+) -> list[Placement]:
+    """計算區段中每個主源與備源的伺服器; streams 為 串流名稱 → (目前的伺服器, 串流物件)
+
+    只有一台伺服器時備源無處可放, 其 server 為 None。
+    """
+    primaries, backups = [], []
+    for row in section.rows:
+        current, stream = streams.get(row["code"], (None, None))
+        primary = Placement(row["code"], row, stream_weight(stream), current)
+        primaries.append(primary)
+        if backup:
+            code = row["code"] + BACKUP_SUFFIX
+            current, stream = streams.get(code, (None, None))
+            backups.append(Placement(code, {**row, "code": code}, stream_weight(stream), current, primary))
+
+    # 全部放完時的平均使用率 (水位)
+    demand = sum(i.weight for i in primaries + backups)
+    level = (sum(s.base for s in servers.values()) + demand) / sum(max(s.capacity, 1) for s in servers.values())
+
+    _assign(primaries, servers, level, slack)
+    _assign(backups, servers, level, slack)
+    return primaries + backups
+
+
+def read_assignment(path: Path) -> tuple[list[str], list[dict]]:
+    """讀取一台伺服器目前的 CSV (標頭, 資料列); 檔案不存在時皆為空"""
+    if not path.exists():
+        return [], []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        return list(reader.fieldnames or []), list(reader)
+
+
+def write_assignment(path: Path, fieldnames: list[str], placements: list[Placement], kept: list[dict] = ()) -> int:
+    """寫出一台伺服器的 CSV: kept (不在總表中的既有資料列) 加上分配到這台的主源與備源, 依 code 排列
+
+    沒有任何資料列時不寫出; 回傳寫出的列數。
+    """
+    rows = [*kept, *(p.row for p in placements)]
+    if not rows:
+        return 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for row in sorted(rows, key=lambda r: (r["code"].removesuffix(BACKUP_SUFFIX), r["code"].endswith(BACKUP_SUFFIX))):
+            writer.writerow(row)
+    return len(rows)
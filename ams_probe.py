@@ -0,0 +1,167 @@
+"""
+攝影機連線預檢: 建立串流前以高併發、短逾時探測每個來源的 RTSP 埠
+
+AMS 對連不上的來源會持續重試, 佔用伺服器本身的資源; 先在本機探測, 只把拉得到的來源送給 AMS。
+探測結果依 (IP, 埠, 探測方式) 快取在 SQLite, 有效期間內不會以相同方式重複探測同一台攝影機;
+只做了 TCP 連線的結果不會被當成 RTSP OPTIONS 的結果使用。
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+from urllib.parse import urlsplit
+
+from ams_defaults import CACHE_DIR, PROBE_TIMEOUT, PROBE_TTL, RTSP_PORT
+
+PROBE_CONCURRENCY = 256  # 同時進行的探測數
+
+Target = tuple[str, int]
+
+_SCHEMA = """
+DROP TABLE IF EXISTS probes;  -- 舊版不分探測方式的快取
+CREATE TABLE IF NOT EXISTS reachability (
+    host TEXT,
+    port INTEGER,
+    mode TEXT,
+    reachable INTEGER NOT NULL,
+    detail TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (host, port, mode)
+);
+"""
+
+
+def probe_mode(rtsp_options: bool) -> str:
+    return "rtsp" if rtsp_options else "tcp"
+
+
+@dataclass
+class ProbeResult:
+    host: str
+    port: int
+    reachable: bool
+    detail: str = ""  # 失敗原因, 或 RTSP 回應的狀態列
+    checked_at: float = 0.0
+    cached: bool = False
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+def rtsp_target(payload: dict, rtsp_port: int = RTSP_PORT) -> Target | None:
+    """由建立串流的 payload 取得要探測的 (主機, 埠)
+
+    streamSource 使用 streamUrl 中的主機與埠; ipCamera 的 ipAddr 可能帶有 ONVIF 的 http 埠,
+    因此只取主機, 探測 rtsp_port。
+    """
+    if url := payload.get("streamUrl"):
+        parts = urlsplit(url)
+        try:
+            port = parts.port
+        except ValueError:
+            return None
+        return (parts.hostname, port or rtsp_port) if parts.hostname else None
+    if ip_addr := payload.get("ipAddr"):
+        host = urlsplit(ip_addr if "://" in ip_addr else f"//{ip_addr}").hostname
+        return (host, rtsp_port) if host else None
+    return None
+
+
+class ProbeCache:
+    """探測結果的本機快取, 所有 profile 共用 (同一台攝影機不論送到哪台伺服器結果都相同)"""
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(cache_dir / "reachability.sqlite")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "ProbeCache":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, target: Target, ttl: float = PROBE_TTL, rtsp_options: bool = False) -> ProbeResult | None:
+        """以相同探測方式 (rtsp_options) 取得的未過期結果"""
+        row = self.db.execute(
+            "SELECT reachable, detail, checked_at FROM reachability"
+            " WHERE host = ? AND port = ? AND mode = ? AND checked_at > ?",
+            (*target, probe_mode(rtsp_options), time.time() - ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        return ProbeResult(*target, bool(row[0]), row[1], row[2], cached=True)
+
+    def store(self, results: Iterable[ProbeResult], rtsp_options: bool = False):
+        mode = probe_mode(rtsp_options)
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO reachability (host, port, mode, reachable, detail, checked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(r.host, r.port, mode, int(r.reachable), r.detail, r.checked_at) for r in results],
+            )
+
+
+async def probe(target: Target, timeout: float = PROBE_TIMEOUT, rtsp_options: bool = False) -> ProbeResult:
+    """連到 RTSP 埠; rtsp_options 時再送出 OPTIONS, 收到 RTSP 回應才算可連線 (401 也算, 代表服務存在)"""
+    host, port = target
+    checked_at = time.time()
+    try:
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                detail = "TCP 連線成功"
+                if rtsp_options:
+                    writer.write(f"OPTIONS rtsp://{host}:{port}/ RTSP/1.0\r\nCSeq: 1\r\n\r\n".encode())
+                    await writer.drain()
+                    detail = (await reader.readline()).decode(errors="replace").strip()
+                    if not detail.startswith("RTSP/"):
+                        return ProbeResult(host, port, False, f"不是 RTSP 回應: {detail[:40] or '連線被關閉'}", checked_at)
+            finally:
+                writer.close()
+    except TimeoutError:
+        return ProbeResult(host, port, False, "逾時", checked_at)
+    except OSError as e:
+        return ProbeResult(host, port, False, os.strerror(e.errno) if e.errno else str(e) or type(e).__name__, checked_at)
+    return ProbeResult(host, port, True, detail, checked_at)
+
+
+async def probe_all(
+    targets: Iterable[Target],
+    concurrency: int = PROBE_CONCURRENCY,
+    timeout: float = PROBE_TIMEOUT,
+    rtsp_options: bool = False,
+    ttl: float = PROBE_TTL,
+) -> dict[Target, ProbeResult]:
+    """同時探測所有目標 (重複的只探測一次), 快取中未過期的結果直接使用"""
+    results: dict[Target, ProbeResult] = {}
+    with ProbeCache() as cache:
+        pending = []
+        for target in dict.fromkeys(targets):
+            if cached := cache.get(target, ttl, rtsp_options):
+                results[target] = cached
+            else:
+                pending.append(target)
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def run(target: Target) -> ProbeResult:
+            async with sem:
+                return await probe(target, timeout, rtsp_options)
+
+        fresh = await asyncio.gather(*(run(t) for t in pending))
+        cache.store(fresh, rtsp_options)
+    results.update(((r.host, r.port), r) for r in fresh)
+    return results
+
+
+def probe_hosts(targets: Iterable[Target], **kwargs) -> dict[Target, ProbeResult]:
+    """probe_all 的同步版本, 供 ams_script 使用"""
+    return asyncio.run(probe_all(targets, **kwargs))
@@ -0,0 +1,261 @@
+"""
+攝影機登錄表: 把總表 (AMS/all.csv) 與各 profile 的 CSV 編譯成一個有索引的 SQLite 檔
+
+以 code、streamId、IP 與網段 (IP 的第三段) 查詢都只是一次索引查詢, 不必每次重新解析 CSV。
+兩種 streamId 預先算好: ams.py 使用的格式 (ams_client.generate_stream_id, 備源另存一欄)
+與 ams_script 寫入 created_streams.csv 的舊格式 (名稱轉小寫, 見 ams_client.legacy_stream_id)。
+
+每個 CSV 的 mtime 與大小沒變時不重讀; 有變化時計算 sha1, 內容相同只更新 mtime, 不同才重新解析該檔。
+重新編譯後檢查各 profile CSV 之間的重複: 同一個 code 或同一個攝影機位址出現在多個 profile,
+以及內容完全相同的檔案。總表只作為對照, 與 profile CSV 重複是正常的。
+"""
+
+import csv
+import hashlib
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from ams_cache import connect_private
+from ams_client import generate_stream_id, legacy_stream_id
+from ams_defaults import BACKUP_SUFFIX, REGISTRY_DB
+from ams_place import read_master
+
+MASTER_SOURCE = "all"  # 總表的來源名稱, 區段名稱另存一欄
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS cameras (
+    path TEXT NOT NULL,
+    source TEXT NOT NULL,
+    section TEXT NOT NULL DEFAULT '',
+    code TEXT NOT NULL COLLATE NOCASE,
+    address TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    subnet INTEGER,
+    stream_id TEXT NOT NULL,
+    backup_id TEXT NOT NULL,
+    legacy_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cameras_path ON cameras (path);
+CREATE INDEX IF NOT EXISTS cameras_code ON cameras (code);
+CREATE INDEX IF NOT EXISTS cameras_stream_id ON cameras (stream_id);
+CREATE INDEX IF NOT EXISTS cameras_backup_id ON cameras (backup_id);
+CREATE INDEX IF NOT EXISTS cameras_legacy_id ON cameras (legacy_id);
+CREATE INDEX IF NOT EXISTS cameras_ip ON cameras (ip);
+CREATE INDEX IF NOT EXISTS cameras_subnet ON cameras (subnet, code);
+"""
+
+_COLUMNS = "source, section, code, address, ip, subnet, stream_id, backup_id, legacy_id, data"
+
+
+def camera_host(address: str) -> str:
+    """stream_ip 欄位可能是 IP 或 rtsp:// URL; 回傳主機部分"""
+    if "://" in address:
+        return urlsplit(address).hostname or ""
+    return address
+
+
+def ip_subnet(ip: str) -> int | None:
+    """192.168.13.35 → 13"""
+    parts = ip.split(".")
+    if len(parts) == 4 and all(p.isdigit() for p in parts):
+        return int(parts[2])
+    return None
+
+
+def file_digest(path: Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+@dataclass
+class Camera:
+    source: str  # profile 名稱, 或總表的 MASTER_SOURCE
+    section: str  # 總表的區段 (profile CSV 為空字串)
+    code: str
+    address: str  # CSV 的 stream_ip 原值
+    ip: str
+    subnet: int | None
+    stream_id: str  # ams.py 的格式
+    backup_id: str  # 備源 (code 加上 -1) 的 streamId
+    legacy_id: str  # ams_script 舊格式
+    row: dict = field(default_factory=dict)
+
+    @property
+    def location(self) -> str:
+        return f"{self.source}/{self.section}" if self.section else self.source
+
+
+@dataclass
+class Duplicate:
+    kind: str  # code / address / file
+    value: str
+    sources: list[str]
+
+
+@dataclass
+class BuildReport:
+    rebuilt: list[str] = field(default_factory=list)  # 重新解析的來源
+    removed: list[str] = field(default_factory=list)  # CSV 已不存在的來源
+    duplicates: list[Duplicate] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.rebuilt or self.removed)
+
+
+def _camera(row: sqlite3.Row | tuple) -> Camera:
+    *values, data = row
+    return Camera(*values, row=json.loads(data))
+
+
+class Registry:
+    """攝影機登錄表; refresh 後即可查詢"""
+
+    def __init__(self, path: Path = REGISTRY_DB):
+        self.path = path
+        self.db = connect_private(path)  # data 欄位是 CSV 的整列, 包含攝影機密碼
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "Registry":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- 編譯 ---
+
+    def refresh(self, sources: dict[str, Path], master: Path | None = None, force: bool = False) -> BuildReport:
+        """編譯有變化的 CSV; sources 為 profile 名稱 → CSV, 不在其中的來源會被移除
+
+        force 時不比對 mtime 與 sha1, 全部重新解析。
+        """
+        report = BuildReport()
+        wanted = {name: Path(path).resolve() for name, path in sources.items()}
+        if master is not None:
+            wanted[MASTER_SOURCE] = Path(master).resolve()
+        known = {row[0]: row[1:] for row in self.db.execute("SELECT path, source, mtime_ns, size, digest FROM files")}
+        current = {str(path) for path in wanted.values()}
+
+        with self.db:
+            for path, (source, *_) in known.items():
+                if path not in current:
+                    self._drop(path)
+                    report.removed.append(source)
+            for source, path in wanted.items():
+                key = str(path)
+                if not path.exists():
+                    if key in known:
+                        self._drop(key)
+                        report.removed.append(source)
+                    continue
+                stat = path.stat()
+                old = known.get(key)
+                if not force and old and old[0] == source and (old[1], old[2]) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                digest = file_digest(path)
+                if not force and old and old[0] == source and old[3] == digest:
+                    # 只是 touch 過, 內容沒變
+                    self.db.execute(
+                        "UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?", (stat.st_mtime_ns, stat.st_size, key)
+                    )
+                    continue
+                self._compile(source, path, digest, stat.st_mtime_ns, stat.st_size)
+                report.rebuilt.append(source)
+        if report.changed or force:
+            report.duplicates = self.duplicates()
+        return report
+
+    def _drop(self, path: str):
+        self.db.execute("DELETE FROM cameras WHERE path = ?", (path,))
+        self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _compile(self, source: str, path: Path, digest: str, mtime_ns: int, size: int):
+        self.db.execute("DELETE FROM cameras WHERE path = ?", (str(path),))
+        if source == MASTER_SOURCE:
+            rows = [(section.name, row) for section in read_master(path) for row in section.rows]
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                rows = [("", row) for row in csv.DictReader(f)]
+        self.db.executemany(
+            f"INSERT INTO cameras (path, {_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(path), *self._values(source, section, row)) for section, row in rows if row.get("code")],
+        )
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (path, source, mtime_ns, size, digest) VALUES (?, ?, ?, ?, ?)",
+            (str(path), source, mtime_ns, size, digest),
+        )
+
+    @staticmethod
+    def _values(source: str, section: str, row: dict) -> tuple:
+        code = row["code"]
+        address = (row.get("stream_ip") or "").strip()
+        ip = camera_host(address)
+        return (
+            source, section, code, address, ip, ip_subnet(ip),
+            generate_stream_id(code), generate_stream_id(code + BACKUP_SUFFIX), legacy_stream_id(code),
+            json.dumps(row, ensure_ascii=False),
+        )
+
+    # --- 查詢 ---
+
+    def _select(self, where: str, params: tuple) -> list[Camera]:
+        sql = f"SELECT {_COLUMNS} FROM cameras WHERE {where} ORDER BY source = ?, source, section, rowid"
+        return [_camera(row) for row in self.db.execute(sql, (*params, MASTER_SOURCE))]
+
+    def by_code(self, code: str) -> list[Camera]:
+        return self._select("code = ?", (code.removesuffix(BACKUP_SUFFIX),))
+
+    def by_stream_id(self, stream_id: str) -> list[Camera]:
+        """主源、備源或舊格式的 streamId"""
+        return self._select("stream_id = ?1 OR backup_id = ?1 OR legacy_id = ?1", (stream_id,))
+
+    def by_ip(self, ip: str) -> list[Camera]:
+        return self._select("ip = ?", (ip,))
+
+    def by_subnet(self, subnet: int) -> list[Camera]:
+        return self._select("subnet = ?", (subnet,))
+
+    def lookup(self, term: str) -> list[Camera]:
+        """依 IP、code 或 streamId 查詢"""
+        term = term.strip()
+        if ip_subnet(term) is not None:
+            return self.by_ip(term)
+        return self.by_code(term) or self.by_stream_id(term)
+
+    def sources(self) -> dict[str, int]:
+        """來源 → 攝影機數"""
+        return dict(self.db.execute("SELECT source, COUNT(*) FROM cameras GROUP BY source ORDER BY source"))
+
+    def duplicates(self) -> list[Duplicate]:
+        """profile CSV 中重複的 code (跨檔或同檔)、被多個 code 使用的攝影機位址, 以及內容完全相同的檔案
+
+        address 的 sources 為 "profile:code"。
+        """
+        queries = {
+            "file": "SELECT digest, GROUP_CONCAT(source) FROM (SELECT * FROM files WHERE source != ?1 ORDER BY source)"
+                    " GROUP BY digest HAVING COUNT(*) > 1",
+            "code": "SELECT code, GROUP_CONCAT(source) FROM (SELECT * FROM cameras WHERE source != ?1 ORDER BY source)"
+                    " GROUP BY code HAVING COUNT(*) > 1 ORDER BY code",
+            "address": "SELECT address, GROUP_CONCAT(source || ':' || code) FROM"
+                       " (SELECT * FROM cameras WHERE source != ?1 AND address != '' ORDER BY source, code)"
+                       " GROUP BY address HAVING COUNT(DISTINCT code) > 1 ORDER BY address",
+        }
+        return [
+            Duplicate(kind, value, sources.split(","))
+            for kind, sql in queries.items()
+            for value, sources in self.db.execute(sql, (MASTER_SOURCE,))
+        ]
+
@@ -3,23 +3,62 @@
 AMS 管理工具 - 使用 httpx 庫與 Ant Media Server 進行 API 互動
 """
 
-import httpx
+import argparse
+import asyncio
+import atexit
 import csv
-import hashlib
-import hmac
-import sys
-from typing import List, Dict, Any, Optional
+import itertools
+import os
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import httpx
+
+from ams_client import (
+    AMSClient,
+    AsyncAMSClient,
+    api_url,
+    check_deleted_response,
+    check_result_response,
+    generate_hash_from_name,
+    legacy_stream_id,
+    sorted_by_name,
+    supports_bulk_delete,
+)
+from ams_defaults import BULK_BATCH, DEFAULT_CONCURRENCY
+from ams_export import ExternalSorter, natural_key
+from ams_journal import Journal
+from ams_metrics import REGISTRY as METRICS
+from ams_ops import BulkResult, delete_op, execute_ops, iter_list
+from ams_probe import RTSP_PORT, probe_hosts
+
+# 建立攝影機的日誌: 開始送出前先寫入完整的建立清單, 中斷後以 --resume 只建立尚未成功的
+CREATE_JOURNAL = "ams_script-create"
+JOURNAL_PROFILE = "server"
+ZONE_PAGE = 1000  # iter_zone 每頁的串流數
 
 
 def generate_stream_id(name: str, secret_key: str = "ams") -> str:
     name_lower = name.lower()  # 將名稱轉為小寫
-    h = hmac.new(secret_key.encode(), name.encode(), hashlib.md5)
-    return f"{name_lower}{h.hexdigest()}"  # 去掉底線
+    return f"{name_lower}{generate_hash_from_name(name, secret_key)}"  # 去掉底線
+
+
+_clients: Dict[Tuple[str, int], AMSClient] = {}
 
 
-def generate_hash_from_name(name: str, secret_key: str = "ams") -> str:
-    h = hmac.new(secret_key.encode(), name.encode(), hashlib.md5)
-    return h.hexdigest()
+def get_client(media_server_ip: str, media_server_port: int) -> AMSClient:
+    """每台伺服器共用一個保持連線的用戶端, 不必每個請求重新建立連線"""
+    key = (media_server_ip, media_server_port)
+    if key not in _clients:
+        _clients[key] = AMSClient(api_url(media_server_ip, media_server_port))
+    return _clients[key]
+
+
+@atexit.register
+def _close_clients() -> None:
+    for client in _clients.values():
+        client.close()
 
 
 def ip_location(subnet: int, id: int) -> int:
@@ -41,26 +80,37 @@ def ip_location(subnet: int, id: int) -> int:
         raise ValueError(f"不支援的子網段: {subnet}")
 
 
-def fetch_all_broadcasts(
-    media_server_ip: str, media_server_port: int
-) -> List[Dict[str, Any]]:
-    """獲取所有攝影機串流資訊"""
-    all_data = []
-    offset = 0
-    batch_size = 1000
-
-    while True:
-        url = f"http://{media_server_ip}:{media_server_port}/WebRTCAppEE/rest/v2/broadcasts/list/{offset}/{batch_size}"
-        r = httpx.get(url, timeout=20)
-        r.raise_for_status()
-        batch = r.json()
-        if not batch:
-            break
-        all_data.extend(batch)
-        if len(batch) < batch_size:
-            break  # 最後一批
-        offset += batch_size
-    return all_data
+def iter_broadcasts(
+    media_server_ip: str,
+    media_server_port: int,
+    batch_size: int = 1000,
+    params: Optional[Dict[str, str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """逐筆產生攝影機串流資訊, 處理目前這頁時會在背景預先下載下一頁"""
+    yield from get_client(media_server_ip, media_server_port).iter_broadcasts(batch_size, params)
+
+
+def iter_zone(media_server_ip: str, media_server_port: int, prefix: str) -> Iterator[Dict[str, Any]]:
+    """逐筆產生名稱以 prefix 開頭的串流
+
+    以伺服器端的 search 縮小範圍並依名稱排序; 確認伺服器確實依名稱排序 (見 sorted_by_name) 後,
+    名稱超過 prefix 的範圍即停止翻頁, 否則翻完所有頁並在本機篩選。
+    """
+    if not prefix:
+        yield from iter_broadcasts(media_server_ip, media_server_port)
+        return
+    client = get_client(media_server_ip, media_server_port)
+    params = {"search": prefix, "sort_by": "name", "order_by": "asc"}
+    first = client.list_page(0, ZONE_PAGE, params)
+    full = len(first) == ZONE_PAGE
+    ordered = full and sorted_by_name(first, client.list_page(0, 1, {**params, "order_by": "desc"}))
+    rest = client.iter_broadcasts(ZONE_PAGE, params, offset=ZONE_PAGE) if full else iter(())
+    for i in itertools.chain(first, rest):
+        name = i.get("name") or ""
+        if name.startswith(prefix):
+            yield i
+        elif ordered and name > prefix:
+            return
 
 
 def do_create(
@@ -74,17 +124,33 @@ def do_create(
     end_id: int,
 ) -> None:
     """批量建立攝影機串流"""
-    results = []
-    fail_count = 0
-    url = f"http://{media_server_ip}:{media_server_port}/WebRTCAppEE/rest/v2/broadcasts/create?autoStart=true"
+    client = get_client(media_server_ip, media_server_port)
 
     print("這批攝影機是否為備源？輸入 yes 則會自動加 -1：")
     is_backup_input = input().strip().lower()
     is_backup_batch = is_backup_input == "yes"
 
-    for id in range(start_id, end_id + 1):
-        suffix = ip_location(subnet, id)
-        ip_addr = f"192.168.{subnet}.{suffix}"
+    # 先同時探測所有攝影機的 RTSP 埠; 探測是從本機而不是 AMS 所在的網路進行, 連不上的預設仍然建立, 只詢問是否略過
+    ip_addrs = {id: f"192.168.{subnet}.{ip_location(subnet, id)}" for id in range(start_id, end_id + 1)}
+    print(f"探測 {len(ip_addrs)} 台攝影機的 RTSP 埠...")
+    probes = probe_hosts((ip, RTSP_PORT) for ip in ip_addrs.values())
+    unreachable = [id for id, ip in ip_addrs.items() if not probes[(ip, RTSP_PORT)].reachable]
+    skipped = set()
+    if unreachable:
+        for id in unreachable:
+            print(f"⚠️ {ip_addrs[id]} 無法連線: {probes[(ip_addrs[id], RTSP_PORT)].detail}")
+        print(f"{len(unreachable)} 台攝影機從本機無法連線，輸入 skip 略過，否則仍然建立：")
+        if input().strip().lower() == "skip":
+            skipped = set(unreachable)
+
+    journal = Journal.create(CREATE_JOURNAL)
+    journal.begin(
+        [JOURNAL_PROFILE], media_server_ip=media_server_ip, media_server_port=media_server_port,
+        total=len(ip_addrs), skipped=len(skipped),
+    )
+    for id, ip_addr in ip_addrs.items():
+        if id in skipped:
+            continue
 
         base_name = f"{zone}{id if id > 100 else f'0{id}'}"
         name = f"{base_name}-1" if is_backup_batch else base_name
@@ -107,78 +173,120 @@ def do_create(
             "password": password,
             "type": "ipCamera",
         }
-        print(data)
-
-        response = httpx.post(url, json=data, timeout=10)
-
-        if response.status_code == 200:
-            results.append({"id": id, "name": name})
-        else:
-            fail_count += 1
-            print(f"❌ {name} 建立失敗:HTTP {response.status_code} → {response.text}")
-
-    success_count = len(results)
-    total_count = end_id - start_id + 1
-    print(f"建立完畢: 共{total_count}，成功 {success_count} 筆，失敗{fail_count}筆。")
+        journal.record_op(JOURNAL_PROFILE, "create", stream_id, data)
+    journal.mark_listed(JOURNAL_PROFILE)
+    journal.flush()
+    print(f"日誌: {journal.path}（中斷後執行 python ams_script.py --resume {journal.path} 繼續）")
+    run_creates(client, journal)
+
+
+def resume_create(path: Path) -> None:
+    """依日誌繼續中斷的建立攝影機, 只建立尚未成功的項目"""
+    journal = Journal.load(path, CREATE_JOURNAL)
+    params = journal.params
+    client = get_client(params["media_server_ip"], params["media_server_port"])
+    journal.begin([JOURNAL_PROFILE])
+
+    # 中斷時已送出但沒有結果的, 先確認伺服器上是否已經建立; 查詢失敗的留待重新送出
+    for stream_id in journal.unknown(JOURNAL_PROFILE):
+        try:
+            resp = client.get(f"/broadcasts/{stream_id}", timeout=10)
+        except httpx.RequestError as e:
+            print(f"⚠️ 無法確認 {stream_id} 是否已建立: {type(e).__name__}: {e}")
+            continue
+        if resp.status_code == 200:
+            journal.record_result(JOURNAL_PROFILE, stream_id, True, "已建立 (查詢確認)")
+    run_creates(client, journal)
+
+
+def run_creates(client: AMSClient, journal: Journal) -> None:
+    """送出日誌中尚未成功的建立, 結束後寫出所有已建立的串流"""
+    try:
+        for record in journal.pending(JOURNAL_PROFILE):
+            data = record["json"]
+            print(data)
+
+            try:
+                response = client.post("/broadcasts/create", params={"autoStart": "true"}, json=data, timeout=10)
+            except httpx.RequestError as e:
+                journal.record_result(JOURNAL_PROFILE, data["streamId"], False, str(e))
+                print(f"❌ {data['name']} 建立失敗: {type(e).__name__}: {e}")
+                continue
+
+            ok = response.status_code == 200
+            journal.record_result(JOURNAL_PROFILE, data["streamId"], ok, "" if ok else f"HTTP {response.status_code}")
+            if not ok:
+                print(f"❌ {data['name']} 建立失敗:HTTP {response.status_code} → {response.text}")
+    finally:
+        # 中斷 (Ctrl+C) 時也寫出已完成的紀錄
+        journal.close()
+
+    fail_count = len(journal.pending(JOURNAL_PROFILE))
+    succeeded = journal.succeeded.get(JOURNAL_PROFILE, set())
+    results = [r["json"]["name"] for r in journal.ops.get(JOURNAL_PROFILE, {}).values() if r["id"] in succeeded]
+    params = journal.params
+    print(
+        f"建立完畢: 共{params['total']}，成功 {len(results)} 筆，失敗{fail_count}筆，"
+        f"略過無法連線 {params['skipped']} 筆。"
+    )
+    if fail_count:
+        print(f"⚠️ 失敗的項目可執行 python ams_script.py --resume {journal.path} 重試")
 
-    # 建立成功後寫入 CSV
+    # 建立成功後寫入 CSV (包含中斷前已建立的)
     with open("created_streams.csv", mode="w", newline="", encoding="utf-8") as file:
         writer = csv.writer(file, quoting=csv.QUOTE_MINIMAL)
         writer.writerow(["Name", "Stream ID"])
-        for r in results:
-            base_name = r["name"]
-            stream_id = f"{base_name.lower()}{generate_hash_from_name(base_name.replace('-1',''))}"
-            writer.writerow([base_name, stream_id])
+        for base_name in results:
+            writer.writerow([base_name, legacy_stream_id(base_name)])
 
     print("✅ 已匯出 created_streams.csv")
 
 
 def do_export(media_server_ip: str, media_server_port: int) -> None:
     """匯出串流列表"""
-    data = fetch_all_broadcasts(media_server_ip, media_server_port)
-
     print("請輸入要匯出的區域（如 A/B/C）：")
     zone_prefix = input().strip().upper()
 
-    # 篩選條件：名稱以指定字母開頭，且不是備源（不以 -1 結尾）
-    filtered = [
-        i
-        for i in data
-        if i["name"].startswith(zone_prefix) and not i["name"].endswith("-1")
-    ]
-
-    def name_sort_key(x):
-        name = x["name"]
-        digits = "".join(filter(str.isdigit, name[1:]))
-        return int(digits) if digits.isdigit() else float("inf")
+    # 篩選條件：名稱以指定字母開頭，且不是備源（不以 -1 結尾）; 依名稱中的數字排序 (A2 在 A10 之前)
+    count = 0
+    with ExternalSorter(lambda x: natural_key(x["name"])) as sorter:
+        for i in iter_zone(media_server_ip, media_server_port, zone_prefix):
+            if not i["name"].endswith("-1"):
+                sorter.add({"name": i["name"], "streamId": i["streamId"], "ipAddr": i.get("ipAddr", "")})
 
-    filtered.sort(key=name_sort_key)
-
-    with open("stream_id_sheet.csv", mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file, quoting=csv.QUOTE_MINIMAL)
-        writer.writerow(["Name", "Stream ID", "Camera IP"])
-        for i in filtered:
-            writer.writerow([i["name"], i["streamId"], i.get("ipAddr", "")])
+        with open("stream_id_sheet.csv", mode="w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file, quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(["Name", "Stream ID", "Camera IP"])
+            for i in sorter.sorted():
+                writer.writerow([i["name"], i["streamId"], i["ipAddr"]])
+                count += 1
 
     print(
-        f"✅ 區域 {zone_prefix} 主源匯出完成，共 {len(filtered)} 筆 → stream_id_sheet.csv"
+        f"✅ 區域 {zone_prefix} 主源匯出完成，共 {count} 筆 → stream_id_sheet.csv"
     )
 
 
+def delete_each(media_server_ip: str, media_server_port: int, stream_ids: list[str]) -> list[BulkResult]:
+    """與 ams.py 相同以 execute_ops 逐一併發刪除; 404 (已被前面失敗的批次刪除) 視為成功, 連線錯誤記為該支失敗"""
+    ops = [replace(delete_op(id), check=check_deleted_response) for id in stream_ids]
+
+    async def run() -> list[BulkResult]:
+        results: list[BulkResult] = []
+        async with AsyncAMSClient(api_url(media_server_ip, media_server_port), DEFAULT_CONCURRENCY) as client:
+            await execute_ops(client, iter_list(ops), DEFAULT_CONCURRENCY, results)
+        return results
+
+    return asyncio.run(run()) if ops else []
+
+
 def do_delete(media_server_ip: str, media_server_port: int) -> None:
     """刪除指定區域的攝影機"""
-    list_url = (
-        f"http://{media_server_ip}:{media_server_port}"
-        "/WebRTCAppEE/rest/v2/broadcasts/list/0/1000"
-        "?sort_by=name&order_by=asc"
-    )
-    r = httpx.get(list_url, timeout=10)
-    r.raise_for_status()
-    data = r.json()
+    client = get_client(media_server_ip, media_server_port)
 
     print("請輸入所要刪除的機台區域 (e.g. A/B/C/D):")
     prefix = input().strip().upper()
-    delete = [i["streamId"] for i in data if i["name"].startswith(prefix)]
+    # 逐頁列出該區域的所有機台 (不再只看前 1000 筆)
+    delete = [i["streamId"] for i in iter_zone(media_server_ip, media_server_port, prefix)]
     if not delete:
         print(f"⚠️ 沒有找到任何以「{prefix}」開頭的機台。")
         return
@@ -193,25 +301,36 @@ def do_delete(media_server_ip: str, media_server_port: int) -> None:
         print("❌ 已取消刪除操作。")
         return
 
-    for id in delete:
-        url_del = f"{list_url.rsplit('/list',1)[0]}/{id}"  # v2 broadcasts/id
-        rd = httpx.delete(url_del, timeout=10)
-        if rd.status_code in (200, 204):
-            print("刪除成功")
-        else:
-            print(f"❌ 刪除失敗：{id} → HTTP {rd.status_code}, {rd.text}")
-
-    print(f"\n🔚 完成，共刪除 {len(delete)} 支「{prefix}」開頭的機台。")
+    # 2.4 以上的伺服器每 BULK_BATCH 支以一個請求刪除; 失敗的批次 (或舊版伺服器) 改為逐一刪除
+    remaining = delete
+    if supports_bulk_delete(client.version()):
+        remaining = []
+        for i in range(0, len(delete), BULK_BATCH):
+            chunk = delete[i:i + BULK_BATCH]
+            try:
+                ok, msg = check_result_response(client.bulk_delete(chunk))
+            except (httpx.RequestError, ValueError) as e:
+                ok, msg = False, str(e)
+            if not ok:
+                print(f"⚠️ 批次刪除失敗 ({msg})，改為逐一刪除這 {len(chunk)} 支")
+                remaining.extend(chunk)
+
+    failed = 0
+    for result in delete_each(media_server_ip, media_server_port, remaining):
+        if not result.success:
+            failed += 1
+            print(f"❌ 刪除失敗：{result.stream_id} → {result.msg}")
+
+    print(f"\n🔚 完成，共刪除 {len(delete) - failed} 支「{prefix}」開頭的機台" + (f"，{failed} 支失敗。" if failed else "。"))
 
 
 def get_rtsp_urls(media_server_ip: str, media_server_port: int) -> None:
     """獲取所有攝影機的 RTSP URL"""
-    data = fetch_all_broadcasts(media_server_ip, media_server_port)
-
-    print(f"找到 {len(data)} 個串流:")
     print("-" * 50)
 
-    for stream in data:
+    count = 0
+    for stream in iter_broadcasts(media_server_ip, media_server_port):
+        count += 1
         stream_id = stream.get("streamId", "N/A")
         name = stream.get("name", "N/A")
         rtsp_url = stream.get("streamUrl", "N/A")  # RTSP URL 在 streamUrl 欄位
@@ -223,9 +342,26 @@ def get_rtsp_urls(media_server_ip: str, media_server_port: int) -> None:
         print(f"RTSP URL: {rtsp_url}")
         print("-" * 50)
 
+    print(f"找到 {count} 個串流")
+
+
+def print_metrics(choice: str) -> None:
+    METRICS.print_summary()
+    # 設定 AMS_METRICS_OUT 時寫出請求統計 (.json 或 Prometheus textfile)
+    if metrics_out := os.environ.get("AMS_METRICS_OUT"):
+        METRICS.write(Path(metrics_out), f"ams_script:{choice}")
+
 
 def main() -> None:
     """主函數"""
+    parser = argparse.ArgumentParser(description="AMS 管理工具")
+    parser.add_argument("--resume", type=Path, metavar="日誌", help="繼續中斷的建立攝影機, 只建立尚未成功的項目")
+    args = parser.parse_args()
+    if args.resume:
+        resume_create(args.resume)
+        print_metrics("1")
+        return
+
     print("請輸入Ant Media Server IP (e.g. 61.222.163.86):")
     media_server_ip = input().strip()
 
@@ -273,6 +409,9 @@ def main() -> None:
         get_rtsp_urls(media_server_ip, media_server_port)
     else:
         print("無效選項，請重新執行程式。")
+        return
+
+    print_metrics(choice)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,324 @@
+"""
+常駐模式: 每個 profile 保持一個連線池與記憶體中的串流列表, 透過本機的 Unix socket (或 HTTP) 提供操作
+
+由 `ams.py serve` 啟動, 以 amsctl.py 呼叫。單一串流的操作只需對 AMS 一次往返, 不必每次重新啟動直譯器、
+確認 profile 與下載完整的串流列表。串流列表在背景定期更新, 並同步寫入本機快取供 ams.py 的其他命令使用。
+
+API 沒有身分驗證, 只在 Unix socket (權限 0600) 或本機位址上提供; 回應中的串流物件不含攝影機的帳號密碼。
+
+API (回應皆為 JSON, /metrics 為 Prometheus 文字):
+
+- GET  /profiles                                 各 profile 的串流數與列表更新時間
+- GET  /streams?profile=&prefix=&regex=&status=&type=&codes=
+- POST /refresh?profile=                         立即重新取得串流列表
+- GET|DELETE /profiles/{p}/streams/{id}          查詢 (向 AMS 取得最新狀態) / 刪除
+- POST /profiles/{p}/streams/{id}/start|stop
+- POST /profiles/{p}/start|stop|delete?prefix=...  批量操作符合條件的串流 (stop/delete 沒有條件時需要 all=1)
+- GET  /metrics
+
+串流相關的路徑也可以省略 /profiles/{p}, 由記憶體中的列表找出串流所在的 profile。
+"""
+
+import asyncio
+import contextlib
+import ipaddress
+import json
+import os
+import re
+import signal
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httpx
+
+import ams_ops
+from ams_cache import InventoryCache
+from ams_client import AsyncAMSClient, generate_stream_id, without_credentials
+from ams_metrics import REGISTRY as METRICS
+
+REFRESH_INTERVAL = 30.0  # 秒, 背景重新取得串流列表的間隔
+GUARDED_BULK = {"stop", "delete"}  # 沒有選擇條件時會停止/刪除整台伺服器, 必須明確指定 all=1
+
+
+class Inventory:
+    """記憶體中的串流列表; 與 InventoryCache 有相同的 upsert / update / delete, BulkOp.apply 可直接使用"""
+
+    def __init__(self):
+        self.streams: dict[str, dict] = {}
+        self.refreshed_at: float | None = None
+        self.error = ""
+
+    def upsert(self, stream: dict):
+        self.streams[stream["streamId"]] = stream
+
+    def update(self, stream_id: str, **fields):
+        if stream := self.streams.get(stream_id):
+            self.streams[stream_id] = {**stream, **fields}
+
+    def delete(self, stream_id: str):
+        self.streams.pop(stream_id, None)
+
+
+@dataclass
+class ProfileState:
+    name: str
+    profile: ams_ops.Profile
+    client: AsyncAMSClient
+    cache: InventoryCache
+    inventory: Inventory = field(default_factory=Inventory)
+    ready: asyncio.Event = field(default_factory=asyncio.Event)  # 第一次列表完成 (不論成功與否)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def selector_from_query(query: dict[str, str]) -> ams_ops.Selector:
+    selector = ams_ops.Selector(prefix=query.get("prefix") or None)
+    if regex := query.get("regex"):
+        try:
+            selector.regex = re.compile(regex)
+        except re.error as e:
+            raise BadRequest(f"regex: {e}")
+    if status := query.get("status"):
+        selector.statuses = {v.strip() for v in status.split(",") if v.strip()}
+    if stream_type := query.get("type"):
+        selector.types = {ams_ops.TYPE_ALIASES.get(v.strip(), v.strip()) for v in stream_type.split(",") if v.strip()}
+    if codes := query.get("codes"):
+        values = [v.strip() for v in codes.split(",") if v.strip()]
+        selector.codes = set(values) | {generate_stream_id(v) for v in values}
+    return selector
+
+
+class Daemon:
+    def __init__(self, selected: dict[str, ams_ops.Profile], concurrency: int, refresh_interval: float = REFRESH_INTERVAL):
+        self.concurrency = concurrency
+        self.refresh_interval = refresh_interval
+        self.states = {
+            name: ProfileState(name, profile, ams_ops.async_client(profile, concurrency), InventoryCache(name))
+            for name, profile in selected.items()
+        }
+        self.started = time.time()
+
+    async def close(self):
+        for state in self.states.values():
+            await state.client.aclose()
+            state.cache.close()
+
+    # --- 串流列表 ---
+
+    async def refresh(self, state: ProfileState):
+        try:
+            streams = await ams_ops.fetch_streams(state.client, state.cache, refresh=True)
+        except (httpx.HTTPStatusError, httpx.RequestError) as e:
+            state.inventory.error = f"無法獲取串流列表: {e}"
+        else:
+            state.inventory.streams = {s["streamId"]: s for s in streams}
+            state.inventory.refreshed_at = time.time()
+            state.inventory.error = ""
+        state.ready.set()
+
+    async def refresh_loop(self, state: ProfileState):
+        while True:
+            await self.refresh(state)
+            await asyncio.sleep(self.refresh_interval)
+
+    def state(self, name: str) -> ProfileState:
+        if name not in self.states:
+            raise LookupError(f"profile {name} 不存在或未由 serve 管理")
+        return self.states[name]
+
+    async def locate(self, stream_id: str) -> ProfileState:
+        """由記憶體中的列表找出串流所在的 profile"""
+        await asyncio.gather(*(s.ready.wait() for s in self.states.values()))
+        for state in self.states.values():
+            if stream_id in state.inventory.streams:
+                return state
+        raise LookupError(f"找不到串流 {stream_id}, 請指定 profile")
+
+    # --- 操作 ---
+
+    async def run_op(self, state: ProfileState, op: ams_ops.BulkOp) -> ams_ops.BulkResult:
+        result = await ams_ops.run_op(state.client, op)
+        if result.success and op.apply:
+            op.apply(state.inventory)
+            op.apply(state.cache)
+        return result
+
+    async def get_stream(self, state: ProfileState, stream_id: str) -> tuple[int, object]:
+        resp = await state.client.get(f"/broadcasts/{stream_id}")
+        if resp.status_code != 200:
+            return resp.status_code, {"success": False, "profile": state.name, "message": f"HTTP {resp.status_code}"}
+        try:
+            stream = resp.json()
+        except ValueError:
+            return 502, {"success": False, "profile": state.name, "message": "AMS 的回應不是 JSON"}
+        state.inventory.upsert(stream)
+        return 200, {"success": True, "profile": state.name, "stream": without_credentials(stream)}
+
+    async def single(self, state: ProfileState, stream_id: str, action: str) -> tuple[int, object]:
+        result = await self.run_op(state, OPS[action](stream_id))
+        return 200, {"success": result.success, "profile": state.name, "streamId": stream_id, "message": result.msg}
+
+    async def bulk(self, state: ProfileState, action: str, selector: ams_ops.Selector) -> tuple[int, object]:
+        await state.ready.wait()
+        if state.inventory.error:
+            return 503, {"success": False, "profile": state.name, "message": state.inventory.error}
+        streams = [s for s in list(state.inventory.streams.values()) if selector.matches(s)]
+
+        async def ops():
+            for s in streams:
+                yield OPS[action](s["streamId"])
+
+        start = time.perf_counter()
+        results: list[ams_ops.BulkResult] = []
+
+        def on_done(op: ams_ops.BulkOp, result: ams_ops.BulkResult):
+            if result.success and op.apply:
+                op.apply(state.inventory)
+                op.apply(state.cache)
+
+        await ams_ops.execute_ops(state.client, ops(), self.concurrency, results, on_done=on_done)
+        failed = [{"streamId": r.stream_id, "message": r.msg} for r in results if not r.success]
+        return 200, {
+            "profile": state.name, "selector": str(selector), "total": len(results),
+            "succeeded": len(results) - len(failed), "failed": failed,
+            "elapsed": round(time.perf_counter() - start, 3),
+        }
+
+    def summary(self) -> dict:
+        return {
+            name: {
+                "api_url": state.profile.api_url,
+                "streams": len(state.inventory.streams),
+                "refreshed_at": state.inventory.refreshed_at,
+                "error": state.inventory.error,
+            }
+            for name, state in self.states.items()
+        }
+
+    # --- 路由 ---
+
+    async def handle(self, method: str, target: str) -> tuple[int, object]:
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/")
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            if method == "GET" and path == "/profiles":
+                return 200, self.summary()
+            if method == "GET" and path == "/metrics":
+                return 200, METRICS.to_prometheus("serve")
+            if method == "POST" and path == "/refresh":
+                names = [query["profile"]] if query.get("profile") else list(self.states)
+                await asyncio.gather(*(self.refresh(self.state(n)) for n in names))
+                return 200, {n: s for n, s in self.summary().items() if n in names}
+            if method == "GET" and path == "/streams":
+                states = [self.state(query["profile"])] if query.get("profile") else list(self.states.values())
+                selector = selector_from_query(query)
+                await asyncio.gather(*(s.ready.wait() for s in states))
+                return 200, [
+                    {"profile": s.name, **without_credentials(stream)}
+                    for s in states for stream in list(s.inventory.streams.values()) if selector.matches(stream)
+                ]
+            if m := re.fullmatch(r"/profiles/([^/]+)/(start|stop|delete)", path):
+                if method != "POST":
+                    raise BadRequest("批量操作請使用 POST")
+                selector = selector_from_query(query)
+                if m[2] in GUARDED_BULK and not selector and query.get("all") not in ("1", "true"):
+                    raise BadRequest(f"沒有選擇條件, 會{OP_NAMES[m[2]]} {m[1]} 上所有的串流; 確定時加上 all=1 (amsctl.py --all)")
+                return await self.bulk(self.state(m[1]), m[2], selector)
+            if m := re.fullmatch(r"(?:/profiles/([^/]+))?/streams/([^/]+)(?:/(start|stop))?", path):
+                name, stream_id, action = m.groups()
+                state = self.state(name) if name else await self.locate(stream_id)
+                if action and method == "POST":
+                    return await self.single(state, stream_id, action)
+                if not action and method == "DELETE":
+                    return await self.single(state, stream_id, "delete")
+                if not action and method == "GET":
+                    return await self.get_stream(state, stream_id)
+        except BadRequest as e:
+            return 400, {"success": False, "message": str(e)}
+        except LookupError as e:
+            return 404, {"success": False, "message": str(e)}
+        except httpx.RequestError as e:
+            return 502, {"success": False, "message": f"{type(e).__name__}: {e}"}
+        return 404, {"success": False, "message": f"no route for {method} {path}"}
+
+    # --- HTTP/1.1 (keep-alive) ---
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while request_line := await reader.readline():
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get("content-length", 0)))  # 參數都在 query string
+                try:
+                    status, obj = await self.handle(method, target)
+                except Exception as e:  # 未預期的錯誤仍要回應, 否則用戶端只看到連線被關閉
+                    status, obj = 500, {"success": False, "message": f"{type(e).__name__}: {e}"}
+                if isinstance(obj, str):
+                    content_type, payload = "text/plain; version=0.0.4", obj.encode()
+                else:
+                    content_type, payload = "application/json", json.dumps(obj, ensure_ascii=False).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):  # 連線中斷或請求格式錯誤
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: Path | None, host: str, port: int | None):
+        """在 Unix socket (僅限本機使用者) 或 host:port 上提供 API, 直到收到 SIGINT / SIGTERM"""
+        if port is None:
+            socket_path.parent.mkdir(parents=True, exist_ok=True)
+            with contextlib.suppress(FileNotFoundError):
+                socket_path.unlink()  # 上次異常結束留下的 socket
+            server = await asyncio.start_unix_server(self._serve_connection, socket_path)
+            os.chmod(socket_path, 0o600)
+            address = str(socket_path)
+        else:
+            if not is_loopback(host):
+                raise ValueError(f"{host} 不是本機位址; API 沒有身分驗證, 只能監聽 127.0.0.1 / ::1 / localhost")
+            server = await asyncio.start_server(self._serve_connection, host, port)
+            address = f"http://{host}:{port}"
+
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        refreshers = [asyncio.create_task(self.refresh_loop(s)) for s in self.states.values()]
+        print(f"ams serve: {address} ({', '.join(self.states)})", flush=True)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            for task in refreshers:
+                task.cancel()
+            await self.close()
+            if port is None:
+                with contextlib.suppress(FileNotFoundError):
+                    socket_path.unlink()
+
+
+OPS = {"start": ams_ops.start_op, "stop": ams_ops.stop_op, "delete": ams_ops.delete_op}
+OP_NAMES = {"start": "啟動", "stop": "停止", "delete": "刪除"}
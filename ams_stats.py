@@ -0,0 +1,262 @@
+"""
+串流統計的時間序列 (SQLite): collect 定期取樣, stats 查詢各串流與各伺服器的趨勢
+
+取樣只使用 /broadcasts/list (每頁 1000 筆, 串流物件已包含狀態與 HLS/WebRTC/RTMP/DASH 觀眾數),
+不對每個串流查詢 broadcast-statistics; 數千個串流每分鐘取樣一次只需要幾個列表請求。
+
+每次取樣累加到各串流的 1 小時 / 1 天彙總 (樣本數、直播樣本數、進入錯誤的次數、觀眾數峰值與總和),
+以及各伺服器的 5 分鐘 / 1 小時彙總; 各層依保留期間刪除, 查詢時使用涵蓋查詢範圍的最細一層。
+不保存原始樣本: 所有查詢都由彙總回答, 每次取樣只更新彙總列。
+串流以整數 sid 代表, 狀態以整數代碼儲存, 讓每列只佔幾個整數。
+"""
+
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from ams_defaults import LIST_VIEWER_FIELDS, STATS_DB
+
+# 彙總層: 間隔秒數 → 保留秒數
+STREAM_LEVELS = {3600: 30 * 86400, 86400: 400 * 86400}
+SERVER_LEVELS = {300: 30 * 86400, 3600: 400 * 86400}
+STATUS_CODES = {"broadcasting": 1, "created": 2, "finished": 3, "error": 4, "failed": 5}
+ERROR_CODES = {STATUS_CODES["error"], STATUS_CODES["failed"]}
+LIVE = STATUS_CODES["broadcasting"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS streams (
+    sid INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL,
+    stream_id TEXT NOT NULL,
+    name TEXT,
+    last_status INTEGER,
+    UNIQUE (profile, stream_id)
+);
+DROP TABLE IF EXISTS samples;  -- 舊版的原始樣本, 沒有任何查詢使用
+CREATE TABLE IF NOT EXISTS rollups (
+    level INTEGER, sid INTEGER, bucket INTEGER,
+    samples INTEGER, live INTEGER, errors INTEGER, viewers_peak INTEGER, viewers_sum INTEGER,
+    PRIMARY KEY (level, sid, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS server_rollups (
+    level INTEGER, bucket INTEGER, profile TEXT,
+    samples INTEGER, streams_peak INTEGER, live_sum INTEGER, live_peak INTEGER, errors INTEGER,
+    viewers_peak INTEGER, viewers_sum INTEGER,
+    PRIMARY KEY (level, bucket, profile)
+) WITHOUT ROWID;
+"""
+
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(spec: str) -> int:
+    """30m / 24h / 7d → 秒; 格式錯誤時引發 ValueError"""
+    m = _DURATION.match(spec.strip().lower())
+    if not m:
+        raise ValueError(f"無效的時間長度: {spec} (例如 30m、24h、7d)")
+    return int(float(m[1]) * _UNITS[m[2]])
+
+
+def pick_level(levels: dict[int, int], since: int, bucket: int | None = None) -> int:
+    """保留期間涵蓋 since 的最細彙總層; 指定 bucket 時不選比 bucket 粗的層"""
+    candidates = [level for level in levels if bucket is None or level <= bucket] or [min(levels)]
+    for level in candidates:
+        if levels[level] >= since:
+            return level
+    return candidates[-1]
+
+
+@dataclass
+class StreamTrend:
+    profile: str
+    name: str
+    stream_id: str
+    samples: int
+    live: int
+    errors: int  # 進入 error/failed 的次數
+    viewers_peak: int
+    viewers_sum: int
+
+    @property
+    def uptime(self) -> float:
+        return self.live / self.samples if self.samples else 0.0
+
+    @property
+    def viewers_avg(self) -> float:
+        return self.viewers_sum / self.samples if self.samples else 0.0
+
+
+@dataclass
+class ServerTrend:
+    profile: str
+    bucket: int  # 彙總時為查詢範圍的起點
+    samples: int
+    streams_peak: int
+    live_sum: int
+    live_peak: int
+    errors: int
+    viewers_peak: int
+    viewers_sum: int
+
+    @property
+    def live_avg(self) -> float:
+        return self.live_sum / self.samples if self.samples else 0.0
+
+    @property
+    def viewers_avg(self) -> float:
+        return self.viewers_sum / self.samples if self.samples else 0.0
+
+
+class StatsStore:
+    """collect 的樣本與彙總; 一個檔案保存所有 profile"""
+
+    def __init__(self, path: Path = STATS_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        self._sids: dict[tuple[str, str], int] = {}
+        self._status: dict[int, int | None] = {}  # sid → 上次的狀態 (判斷是否進入錯誤)
+        for sid, profile, stream_id, last in self.db.execute("SELECT sid, profile, stream_id, last_status FROM streams"):
+            self._sids[(profile, stream_id)] = sid
+            self._status[sid] = last
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "StatsStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- 寫入 ---
+
+    def _sid(self, profile: str, stream: dict) -> int:
+        key = (profile, stream["streamId"])
+        if (sid := self._sids.get(key)) is None:
+            cur = self.db.execute(
+                "INSERT INTO streams (profile, stream_id, name) VALUES (?, ?, ?)", (profile, key[1], stream.get("name"))
+            )
+            sid = self._sids[key] = cur.lastrowid
+            self._status[sid] = None
+        return sid
+
+    def record(self, profile: str, streams: list[dict], ts: float | None = None) -> tuple[int, int]:
+        """寫入一台伺服器一次取樣的所有串流並累加到各層彙總, 回傳 (直播數, 觀眾數)"""
+        ts = int(ts if ts is not None else time.time())
+        rollups, changed = [], []
+        live = errors = viewers_total = 0
+        with self.db:
+            for stream in streams:
+                sid = self._sid(profile, stream)
+                status = STATUS_CODES.get(stream.get("status"), 0)
+                viewers = sum(stream.get(f) or 0 for f in LIST_VIEWER_FIELDS)
+                entered_error = status in ERROR_CODES and self._status[sid] not in ERROR_CODES
+                if status != self._status[sid]:
+                    self._status[sid] = status
+                    changed.append((status, sid))
+                rollups.append((sid, int(status == LIVE), int(entered_error), viewers))
+                live += status == LIVE
+                errors += entered_error
+                viewers_total += viewers
+
+            self.db.executemany("UPDATE streams SET last_status = ? WHERE sid = ?", changed)
+            for level in STREAM_LEVELS:
+                bucket = ts // level * level
+                self.db.executemany(
+                    "INSERT INTO rollups VALUES (?, ?, ?, 1, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET "
+                    "samples = samples + 1, live = live + excluded.live, errors = errors + excluded.errors, "
+                    "viewers_peak = max(viewers_peak, excluded.viewers_peak), "
+                    "viewers_sum = viewers_sum + excluded.viewers_sum",
+                    [(level, sid, bucket, is_live, entered, viewers, viewers) for sid, is_live, entered, viewers in rollups],
+                )
+            for level in SERVER_LEVELS:
+                self.db.execute(
+                    "INSERT INTO server_rollups VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET "
+                    "samples = samples + 1, streams_peak = max(streams_peak, excluded.streams_peak), "
+                    "live_sum = live_sum + excluded.live_sum, live_peak = max(live_peak, excluded.live_peak), "
+                    "errors = errors + excluded.errors, viewers_peak = max(viewers_peak, excluded.viewers_peak), "
+                    "viewers_sum = viewers_sum + excluded.viewers_sum",
+                    (level, ts // level * level, profile, len(streams), live, live, errors, viewers_total, viewers_total),
+                )
+        return live, viewers_total
+
+    def prune(self, now: float | None = None) -> int:
+        """刪除超過保留期間的彙總, 回傳刪除的列數"""
+        now = now if now is not None else time.time()
+        deleted = 0
+        with self.db:
+            for table, levels in (("rollups", STREAM_LEVELS), ("server_rollups", SERVER_LEVELS)):
+                for level, retention in levels.items():
+                    deleted += self.db.execute(
+                        f"DELETE FROM {table} WHERE level = ? AND bucket < ?", (level, now - retention)
+                    ).rowcount
+        return deleted
+
+    # --- 查詢 ---
+
+    @staticmethod
+    def _filter(profiles: list[str] | None, stream: str | None = None) -> tuple[str, list]:
+        sql, args = "", []
+        if profiles:
+            sql += f" AND profile IN ({','.join('?' * len(profiles))})"
+            args += profiles
+        if stream:
+            sql += " AND (name = ? OR stream_id = ?)"
+            args += [stream, stream]
+        return sql, args
+
+    def stream_trends(
+        self,
+        since: int,
+        profiles: list[str] | None = None,
+        stream: str | None = None,
+        order: str = "viewers",
+        limit: int = 20,
+        bucket: int | None = None,
+        now: float | None = None,
+    ) -> list[tuple[int, StreamTrend]]:
+        """各串流在最近 since 秒的峰值觀眾、直播比例與進入錯誤的次數
+
+        未指定 bucket 時每個串流一列, 依 order (viewers 由大到小, uptime 由小到大, errors 由大到小) 取前 limit 個;
+        指定 bucket 時為每 bucket 秒一列的時間序列 (通常搭配 stream)。
+        """
+        level = pick_level(STREAM_LEVELS, since, bucket)
+        start = (now if now is not None else time.time()) - since
+        where, args = self._filter(profiles, stream)
+        size = max(bucket // level * level, level) if bucket else 0
+        if size:
+            group, sort, tail = "r.sid, b", "b, name", ""
+        else:
+            group = "r.sid"
+            sort = {"uptime": "CAST(SUM(r.live) AS REAL) / SUM(r.samples)", "errors": "SUM(r.errors) DESC",
+                    "viewers": "MAX(r.viewers_peak) DESC"}[order] + ", name"
+            tail = f" LIMIT {int(limit)}"
+        rows = self.db.execute(
+            f"SELECT {'r.bucket / ? * ?' if size else 'MIN(r.bucket)'} AS b, profile, name, stream_id, "
+            "SUM(r.samples), SUM(r.live), SUM(r.errors), MAX(r.viewers_peak), SUM(r.viewers_sum) "
+            f"FROM rollups r JOIN streams s ON s.sid = r.sid WHERE r.level = ? AND r.bucket >= ?{where} "
+            f"GROUP BY {group} ORDER BY {sort}{tail}",
+            [*([size, size] if size else []), level, int(start) // level * level, *args],
+        ).fetchall()
+        return [(row[0], StreamTrend(*row[1:])) for row in rows]
+
+    def server_trends(
+        self, since: int, profiles: list[str] | None = None, bucket: int | None = None, now: float | None = None
+    ) -> list[ServerTrend]:
+        """各伺服器的活躍直播數與觀眾數; 指定 bucket 時每 bucket 秒一列, 否則整個範圍一列"""
+        level = pick_level(SERVER_LEVELS, since, bucket)
+        start = (now if now is not None else time.time()) - since
+        where, args = self._filter(profiles)
+        size = max(bucket // level * level, level) if bucket else 0
+        rows = self.db.execute(
+            f"SELECT profile, {'bucket / ? * ?' if size else 'MIN(bucket)'} AS b, SUM(samples), MAX(streams_peak), "
+            "SUM(live_sum), MAX(live_peak), SUM(errors), MAX(viewers_peak), SUM(viewers_sum) FROM server_rollups "
+            f"WHERE level = ? AND bucket >= ?{where} GROUP BY profile{', b' if size else ''} ORDER BY profile, b",
+            [*([size, size] if size else []), level, int(start) // level * level, *args],
+        ).fetchall()
+        return [ServerTrend(*row) for row in rows]
@@ -0,0 +1,282 @@
+"""
+AMS REST 呼叫的傳輸層: 重試、自適應併發與斷路器
+
+以 httpx transport 的形式包住實際的連線, 讓同一個 client 的所有請求 (包含翻頁) 都受到保護:
+
+- 冪等請求 (GET/PUT/DELETE, 或以 extensions={"idempotent": True} 標記的請求) 遇到連線錯誤、
+  逾時或 429/5xx 時, 以 full jitter 指數退避重試
+- AdaptiveLimiter 依延遲與錯誤率以 AIMD 調整同時進行的請求數, 上限為使用者指定的 concurrency
+- CircuitBreaker 在連續失敗後暫停對該伺服器送出請求, 冷卻後以單一併發試探, 成功才恢復;
+  連續多次試探失敗則視為伺服器無法使用, 之後的請求直接以 CircuitOpenError 失敗
+
+每一次嘗試的延遲、狀態與重試都會記錄到 ams_metrics。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+
+from ams_metrics import REGISTRY, Metrics
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """斷路器已放棄該伺服器"""
+
+
+def is_idempotent(request: httpx.Request) -> bool:
+    return request.method in IDEMPOTENT_METHODS or bool(request.extensions.get("idempotent"))
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """讀取 Retry-After 標頭 (只支援秒數)"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 4  # 含第一次
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次 (從 0 起算) 失敗後的等待秒數, 使用 full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class AdaptiveLimiter:
+    """AIMD 併發上限
+
+    一開始以 slow start 每次成功加 1 (每個往返約加倍), 遇到擁塞 (錯誤或延遲超過基準的 latency_factor 倍)
+    時上限減半, 之後每次成功加 1/limit (每個往返約加 1)。同一個往返內的多次擁塞只減一次。
+    """
+
+    def __init__(self, max_limit: int, latency_factor: float = 3.0):
+        self.max_limit = max_limit
+        self.limit = float(min(max_limit, 4))
+        self.ssthresh = float(max_limit)
+        self.latency_factor = latency_factor
+        self.min_latency: float | None = None
+        self.smoothed_latency: float | None = None
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, ok: bool, latency: float | None = None):
+        if ok and latency is not None:
+            self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+            self.smoothed_latency = latency if self.smoothed_latency is None else 0.8 * self.smoothed_latency + 0.2 * latency
+            if self.smoothed_latency <= self.min_latency * self.latency_factor:
+                self._increase()
+                return
+        self._decrease()
+
+    def reset(self):
+        """斷路器開啟時呼叫: 恢復時只允許單一請求試探"""
+        self.ssthresh = max(self.limit / 2, 1.0)
+        self.limit = 1.0
+
+    def _increase(self):
+        step = 1.0 if self.limit < self.ssthresh else 1.0 / self.limit
+        self.limit = min(float(self.max_limit), self.limit + step)
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.smoothed_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(1.0, self.limit / 2)
+        self.ssthresh = self.limit
+
+
+class CircuitBreaker:
+    """連續失敗 threshold 次後暫停 cooldown 秒; 恢復後再失敗則冷卻時間加倍 (最多 max_cooldown)
+
+    連續開啟 max_trips 次都沒有任何成功時放棄 (gave_up), 避免對已停機的伺服器無限等待。
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 5.0, max_cooldown: float = 60.0, max_trips: int = 4):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self.consecutive_trips = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.half_open = False
+        self.trips = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.open_until - time.monotonic())
+
+    @property
+    def gave_up(self) -> bool:
+        return self.consecutive_trips > self.max_trips
+
+    def check(self):
+        if self.gave_up:
+            raise CircuitOpenError(f"斷路器開啟: 連續 {self.consecutive_trips} 次恢復失敗, 暫停對此伺服器的請求")
+
+    def record(self, ok: bool) -> bool:
+        """記錄一次結果, 回傳斷路器是否因此開啟"""
+        if ok:
+            self.failures = 0
+            self.consecutive_trips = 0
+            self.half_open = False
+            self.cooldown = self.base_cooldown
+            return False
+        self.failures += 1
+        if self.failures < self.threshold and not self.half_open:
+            return False
+        if self.remaining() > 0:  # 已經是開啟狀態
+            return False
+        if self.half_open:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+        self.open_until = time.monotonic() + self.cooldown
+        self.half_open = True
+        self.failures = 0
+        self.trips += 1
+        self.consecutive_trips += 1
+        return True
+
+
+class AMSAsyncTransport(httpx.AsyncBaseTransport):
+    """非同步版本: 重試 + AIMD 併發 + 斷路器"""
+
+    def __init__(
+        self,
+        concurrency: int,
+        retry: RetryPolicy | None = None,
+        breaker: CircuitBreaker | None = None,
+        metrics: Metrics = REGISTRY,
+        **transport_kwargs,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = AdaptiveLimiter(concurrency)
+        self.metrics = metrics
+        self._transport = httpx.AsyncHTTPTransport(**transport_kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempts = self.retry.attempts if is_idempotent(request) else 1
+        for attempt in range(attempts):
+            if attempt:
+                self.metrics.retry(request)
+            queued = time.monotonic()
+            while (wait := self.breaker.remaining()) > 0:
+                await asyncio.sleep(wait)
+            try:
+                self.breaker.check()
+            except CircuitOpenError as e:
+                self.metrics.observe(request, type(e).__name__)
+                raise
+            async with self.limiter:
+                start = time.monotonic()
+                self.metrics.queued(request, start - queued)
+                try:
+                    response = await self._transport.handle_async_request(request)
+                except httpx.TransportError as e:
+                    self._record(False)
+                    self.metrics.observe(request, type(e).__name__, time.monotonic() - start)
+                    if attempt + 1 >= attempts:
+                        raise
+                    response = None
+                else:
+                    latency = time.monotonic() - start
+                    ok = response.status_code not in RETRY_STATUS
+                    self._record(ok, latency)
+                    self.metrics.observe(request, response.status_code, latency)
+            if response is None:
+                await asyncio.sleep(self.retry.backoff(attempt))
+                continue
+            if ok or attempt + 1 >= attempts:
+                self.metrics.track_body(request, response)
+                return response
+            await response.aclose()
+            await asyncio.sleep(retry_after(response) or self.retry.backoff(attempt))
+        raise AssertionError("unreachable")
+
+    def _record(self, ok: bool, latency: float | None = None):
+        self.limiter.record(ok, latency)
+        if self.breaker.record(ok):
+            self.limiter.reset()
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class AMSTransport(httpx.BaseTransport):
+    """同步版本: 重試 + 斷路器 (循序呼叫不需要調整併發)"""
+
+    def __init__(
+        self,
+        retry: RetryPolicy | None = None,
+        breaker: CircuitBreaker | None = None,
+        metrics: Metrics = REGISTRY,
+        **transport_kwargs,
+    ):
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics
+        self._transport = httpx.HTTPTransport(**transport_kwargs)
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempts = self.retry.attempts if is_idempotent(request) else 1
+        for attempt in range(attempts):
+            if attempt:
+                self.metrics.retry(request)
+            queued = time.monotonic()
+            time.sleep(self.breaker.remaining())
+            try:
+                self.breaker.check()
+            except CircuitOpenError as e:
+                self.metrics.observe(request, type(e).__name__)
+                raise
+            start = time.monotonic()
+            self.metrics.queued(request, start - queued)
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                self._record(False)
+                self.metrics.observe(request, type(e).__name__, time.monotonic() - start)
+                if attempt + 1 >= attempts:
+                    raise
+                time.sleep(self.retry.backoff(attempt))
+                continue
+            ok = response.status_code not in RETRY_STATUS
+            self._record(ok)
+            self.metrics.observe(request, response.status_code, time.monotonic() - start)
+            if ok or attempt + 1 >= attempts:
+                self.metrics.track_body(request, response)
+                return response
+            response.close()
+            time.sleep(retry_after(response) or self.retry.backoff(attempt))
+        raise AssertionError("unreachable")
+
+    def _record(self, ok: bool):
+        with self._lock:
+            self.breaker.record(ok)
+
+    def close(self):
+        self._transport.close()
@@ -0,0 +1,136 @@
+"""
+`ams.py serve` 的輕量用戶端
+
+執行命令 `python amsctl.py start <streamId>`
+
+只使用標準函式庫 (不匯入 typer / rich / httpx), 啟動只需數十毫秒, 適合自動化腳本頻繁呼叫;
+連線池、串流列表與重試都在常駐的 serve 中。結果以 JSON 輸出, 有失敗時結束代碼為 1。
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from urllib.parse import quote, urlencode, urlsplit
+
+# 不使用 pathlib / http.client, 兩者的匯入時間就超過一次本機請求
+DEFAULT_SOCKET = os.environ.get("AMS_SOCKET") or os.path.join(
+    os.environ.get("AMS_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "ams"), "ams.sock"
+)
+TIMEOUT = 600.0  # 秒, 批量操作可能需要較久
+
+
+class Connection:
+    """對 serve 的 HTTP/1.1 keep-alive 連線 (serve 的回應一定帶有 Content-Length)"""
+
+    def __init__(self, url: str | None, socket_path: str):
+        if url:
+            parts = urlsplit(url)
+            self.sock = socket.create_connection((parts.hostname or "127.0.0.1", parts.port or 80), timeout=TIMEOUT)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(TIMEOUT)
+            self.sock.connect(socket_path)
+        self.reader = self.sock.makefile("rb")
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def request(self, method: str, path: str, query: dict | None = None) -> tuple[int, object]:
+        query = {k: v for k, v in (query or {}).items() if v is not None}
+        if query:
+            path = f"{path}?{urlencode(query)}"
+        self.sock.sendall(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n\r\n".encode())
+        status = int(self.reader.readline().split()[1])
+        headers = {}
+        while (line := self.reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode().partition(":")
+            headers[key.strip().lower()] = value.strip()
+        body = self.reader.read(int(headers.get("content-length", 0))).decode()
+        if headers.get("content-type", "").startswith("application/json"):
+            return status, json.loads(body)
+        return status, body
+
+
+def stream_path(profile: str | None, stream_id: str) -> str:
+    """未指定 profile 時由 serve 在各 profile 的串流列表中尋找"""
+    prefix = f"/profiles/{quote(profile, safe='')}" if profile else ""
+    return f"{prefix}/streams/{quote(stream_id, safe='')}"
+
+
+def selector_query(args: argparse.Namespace) -> dict:
+    return {"prefix": args.prefix, "regex": args.regex, "status": args.status, "type": args.type, "codes": args.codes}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="amsctl.py", description="ams.py serve 的輕量用戶端")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="serve 的 Unix socket")
+    parser.add_argument("--url", default=os.environ.get("AMS_SERVE_URL"), help="serve 的 HTTP 位址 (取代 --socket)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("profiles", help="列出各 profile 的串流數與列表更新時間")
+    commands.add_parser("metrics", help="serve 的請求統計 (Prometheus 格式)")
+    refresh = commands.add_parser("refresh", help="立即重新取得串流列表")
+    refresh.add_argument("-p", "--profile")
+
+    for name, help_text in [("get", "查詢串流"), ("start", "啟動串流"), ("stop", "停止串流"), ("delete", "刪除串流")]:
+        cmd = commands.add_parser(name, help=help_text)
+        cmd.add_argument("stream_ids", nargs="+", metavar="streamId")
+        cmd.add_argument("-p", "--profile", help="未指定時由 serve 尋找串流所在的 profile")
+
+    for name, help_text in [
+        ("list", "列出 (符合條件的) 串流"),
+        ("start-all", "啟動符合條件的串流"),
+        ("stop-all", "停止符合條件的串流"),
+        ("delete-all", "刪除符合條件的串流"),
+    ]:
+        cmd = commands.add_parser(name, help=help_text)
+        cmd.add_argument("-p", "--profile", required=name != "list")
+        cmd.add_argument("--prefix", help="name 以此開頭")
+        cmd.add_argument("--regex", help="name 符合此正規表示式")
+        cmd.add_argument("--status", help="以逗號分隔的狀態")
+        cmd.add_argument("--type", help="以逗號分隔的類型 (ipcam/source 或 AMS 的類型名稱)")
+        cmd.add_argument("--codes", help="以逗號分隔的 code 或 streamId")
+        if name in ("stop-all", "delete-all"):
+            cmd.add_argument("--all", action="store_true", help="沒有選擇條件時確定要處理所有串流")
+
+    args = parser.parse_args(argv)
+    conn = None
+    ok = True
+    try:
+        conn = Connection(args.url, args.socket)
+        if args.command in ("profiles", "metrics"):
+            results = [conn.request("GET", f"/{args.command}")]
+        elif args.command == "refresh":
+            results = [conn.request("POST", "/refresh", {"profile": args.profile})]
+        elif args.command == "list":
+            results = [conn.request("GET", "/streams", {"profile": args.profile, **selector_query(args)})]
+        elif args.command.endswith("-all"):
+            action = args.command.removesuffix("-all")
+            query = {**selector_query(args), "all": 1 if getattr(args, "all", False) else None}
+            results = [conn.request("POST", f"/profiles/{quote(args.profile, safe='')}/{action}", query)]
+        else:
+            method = {"get": "GET", "delete": "DELETE"}.get(args.command, "POST")
+            suffix = "" if args.command in ("get", "delete") else f"/{args.command}"
+            # 同一條連線依序送出, 不必每個串流重新連線
+            results = [conn.request(method, stream_path(args.profile, i) + suffix) for i in args.stream_ids]
+    except (OSError, ValueError) as e:
+        print(f"無法連線到 ams.py serve ({args.url or args.socket}): {e}", file=sys.stderr)
+        return 2
+    finally:
+        if conn:
+            conn.close()
+
+    for status, body in results:
+        if isinstance(body, str):
+            print(body, end="")
+            continue
+        ok = ok and status == 200 and (not isinstance(body, dict) or (body.get("success", True) and not body.get("failed")))
+        print(json.dumps(body, ensure_ascii=False, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
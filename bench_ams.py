@@ -0,0 +1,219 @@
+"""
+效能基準: 對本機的 mock_ams 執行各個批量命令, 量測吞吐量與延遲
+
+執行命令 `uv run bench_ams.py --sizes 100,1000,10000`
+
+每個案例都啟動一個全新的 mock_ams 子程序, 透過真正的 CLI 路徑執行命令,
+並在 httpx transport 層記錄每個請求的延遲。
+"""
+
+import builtins
+import contextlib
+import csv
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+from unittest import mock
+
+# 快取目錄必須在匯入 ams 之前設定, 避免讀寫使用者的快取
+os.environ.setdefault("AMS_CACHE_DIR", tempfile.mkdtemp(prefix="ams-bench-cache-"))
+
+import httpx
+import typer
+from rich import print as rprint
+from rich.table import Table
+from typer.testing import CliRunner
+
+import ams
+import ams_script
+from mock_ams import API_PREFIX
+
+HERE = Path(__file__).resolve().parent
+
+
+class LatencyRecorder:
+    """包住 httpx 最底層的 transport, 記錄每個請求從送出到收到回應標頭的時間"""
+
+    def __init__(self):
+        self.samples: list[float] = []
+
+    @contextlib.contextmanager
+    def install(self):
+        async_send = httpx.AsyncHTTPTransport.handle_async_request
+        sync_send = httpx.HTTPTransport.handle_request
+        samples = self.samples
+
+        async def timed_async(transport, request):
+            start = time.perf_counter()
+            try:
+                return await async_send(transport, request)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        def timed_sync(transport, request):
+            start = time.perf_counter()
+            try:
+                return sync_send(transport, request)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        with mock.patch.object(httpx.AsyncHTTPTransport, "handle_async_request", timed_async), \
+                mock.patch.object(httpx.HTTPTransport, "handle_request", timed_sync):
+            yield self
+
+
+@dataclass
+class BenchResult:
+    case: str
+    streams: int
+    seconds: float
+    requests: int
+    ops_per_sec: float  # 每秒處理的串流數
+    p50_ms: float
+    p99_ms: float
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """已排序樣本的 nearest-rank 百分位數"""
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def mock_server(streams: int, latency: float, error_rate: float):
+    """啟動 mock_ams 子程序, 結束時關閉"""
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, str(HERE / "mock_ams.py"), "--port", str(port), "--streams", str(streams),
+         "--latency", str(latency), "--error-rate", str(error_rate)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}{API_PREFIX}/version", timeout=1)
+                break
+            except httpx.TransportError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError("mock_ams 無法啟動")
+        yield port
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def write_csv(path: Path, count: int):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "code", "stream_ip", "stream_username", "stream_password"])
+        for i in range(count):
+            writer.writerow([i, f"B{i:05d}", f"192.168.{11 + i // 250}.{i % 250 + 1}", "admin", "bench"])
+
+
+def run_cli(*args: str):
+    result = CliRunner().invoke(ams.app, ["--no-metrics", *args], input="y\n")
+    if result.exit_code != 0:
+        raise RuntimeError(f"ams {' '.join(args)} 失敗:\n{result.output}") from result.exception
+
+
+def _cli_case(command: str, *extra: str) -> Callable[[int, int, int, Path], None]:
+    def run(port: int, count: int, concurrency: int, workdir: Path):
+        run_cli(command, "-p", "bench", "-c", str(concurrency), "--refresh", *extra)
+    return run
+
+
+def _query(port: int, count: int, concurrency: int, workdir: Path):
+    run_cli("query", "-p", "bench", "--refresh")
+
+
+def _export(port: int, count: int, concurrency: int, workdir: Path):
+    with mock.patch.object(builtins, "input", return_value=""), contextlib.chdir(workdir), \
+            contextlib.redirect_stdout(io.StringIO()):
+        ams_script.do_export("127.0.0.1", port)
+
+
+# 案例名稱 → (mock 的初始串流數是否為 count, 執行函式)
+CASES: dict[str, tuple[bool, Callable[[int, int, int, Path], None]]] = {
+    "create-streams": (False, _cli_case("create-streams", "--no-preflight")),  # 基準的攝影機位址都不存在
+    "start-all-streams": (True, _cli_case("start-all-streams")),
+    "delete-all-streams": (True, _cli_case("delete-all-streams")),
+    "query": (True, _query),
+    "do_export": (True, _export),
+}
+
+
+def run_case(name: str, count: int, concurrency: int, latency: float, error_rate: float) -> BenchResult:
+    preloaded, run = CASES[name]
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock_server(count if preloaded else 0, latency, error_rate) as port:
+        workdir = Path(tmp)
+        csv_path = workdir / "streams.csv"
+        write_csv(csv_path, count)
+        ams.profiles["bench"] = ams.Profile(
+            api_url=f"http://127.0.0.1:{port}{API_PREFIX}", streams_csv=str(csv_path), origin_ip="127.0.0.1"
+        )
+        recorder = LatencyRecorder()
+        with recorder.install():
+            start = time.perf_counter()
+            run(port, count, concurrency, workdir)
+            seconds = time.perf_counter() - start
+
+    samples = sorted(recorder.samples) or [0.0]
+    return BenchResult(
+        case=name,
+        streams=count,
+        seconds=round(seconds, 3),
+        requests=len(recorder.samples),
+        ops_per_sec=round(count / seconds, 1),
+        p50_ms=round(percentile(samples, 0.5) * 1000, 2),
+        p99_ms=round(percentile(samples, 0.99) * 1000, 2),
+    )
+
+
+def main(
+    sizes: str = typer.Option("100,1000,10000", help="以逗號分隔的串流數量"),
+    cases: str = typer.Option(",".join(CASES), help="以逗號分隔的案例名稱"),
+    concurrency: int = typer.Option(ams.DEFAULT_CONCURRENCY, "--concurrency", "-c", help="每台伺服器同時進行的請求數"),
+    latency: float = typer.Option(0.01, help="mock 每個請求的處理時間 (秒)"),
+    error_rate: float = typer.Option(0.0, help="mock 隨機回應 HTTP 500 的比例"),
+    json_out: Path | None = typer.Option(None, "--json", help="將結果寫成 JSON, 方便比較不同版本"),
+):
+    """以 mock_ams 量測各批量命令的吞吐量與 p50/p99 延遲"""
+    names = [c.strip() for c in cases.split(",") if c.strip()]
+    if unknown := [c for c in names if c not in CASES]:
+        raise typer.BadParameter(f"未知的案例: {', '.join(unknown)}", param_hint="--cases")
+
+    results: list[BenchResult] = []
+    for count in (int(s) for s in sizes.split(",")):
+        for name in names:
+            result = run_case(name, count, concurrency, latency, error_rate)
+            print(f"{name} @ {count}: {result.seconds}s", file=sys.stderr)
+            results.append(result)
+
+    table = Table("case", "streams", "秒", "requests", "streams/s", "p50 ms", "p99 ms")
+    for r in results:
+        table.add_row(r.case, str(r.streams), f"{r.seconds:.2f}", str(r.requests), f"{r.ops_per_sec:.1f}",
+                      f"{r.p50_ms:.1f}", f"{r.p99_ms:.1f}")
+    rprint(table)
+
+    if json_out:
+        meta = {"concurrency": concurrency, "latency": latency, "error_rate": error_rate}
+        json_out.write_text(json.dumps({"params": meta, "results": [asdict(r) for r in results]}, indent=2))
+
+
+if __name__ == "__main__":
+    typer.run(main)
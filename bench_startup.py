@@ -0,0 +1,184 @@
+"""
+啟動時間基準: 以全新的直譯器執行 ams.py 的命令, 量測牆鐘時間與 `-X importtime` 的匯入時間
+
+執行命令 `uv run bench_startup.py`
+
+每個案例執行 --runs 次取中位數; 另外以 `-X importtime` 執行一次, 列出匯入最久的模組
+(扣除 `python -c pass` 本身就會匯入的模組)。任一案例超過預算, 或 --help 載入了 httpx / asyncio
+時結束代碼為 1, 可放在 CI 中防止啟動時間退化。
+"""
+
+import csv
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+# 子程序繼承這個快取目錄, 不讀寫使用者的快取
+os.environ.setdefault("AMS_CACHE_DIR", tempfile.mkdtemp(prefix="ams-bench-cache-"))
+
+import typer
+from rich import print as rprint
+from rich.table import Table
+
+from bench_ams import mock_server
+from mock_ams import API_PREFIX
+
+HERE = Path(__file__).resolve().parent
+
+# 以 bench profile 執行 ams.py, 其餘參數原樣傳給命令
+LAUNCHER = """
+import sys
+sys.path.insert(0, {here!r})
+sys.argv = ["ams.py", *sys.argv[1:]]
+import ams
+ams.profiles["bench"] = ams.Profile(api_url={api_url!r}, streams_csv=sys.argv.pop(1), origin_ip="127.0.0.1")
+ams.app()
+"""
+
+# 案例名稱 → ams.py 的參數
+CASES: dict[str, list[str]] = {
+    "help": ["--help"],
+    "query": ["--no-metrics", "query", "-p", "bench", "--refresh"],
+    "create-streams": ["--no-metrics", "create-streams", "-p", "bench", "--no-preflight"],
+}
+# 牆鐘時間的預算 (毫秒), 以 --budget 調整
+DEFAULT_BUDGETS = {"help": 500, "query": 700, "create-streams": 850}
+# 這些案例不應該載入的套件
+FORBIDDEN = {"help": ("httpx", "asyncio")}
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+@dataclass
+class StartupResult:
+    case: str
+    median_ms: float
+    min_ms: float
+    import_ms: float  # 扣除直譯器本身後的匯入時間總和
+    budget_ms: float
+    top_imports: list[tuple[str, float]] = field(default_factory=list)  # 最上層的模組與其累計匯入時間
+    forbidden: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.median_ms <= self.budget_ms and not self.forbidden
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """(模組, 巢狀深度, 自身 µs, 累計 µs)"""
+    return [
+        (m[4], len(m[3]) // 2, int(m[1]), int(m[2]))
+        for m in map(IMPORT_LINE.match, stderr.splitlines()) if m
+    ]
+
+
+def baseline_modules() -> set[str]:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"], capture_output=True, text=True)
+    return {name for name, *_ in parse_importtime(proc.stderr)}
+
+
+def write_csv(path: Path, prefix: str, count: int):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "code", "stream_ip", "stream_username", "stream_password"])
+        for i in range(count):
+            writer.writerow([i, f"{prefix}{i:04d}", f"192.168.{11 + i // 250}.{i % 250 + 1}", "admin", "bench"])
+
+
+def run_case(name: str, runs: int, streams: int, budget: float, baseline: set[str], workdir: Path) -> StartupResult:
+    # 量測的是一般使用時 (已寫出 .pyc) 的啟動時間; 第一次執行不計時
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    with mock_server(streams, 0.0, 0.0) as port:
+        launcher = LAUNCHER.format(here=str(HERE), api_url=f"http://127.0.0.1:{port}{API_PREFIX}")
+
+        def run(i: int, *flags: str) -> subprocess.CompletedProcess:
+            # create-streams 每次使用新的 code, 每次都真的建立串流
+            csv_path = workdir / f"{name}-{i}.csv"
+            write_csv(csv_path, f"S{i:02d}", streams)
+            proc = subprocess.run(
+                [sys.executable, *flags, "-c", launcher, str(csv_path), *CASES[name]],
+                input="y\n", capture_output=True, text=True, cwd=workdir, env=env,
+            )
+            if proc.returncode != 0:
+                raise RuntimeError(f"{name} 失敗 (exit {proc.returncode}):\n{proc.stdout}{proc.stderr}")
+            return proc
+
+        run(runs + 1)
+        samples = []
+        for i in range(runs):
+            start = time.perf_counter()
+            run(i)
+            samples.append((time.perf_counter() - start) * 1000)
+        imports = [m for m in parse_importtime(run(runs, "-X", "importtime").stderr) if m[0] not in baseline]
+
+    # LazyLoader 延後執行的模組本身沒有 importtime 記錄, 以其子模組判斷是否載入
+    loaded = {m[0] for m in imports}
+    forbidden = [p for p in FORBIDDEN.get(name, ()) if any(n == p or n.startswith(p + ".") for n in loaded)]
+    top = sorted((m for m in imports if m[1] == 0), key=lambda m: -m[3])[:3]
+    return StartupResult(
+        case=name,
+        median_ms=round(statistics.median(samples), 1),
+        min_ms=round(min(samples), 1),
+        import_ms=round(sum(m[2] for m in imports) / 1000, 1),
+        budget_ms=budget,
+        top_imports=[(m[0], round(m[3] / 1000, 1)) for m in top],
+        forbidden=forbidden,
+    )
+
+
+def parse_budgets(spec: str) -> dict[str, float]:
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, sep, value = item.partition("=")
+        if not sep or name not in CASES:
+            raise typer.BadParameter(f"格式為 case=毫秒, case 為 {', '.join(CASES)}: {item}", param_hint="--budget")
+        budgets[name] = float(value)
+    return budgets
+
+
+def main(
+    cases: str = typer.Option(",".join(CASES), help="以逗號分隔的案例名稱"),
+    runs: int = typer.Option(5, help="每個案例執行的次數 (取中位數)"),
+    streams: int = typer.Option(20, help="mock 的初始串流數 / create-streams 建立的串流數"),
+    budget: str = typer.Option("", help="覆寫預算, 例如 help=300,query=500 (毫秒)"),
+    json_out: Path | None = typer.Option(None, "--json", help="將結果寫成 JSON, 方便比較不同版本"),
+):
+    """量測 ams.py 各命令的冷啟動時間, 超過預算時結束代碼為 1"""
+    names = [c.strip() for c in cases.split(",") if c.strip()]
+    if unknown := [c for c in names if c not in CASES]:
+        raise typer.BadParameter(f"未知的案例: {', '.join(unknown)}", param_hint="--cases")
+    budgets = parse_budgets(budget)
+
+    baseline = baseline_modules()
+    results: list[StartupResult] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            result = run_case(name, runs, streams, budgets[name], baseline, Path(tmp))
+            print(f"{name}: {result.median_ms}ms", file=sys.stderr)
+            results.append(result)
+
+    table = Table("case", "中位數 ms", "最快 ms", "匯入 ms", "預算 ms", "匯入最久的模組", "")
+    for r in results:
+        top = ", ".join(f"{n} {ms:.0f}" for n, ms in r.top_imports)
+        problems = (["超過預算"] if r.median_ms > r.budget_ms else []) + [f"載入了 {n}" for n in r.forbidden]
+        status = f"[red]{', '.join(problems)}" if problems else "[green]OK"
+        table.add_row(r.case, f"{r.median_ms:.0f}", f"{r.min_ms:.0f}", f"{r.import_ms:.0f}", f"{r.budget_ms:.0f}",
+                      top, status)
+    rprint(table)
+
+    if json_out:
+        meta = {"python": sys.version.split()[0], "runs": runs, "streams": streams}
+        json_out.write_text(json.dumps({"params": meta, "results": [asdict(r) for r in results]}, indent=2))
+    if not all(r.ok for r in results):
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,255 @@
+"""
+本機模擬的 Ant Media Server REST API, 用於效能量測與回歸測試
+
+執行命令 `uv run mock_ams.py --streams 1000 --latency 0.02`, 之後把 profile 的 api_url 指向
+`http://127.0.0.1:5080/WebRTCAppEE/rest/v2` 即可。
+
+只實作本工具用到的 /WebRTCAppEE/rest/v2 端點, 回應格式與 AMS 相同; 可設定每個請求的延遲、
+伺服器同時處理的請求數、隨機錯誤率與 IP Camera 錯誤比例。
+"""
+
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import typer
+
+API_PREFIX = "/WebRTCAppEE/rest/v2"
+
+
+def make_broadcast(i: int, status: str = "broadcasting") -> dict:
+    name = f"M{i:05d}"
+    return {
+        "streamId": f"{name}{i:032x}",
+        "name": name,
+        "type": "ipCamera",
+        "status": status,
+        "ipAddr": f"192.168.{11 + i // 250}.{i % 250 + 1}",
+        "username": "admin",
+        "password": "mock",
+        "streamUrl": None,
+        "description": "",
+    }
+
+
+@dataclass
+class MockAMS:
+    """模擬伺服器的狀態與路由 (不含網路層)"""
+    broadcasts: dict[str, dict] = field(default_factory=dict)
+    latency: float = 0.0  # 每個請求的處理時間 (秒)
+    jitter: float = 0.0  # 延遲的隨機增量上限 (秒)
+    error_rate: float = 0.0  # 隨機回應 500 的比例
+    camera_error_rate: float = 0.0  # start 後進入 error 狀態的 IP Camera 比例
+    capacity: int = 0  # 同時處理的請求數上限, 0 為不限制
+    version_name: str = "2.9.0"  # 低於 2.4 時沒有 DELETE /broadcasts/bulk
+    ignore_sort: bool = False  # 與舊版 AMS 相同, 列表時忽略 sort_by / order_by
+    requests: int = 0
+
+    @classmethod
+    def with_streams(cls, count: int, **kwargs) -> "MockAMS":
+        mock = cls(**kwargs)
+        for i in range(count):
+            b = make_broadcast(i)
+            mock.broadcasts[b["streamId"]] = b
+        return mock
+
+    def __post_init__(self):
+        self._slots = asyncio.Semaphore(self.capacity) if self.capacity else None
+        self._camera_errors: set[str] = set()
+
+    async def handle(self, method: str, target: str, body: bytes) -> tuple[int, object]:
+        self.requests += 1
+        if self._slots:
+            async with self._slots:
+                return await self._handle(method, target, body)
+        return await self._handle(method, target, body)
+
+    async def _handle(self, method: str, target: str, body: bytes) -> tuple[int, object]:
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            return 500, {"success": False, "message": "injected error"}
+
+        url = urlsplit(target)
+        if not url.path.startswith(API_PREFIX):
+            return 404, {"success": False, "message": "not found"}
+        path = unquote(url.path[len(API_PREFIX):])
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        data = json.loads(body) if body else None
+        for pattern, route_method, handler in self.routes:
+            if route_method == method and (m := re.fullmatch(pattern, path)):
+                return handler(self, *m.groups(), query=query, data=data)
+        return 404, {"success": False, "message": f"no route for {method} {path}"}
+
+    # --- 路由 ---
+
+    def version(self, query, data):
+        return 200, {"versionName": self.version_name, "versionType": "Enterprise Edition", "buildNumber": "mock"}
+
+    def count(self, query, data):
+        return 200, {"number": len(self.broadcasts)}
+
+    def active_count(self, query, data):
+        return 200, {"number": sum(b["status"] == "broadcasting" for b in self.broadcasts.values())}
+
+    def list_broadcasts(self, offset, size, query, data):
+        items = list(self.broadcasts.values())
+        if type_by := query.get("type_by"):
+            items = [b for b in items if b["type"] == type_by]
+        if search := query.get("search"):
+            items = [b for b in items if search.lower() in f"{b['name']} {b['streamId']}".lower()]
+        if (sort_by := query.get("sort_by")) and not self.ignore_sort:
+            items.sort(key=lambda b: str(b.get(sort_by, "")), reverse=query.get("order_by") == "desc")
+        return 200, items[int(offset):int(offset) + min(int(size), 1000)]
+
+    def get(self, stream_id, query, data):
+        if b := self.broadcasts.get(stream_id):
+            return 200, b
+        return 404, {"success": False, "message": "not found"}
+
+    def create(self, query, data):
+        stream_id = data.get("streamId") or f"mock{len(self.broadcasts):028x}"
+        if stream_id in self.broadcasts:
+            return 400, {"success": False, "message": f"{stream_id} already exists"}
+        b = {**make_broadcast(0), "streamUrl": None, **data, "streamId": stream_id, "status": "created"}
+        self.broadcasts[stream_id] = b
+        if query.get("autoStart") == "true":
+            self._start(b)
+        return 200, b
+
+    def update(self, stream_id, query, data):
+        if b := self.broadcasts.get(stream_id):
+            b.update({k: v for k, v in data.items() if k != "streamId"})
+            return 200, {"success": True}
+        return 404, {"success": False, "message": "not found"}
+
+    def delete(self, stream_id, query, data):
+        if self.broadcasts.pop(stream_id, None):
+            self._camera_errors.discard(stream_id)
+            return 200, {"success": True}
+        return 404, {"success": False, "message": "not found"}
+
+    def bulk_delete(self, query, data):
+        """刪除存在的串流; 所有 ID 都存在才回應成功"""
+        if tuple(int(part) for part in self.version_name.split(".")[:2]) < (2, 4):
+            return 404, {"success": False, "message": "no route for DELETE /broadcasts/bulk"}
+        missing = [stream_id for stream_id in data or [] if self.delete(stream_id, query, None)[0] != 200]
+        if missing:
+            return 200, {"success": False, "message": f"{len(missing)} broadcasts not found"}
+        return 200, {"success": True}
+
+    def start(self, stream_id, query, data):
+        if b := self.broadcasts.get(stream_id):
+            self._start(b)
+            return 200, {"success": True}
+        return 404, {"success": False, "message": "not found"}
+
+    def stop(self, stream_id, query, data):
+        if b := self.broadcasts.get(stream_id):
+            b["status"] = "finished"
+            return 200, {"success": True}
+        return 404, {"success": False, "message": "not found"}
+
+    def statistics(self, stream_id, query, data):
+        if b := self.broadcasts.get(stream_id):
+            live = b["status"] == "broadcasting"
+            return 200, {
+                "totalHLSWatchersCount": random.randint(0, 5) if live else 0,
+                "totalWebRTCWatchersCount": random.randint(0, 10) if live else 0,
+                "totalRTMPWatchersCount": 0,
+                "totalDASHWatchersCount": 0,
+            }
+        return 404, {"success": False, "message": "not found"}
+
+    def camera_error(self, stream_id, query, data):
+        # 與 AMS 相同: success 為 true 表示「取得了錯誤訊息」, 亦即串流有錯誤
+        if stream_id in self._camera_errors:
+            return 200, {"success": True, "message": "Connection refused"}
+        return 200, {"success": False, "message": None}
+
+    def _start(self, b: dict):
+        if b["type"] in ("ipCamera", "streamSource") and random.random() < self.camera_error_rate:
+            b["status"] = "error"
+            self._camera_errors.add(b["streamId"])
+        else:
+            b["status"] = "broadcasting"
+            self._camera_errors.discard(b["streamId"])
+
+    routes = [
+        (r"/version", "GET", version),
+        (r"/broadcasts/count", "GET", count),
+        (r"/broadcasts/active-live-stream-count", "GET", active_count),
+        (r"/broadcasts/list/(\d+)/(\d+)", "GET", list_broadcasts),
+        (r"/broadcasts/create", "POST", create),
+        (r"/broadcasts/([^/]+)/broadcast-statistics", "GET", statistics),
+        (r"/broadcasts/([^/]+)/ip-camera-error", "GET", camera_error),
+        (r"/broadcasts/([^/]+)/start", "POST", start),
+        (r"/broadcasts/([^/]+)/stop", "POST", stop),
+        (r"/broadcasts/bulk", "DELETE", bulk_delete),
+        (r"/broadcasts/([^/]+)", "GET", get),
+        (r"/broadcasts/([^/]+)", "PUT", update),
+        (r"/broadcasts/([^/]+)", "DELETE", delete),
+    ]
+
+    # --- HTTP/1.1 (keep-alive) ---
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while request_line := await reader.readline():
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, obj = await self.handle(method, target, body)
+                payload = json.dumps(obj).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 5080) -> asyncio.Server:
+        return await asyncio.start_server(self._serve_connection, host, port, backlog=1024)
+
+
+def main(
+    host: str = typer.Option("127.0.0.1", help="監聽位址"),
+    port: int = typer.Option(5080, help="監聽埠"),
+    streams: int = typer.Option(100, help="初始串流數量"),
+    latency: float = typer.Option(0.0, help="每個請求的處理時間 (秒)"),
+    jitter: float = typer.Option(0.0, help="延遲的隨機增量上限 (秒)"),
+    error_rate: float = typer.Option(0.0, help="隨機回應 HTTP 500 的比例"),
+    camera_error_rate: float = typer.Option(0.0, help="啟動後進入 error 狀態的 IP Camera 比例"),
+    capacity: int = typer.Option(0, help="同時處理的請求數上限, 0 為不限制"),
+    version_name: str = typer.Option("2.9.0", "--version", help="/version 回報的版本, 低於 2.4 時不支援批次刪除"),
+    ignore_sort: bool = typer.Option(False, "--ignore-sort", help="列表時忽略 sort_by (模擬舊版 AMS)"),
+):
+    """啟動模擬的 AMS REST API"""
+
+    async def run():
+        mock = MockAMS.with_streams(
+            streams, latency=latency, jitter=jitter, error_rate=error_rate,
+            camera_error_rate=camera_error_rate, capacity=capacity, version_name=version_name,
+            ignore_sort=ignore_sort,
+        )
+        server = await mock.serve(host, port)
+        print(f"mock AMS: http://{host}:{port}{API_PREFIX} ({streams} streams)", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,82 @@
+"""
+以 prefix 選擇串流時的提早停止翻頁: 只有確認伺服器依名稱排序後才能提早停止
+
+執行: python -m unittest test_selection
+"""
+
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+import ams_ops
+import ams_script
+from ams_client import AsyncAMSClient
+from mock_ams import API_PREFIX, MockAMS, make_broadcast
+
+NAMES = ["ZA001", "A001", "A002", "A003", "B001"]
+ASCENDING_FIRST_PAGE = ["A001", "ZA001", "A002", "A003", "B001"]  # 未排序, 但第一頁碰巧是遞增的
+EXPECTED = ["A001", "A002", "A003"]
+
+
+def broadcasts(names: list[str]) -> dict[str, dict]:
+    return {f"s{i}": {**make_broadcast(i), "name": name, "streamId": f"s{i}"} for i, name in enumerate(names)}
+
+
+class MockServer:
+    """在背景執行緒的事件迴圈中執行 MockAMS"""
+
+    def __init__(self, mock_ams: MockAMS):
+        self.mock = mock_ams
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(self.mock.serve("127.0.0.1", 0), self.loop).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}{API_PREFIX}"
+
+    def close(self):
+        async def shutdown():
+            self.server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class SelectionTest(unittest.TestCase):
+    def serve(self, names: list[str], ignore_sort: bool) -> MockServer:
+        server = MockServer(MockAMS(broadcasts=broadcasts(names), ignore_sort=ignore_sort))
+        self.addCleanup(server.close)
+        return server
+
+    def select(self, server: MockServer, prefix: str) -> list[str]:
+        async def run() -> list[str]:
+            async with AsyncAMSClient(server.url) as client:
+                return [s["name"] async for s in ams_ops.iter_selected(client, ams_ops.Selector(prefix=prefix), page_size=2)]
+
+        return asyncio.run(run())
+
+    def zone(self, server: MockServer, prefix: str) -> list[str]:
+        with mock.patch.object(ams_script, "ZONE_PAGE", 2):
+            return [s["name"] for s in ams_script.iter_zone("127.0.0.1", server.port, prefix)]
+
+    def test_unsorted_server_lists_everything(self):
+        for names in (NAMES, ASCENDING_FIRST_PAGE):
+            server = self.serve(names, ignore_sort=True)
+            self.assertEqual(sorted(self.select(server, "A")), EXPECTED, names)
+            self.assertEqual(sorted(self.zone(server, "A")), EXPECTED, names)
+
+    def test_sorted_server(self):
+        server = self.serve(NAMES, ignore_sort=False)
+        self.assertEqual(self.select(server, "A"), EXPECTED)
+        self.assertEqual(self.zone(server, "A"), EXPECTED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,273 @@
+"""
+ams_transport 的重試、AIMD 併發上限與斷路器
+
+執行: python -m unittest test_transport
+"""
+
+import asyncio
+import socket
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+
+import ams_transport
+from ams_metrics import Metrics
+from ams_transport import AdaptiveLimiter, AMSAsyncTransport, AMSTransport, CircuitBreaker, CircuitOpenError, RetryPolicy
+from mock_ams import MockAMS
+from test_selection import MockServer
+
+NO_WAIT = RetryPolicy(attempts=3, base_delay=0.0)
+
+
+class FlakyAMS(MockAMS):
+    """前 failures 個請求回應 status, 之後正常處理"""
+
+    def __init__(self, failures: int, status: int = 503, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.status = status
+
+    async def _handle(self, method: str, target: str, body: bytes) -> tuple[int, object]:
+        if self.failures > 0:
+            self.failures -= 1
+            return self.status, {"success": False, "message": "injected"}
+        return await super()._handle(method, target, body)
+
+
+class Clock:
+    """取代 ams_transport 中的 time.monotonic, 由測試推進時間 (不影響 asyncio 的計時)"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def statuses(metrics: Metrics) -> dict[str, int]:
+    total: dict[str, int] = {}
+    for stats in metrics.stats.values():
+        for status, n in stats.statuses.items():
+            total[status] = total.get(status, 0) + n
+    return total
+
+
+class RetryTest(unittest.TestCase):
+    def serve(self, mock_ams: MockAMS) -> MockServer:
+        server = MockServer(mock_ams)
+        self.addCleanup(server.close)
+        return server
+
+    def request(self, url: str, method: str = "GET", path: str = "/version", **transport_kwargs):
+        """以 AMSAsyncTransport 送出一個請求, 回傳 (回應或例外, transport)"""
+        transport = AMSAsyncTransport(4, retry=NO_WAIT, **transport_kwargs)
+
+        async def run():
+            async with httpx.AsyncClient(base_url=url, transport=transport) as client:
+                try:
+                    return await client.request(method, path, json={} if method == "POST" else None)
+                except httpx.TransportError as e:
+                    return e
+
+        return asyncio.run(run()), transport
+
+    def test_retries_5xx_until_success(self):
+        mock_ams = FlakyAMS(failures=2)
+        metrics = Metrics()
+        response, _ = self.request(self.serve(mock_ams).url, metrics=metrics)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_ams.requests, 3)
+        self.assertEqual(statuses(metrics), {"503": 2, "200": 1})
+        self.assertEqual(sum(s.retries for s in metrics.stats.values()), 2)
+
+    def test_returns_last_5xx_after_attempts(self):
+        mock_ams = FlakyAMS(failures=10, status=500)
+        response, _ = self.request(self.serve(mock_ams).url, metrics=Metrics())
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(mock_ams.requests, NO_WAIT.attempts)
+
+    def test_does_not_retry_non_idempotent(self):
+        mock_ams = FlakyAMS(failures=1)
+        response, _ = self.request(self.serve(mock_ams).url, "POST", "/broadcasts/create", metrics=Metrics())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_ams.requests, 1)
+
+    def test_does_not_retry_4xx(self):
+        mock_ams = FlakyAMS(failures=1, status=404)
+        response, _ = self.request(self.serve(mock_ams).url, metrics=Metrics())
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(mock_ams.requests, 1)
+
+    def test_retries_connect_errors(self):
+        metrics = Metrics()
+        error, _ = self.request(f"http://127.0.0.1:{closed_port()}", metrics=metrics)
+        self.assertIsInstance(error, httpx.ConnectError)
+        self.assertEqual(statuses(metrics), {"ConnectError": NO_WAIT.attempts})
+
+    def test_sync_transport_retries_5xx(self):
+        mock_ams = FlakyAMS(failures=2)
+        server = self.serve(mock_ams)
+        with httpx.Client(base_url=server.url, transport=AMSTransport(retry=NO_WAIT, metrics=Metrics())) as client:
+            self.assertEqual(client.get("/version").status_code, 200)
+        self.assertEqual(mock_ams.requests, 3)
+
+    def test_breaker_opens_and_recovers(self):
+        # 連續 2 次失敗即開啟, 冷卻後的試探成功則關閉; 開啟時併發上限降為 1
+        mock_ams = FlakyAMS(failures=2)
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        response, transport = self.request(self.serve(mock_ams).url, breaker=breaker, metrics=Metrics())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(breaker.trips, 1)
+        self.assertFalse(breaker.half_open)
+        self.assertEqual(breaker.consecutive_trips, 0)
+        self.assertLessEqual(transport.limiter.limit, 2.0)
+
+    def test_breaker_gives_up_on_dead_server(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.01, max_trips=1)
+        metrics = Metrics()
+        error, _ = self.request(f"http://127.0.0.1:{closed_port()}", breaker=breaker, metrics=metrics)
+        self.assertIsInstance(error, CircuitOpenError)
+        self.assertTrue(breaker.gave_up)
+        self.assertEqual(statuses(metrics)["CircuitOpenError"], 1)
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(ams_transport, "time", SimpleNamespace(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_slow_start_then_additive_increase(self):
+        limiter = AdaptiveLimiter(16)
+        self.assertEqual(limiter.limit, 4.0)
+        for _ in range(3):
+            limiter.record(True, 0.01)
+        self.assertEqual(limiter.limit, 7.0)  # slow start: 每次成功加 1
+
+        limiter.record(False)
+        self.assertEqual((limiter.limit, limiter.ssthresh), (3.5, 3.5))
+        limiter.record(True, 0.01)
+        self.assertAlmostEqual(limiter.limit, 3.5 + 1 / 3.5)  # 超過 ssthresh 後每次加 1/limit
+
+    def test_increase_is_capped(self):
+        limiter = AdaptiveLimiter(5)
+        for _ in range(10):
+            limiter.record(True, 0.01)
+        self.assertEqual(limiter.limit, 5.0)
+
+    def test_one_decrease_per_round_trip(self):
+        limiter = AdaptiveLimiter(16)
+        limiter.record(True, 0.5)
+        limiter.record(False)
+        limiter.record(False)  # 同一個往返 (0.5 秒) 內的第二次擁塞不再減半
+        self.assertEqual(limiter.limit, 2.5)
+        self.clock.now += 1.0
+        limiter.record(False)
+        self.assertEqual(limiter.limit, 1.25)
+        self.clock.now += 1.0
+        limiter.record(False)
+        self.assertEqual(limiter.limit, 1.0)  # 最少 1
+
+    def test_latency_above_baseline_is_congestion(self):
+        limiter = AdaptiveLimiter(16)
+        limiter.record(True, 0.01)
+        self.assertEqual(limiter.limit, 5.0)
+        limiter.record(True, 1.0)  # 平滑延遲超過最低延遲的 latency_factor 倍
+        self.assertEqual(limiter.limit, 2.5)
+
+    def test_reset_allows_single_probe(self):
+        limiter = AdaptiveLimiter(16)
+        limiter.limit = 8.0
+        limiter.reset()
+        self.assertEqual((limiter.limit, limiter.ssthresh), (1.0, 4.0))
+
+    def test_limits_in_flight_requests(self):
+        limiter = AdaptiveLimiter(16)
+        limiter.limit = 2.0
+        peak = 0
+
+        async def worker():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*(worker() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(peak, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(ams_transport, "time", SimpleNamespace(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=3, cooldown=5.0, max_cooldown=12.0, max_trips=2)
+
+    def test_opens_after_threshold(self):
+        b = self.breaker
+        self.assertFalse(b.record(False))
+        self.assertFalse(b.record(False))
+        self.assertEqual(b.remaining(), 0.0)
+        self.assertTrue(b.record(False))
+        self.assertEqual((b.remaining(), b.half_open, b.trips), (5.0, True, 1))
+        self.assertFalse(b.record(False))  # 開啟中的其他失敗不再延長
+
+    def test_success_resets_failure_count(self):
+        b = self.breaker
+        b.record(False)
+        b.record(False)
+        b.record(True)
+        self.assertFalse(b.record(False))
+        self.assertEqual(b.trips, 0)
+
+    def test_half_open_failure_doubles_cooldown(self):
+        b = self.breaker
+        for _ in range(3):
+            b.record(False)
+        self.clock.now += 5.0
+        self.assertEqual(b.remaining(), 0.0)
+        self.assertTrue(b.record(False))  # 試探失敗立即重新開啟
+        self.assertEqual((b.remaining(), b.trips), (10.0, 2))
+        self.clock.now += 10.0
+        self.assertTrue(b.record(False))
+        self.assertEqual(b.remaining(), 12.0)  # 不超過 max_cooldown
+
+    def test_half_open_success_closes(self):
+        b = self.breaker
+        for _ in range(3):
+            b.record(False)
+        self.clock.now += 5.0
+        b.record(True)
+        self.assertEqual((b.half_open, b.failures, b.consecutive_trips, b.cooldown), (False, 0, 0, 5.0))
+        self.assertFalse(b.record(False))  # 關閉後重新累計 threshold 次
+        b.check()
+
+    def test_gives_up_after_max_trips(self):
+        b = self.breaker
+        for _ in range(3):
+            b.record(False)
+        for _ in range(b.max_trips):
+            b.check()
+            self.clock.now += b.remaining()
+            b.record(False)
+        self.assertTrue(b.gave_up)
+        with self.assertRaises(CircuitOpenError):
+            b.check()
+
+
+if __name__ == "__main__":
+    unittest.main()